@@ -14,10 +14,23 @@ except Exception:
 def create_app(config_object=None):
     """Application factory for the Flask app."""
     app = Flask(__name__, static_folder=None)
+    # Mongo documents carry ObjectIds; serialize them as their hex strings
+    from app.utils.ids import JSONProvider
+    app.json = JSONProvider(app)
 
     if config_object:
         app.config.from_object(config_object)
 
+    # storage backend for the services, chosen once per app
+    from app import repositories
+    repositories.init_app(app)
+
+    # request metrics first, so they time everything registered after them
+    from app.middleware import memory, metrics, tracing
+    metrics.init_app(app)
+    tracing.init_app(app)
+    memory.init_app(app)
+
     # register blueprints
     from app.routes import bp as main_bp
     app.register_blueprint(main_bp)
@@ -27,12 +40,23 @@ def create_app(config_object=None):
     from app.blueprints.series import bp as series_bp
     from app.blueprints.lessons import bp as lessons_bp
     from app.blueprints.auth import bp as auth_bp
+    from app.blueprints.batch import bp as batch_bp
+    from app.blueprints.admin import bp as admin_bp
     
     # Then register them
     app.register_blueprint(users_bp)
     app.register_blueprint(series_bp)
     app.register_blueprint(lessons_bp)
     app.register_blueprint(auth_bp)
+    app.register_blueprint(batch_bp)
+    app.register_blueprint(admin_bp)
+
+    from app.middleware import compression
+    compression.init_app(app)
+
+    # outermost, so a profile covers every hook above
+    from app.middleware import profiling
+    profiling.init_app(app)
 
     # Initialize Flasgger (auto-generated docs from docstrings) if available
     try:
@@ -0,0 +1,112 @@
+"""Operator endpoints, restricted to the ADMIN_GROUP Cognito group."""
+import os
+
+from flask import Blueprint, current_app, jsonify, request, send_from_directory
+from werkzeug.security import safe_join
+
+from app.middleware.auth import require_admin
+from app.utils import memory
+from app.utils.slow_queries import SLOW_QUERIES
+
+bp = Blueprint("admin", __name__, url_prefix="/api/admin")
+
+
+@bp.route("/slow-queries", methods=["GET"])
+@require_admin
+def slow_queries():
+    """Slow MongoDB command shapes seen by this worker
+
+    ---
+    tags:
+      - Admin
+    responses:
+      200:
+        description: Shapes over MONGO_SLOW_MS, the most total time first
+      403:
+        description: Not an admin
+    security:
+      - BearerAuth: []
+    """
+    return jsonify({"threshold_ms": SLOW_QUERIES.threshold_ms, "shapes": SLOW_QUERIES.snapshot()}), 200
+
+
+@bp.route("/slow-queries", methods=["DELETE"])
+@require_admin
+def reset_slow_queries():
+    """Clear the slow query statistics
+
+    ---
+    tags:
+      - Admin
+    responses:
+      204:
+        description: Cleared
+    security:
+      - BearerAuth: []
+    """
+    SLOW_QUERIES.reset()
+    return "", 204
+
+
+@bp.route("/profiles/<profile_id>", methods=["GET"])
+@require_admin
+def get_profile(profile_id):
+    """Download a request profile written by this node
+
+    The id is the X-Profile-Id response header of a profiled request (see
+    app.middleware.profiling).
+
+    ---
+    tags:
+      - Admin
+    responses:
+      200:
+        description: Collapsed stacks (flamegraph) or cProfile stats
+      404:
+        description: Unknown id, or profiling is off
+    security:
+      - BearerAuth: []
+    """
+    directory = current_app.config.get("PROFILE_DIR")
+    for suffix in (".collapsed", ".pstats"):
+        name = f"{profile_id}{suffix}"
+        path = safe_join(directory, name) if directory else None
+        if path and os.path.isfile(path):
+            return send_from_directory(directory, name, as_attachment=True)
+    return jsonify({"message": "Profile not found"}), 404
+
+
+@bp.route("/memory", methods=["GET"])
+@require_admin
+def memory_usage():
+    """Memory of the worker that serves this request
+
+    RSS now and at peak, per-route readings (app.middleware.memory) and,
+    when TRACEMALLOC_FRAMES is set, the largest live allocation sites.
+
+    ---
+    tags:
+      - Admin
+    parameters:
+      - in: query
+        name: limit
+        schema:
+          type: integer
+        required: false
+        description: Allocation sites listed (default 20)
+    responses:
+      200:
+        description: OK
+    security:
+      - BearerAuth: []
+    """
+    limit = request.args.get("limit", default=20, type=int)
+    routes = current_app.extensions.get("route_memory")
+    return jsonify({
+        "pid": os.getpid(),
+        "rss": memory.rss_bytes(),
+        "peak_rss": memory.peak_rss_bytes(),
+        "recycle_rss": int(os.environ.get("WORKER_MAX_RSS_MB", "0")) * 2 ** 20 or None,
+        "routes": routes.snapshot() if routes is not None else None,
+        "top_allocations": memory.top_allocations(max(1, min(limit, 200))),
+    }), 200
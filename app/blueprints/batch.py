@@ -0,0 +1,122 @@
+"""Run several GET requests against this app in one HTTP round trip.
+
+The batch request is authenticated once; its claims are handed to every
+sub-request through the WSGI environ (see `VERIFIED_CLAIMS_KEY`), so the
+token is not verified again per item. Sub-requests are dispatched in-process
+on a shared thread pool and go through the normal routing, hooks and error
+handling.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import Blueprint, request, jsonify, g, current_app
+from werkzeug.test import EnvironBuilder
+
+from app.middleware.auth import authenticate_jwt, VERIFIED_CLAIMS_KEY
+
+MAX_BATCH_REQUESTS = int(os.environ.get("MAX_BATCH_REQUESTS", "20"))
+_EXECUTOR = ThreadPoolExecutor(max_workers=int(os.environ.get("BATCH_WORKERS", "8")), thread_name_prefix="batch")
+# request headers a sub-request may set for itself
+FORWARDED_HEADERS = ("If-None-Match", "Accept", "Accept-Language")
+
+bp = Blueprint("batch", __name__, url_prefix="/api/batch")
+
+
+def _validate(item):
+    """Return an error message for an unusable sub-request, else None."""
+    if not isinstance(item, dict):
+        return "Request must be a JSON object"
+    path = item.get("path")
+    if not isinstance(path, str) or not path.startswith("/api/"):
+        return "path must start with /api/"
+    if path.split("?", 1)[0].rstrip("/") == bp.url_prefix:
+        return "Batches cannot be nested"
+    if str(item.get("method", "GET")).upper() != "GET":
+        return "Only GET requests can be batched"
+    if not isinstance(item.get("headers", {}), dict):
+        return "headers must be an object"
+    return None
+
+
+def _dispatch(app, environ):
+    with app.request_context(environ):
+        try:
+            resp = app.full_dispatch_request()
+        except Exception:
+            app.logger.exception("batch sub-request failed: %s", environ.get("PATH_INFO"))
+            return {"status": 500, "body": {"message": "Internal server error"}}
+        out = {"status": resp.status_code}
+        if resp.headers.get("ETag"):
+            out["headers"] = {"ETag": resp.headers["ETag"]}
+        if resp.status_code != 304:
+            out["body"] = resp.get_json(silent=True) if resp.is_json else resp.get_data(as_text=True)
+        resp.close()
+        return out
+
+
+@bp.route("/", methods=["POST"])
+@authenticate_jwt
+def post_batch():
+    """Run several GET requests in one round trip
+
+    ---
+    tags:
+      - Batch
+    requestBody:
+      content:
+        application/json:
+          schema:
+            type: object
+            properties:
+              requests:
+                type: array
+                items:
+                  type: object
+                  properties:
+                    id:
+                      type: string
+                      description: Echoed back on the matching result
+                    path:
+                      type: string
+                      example: /api/series/subscribed?limit=10
+                    headers:
+                      type: object
+                      description: Only If-None-Match, Accept and Accept-Language are used
+    responses:
+      200:
+        description: One result (status, body, ETag) per request, in request order
+      400:
+        description: Missing or malformed request list
+      413:
+        description: More than MAX_BATCH_REQUESTS requests
+    security:
+      - BearerAuth: []
+    """
+    body = request.get_json(silent=True)
+    items = body.get("requests") if isinstance(body, dict) else body
+    if not isinstance(items, list) or not items:
+        return jsonify({"message": "requests must be a non-empty list"}), 400
+    if len(items) > MAX_BATCH_REQUESTS:
+        return jsonify({"message": f"At most {MAX_BATCH_REQUESTS} requests per batch"}), 413
+
+    app = current_app._get_current_object()
+    auth = request.headers.get("Authorization")
+    results = [None] * len(items)
+    pending = []
+    for index, item in enumerate(items):
+        error = _validate(item)
+        if error:
+            results[index] = {"status": 400, "body": {"message": error}}
+            continue
+        headers = {k: v for k, v in item.get("headers", {}).items() if k in FORWARDED_HEADERS}
+        if auth:
+            headers["Authorization"] = auth
+        environ = EnvironBuilder(path=item["path"], base_url=request.host_url, headers=headers).get_environ()
+        environ[VERIFIED_CLAIMS_KEY] = g.user
+        pending.append((index, _EXECUTOR.submit(_dispatch, app, environ)))
+    for index, future in pending:
+        results[index] = future.result()
+    for index, item in enumerate(items):
+        if isinstance(item, dict) and "id" in item:
+            results[index] = {"id": item["id"], **results[index]}
+    return jsonify({"responses": results}), 200
@@ -1,8 +1,15 @@
+import json
+from itertools import islice
+
 from flask import Blueprint, request, jsonify, g
 from app.middleware.auth import authenticate_jwt
+from app.utils.etag import conditional, make_etag
 from app.services.lesson_service import (
     create_lesson,
+    create_lessons_bulk,
+    MAX_BULK_LESSONS,
     get_all_lessons_by_serie,
+    get_lessons_version,
     get_lesson_by_id,
     update_lesson,
     delete_lesson,
@@ -50,16 +57,92 @@ def post_lesson(series_id):
                   $ref: '#/definitions/Lesson'
                 message:
                   type: string
+      404:
+        description: Serie not found
     security:
       - BearerAuth: []
     """
     data = dict(request.form) if request.form else (request.get_json() or {})
     data = {**data, "lesson_serie": series_id}
     files = request.files
-    lesson = create_lesson(data, g.user.get("userId"), g.user.get("idToken"), files)
+    try:
+        lesson = create_lesson(data, g.user.get("userId"), g.user.get("idToken"), files)
+    except ValueError:
+        return jsonify({"message": "Serie not found"}), 404
     return jsonify(lesson), 201
 
 
+NDJSON_MIMETYPES = ("application/x-ndjson", "application/jsonl")
+
+
+def _bulk_items():
+    """Lesson payloads from a JSON array (or `{"lessons": [...]}`) body, or an
+    NDJSON body read line by line. At most MAX_BULK_LESSONS + 1 items are
+    read; NDJSON lines that are not valid JSON come back as None."""
+    if request.mimetype in NDJSON_MIMETYPES:
+        items = []
+        for line in islice((l for l in request.stream if l.strip()), MAX_BULK_LESSONS + 1):
+            try:
+                items.append(json.loads(line))
+            except ValueError:
+                items.append(None)
+        return items
+    body = request.get_json(silent=True)
+    if isinstance(body, dict):
+        body = body.get("lessons")
+    return body if isinstance(body, list) else None
+
+
+@bp.route("/bulk", methods=["POST"])
+@authenticate_jwt
+def post_lessons_bulk(series_id):
+    """Create many lessons in a series at once
+
+    Items are validated up front and reported individually; subscribers get
+    one digest notification for the whole import.
+
+    ---
+    tags:
+      - Lessons
+    requestBody:
+      content:
+        application/json:
+          schema:
+            type: array
+            items:
+              $ref: '#/definitions/Lesson'
+        application/x-ndjson:
+          schema:
+            type: string
+            description: One lesson JSON object per line
+    responses:
+      201:
+        description: Every lesson was created
+      207:
+        description: Some lessons were rejected; see `results`
+      400:
+        description: No lessons in the request body
+      404:
+        description: Serie not found
+      413:
+        description: More than MAX_BULK_LESSONS lessons
+    security:
+      - BearerAuth: []
+    """
+    items = _bulk_items()
+    if not items:
+        return jsonify({"message": "Không có bài học nào trong yêu cầu."}), 400
+    if len(items) > MAX_BULK_LESSONS:
+        return jsonify({"message": f"Tối đa {MAX_BULK_LESSONS} bài học mỗi lần."}), 413
+    try:
+        results = create_lessons_bulk(series_id, items, g.user.get("userId"))
+    except ValueError:
+        return jsonify({"message": "Serie not found"}), 404
+    created = sum(1 for r in results if r["status"] == "created")
+    body = {"created": created, "failed": len(results) - created, "results": results}
+    return jsonify(body), 201 if created == len(results) else 207
+
+
 @bp.route("/", methods=["GET"])
 @authenticate_jwt
 def get_lessons(series_id):
@@ -84,11 +167,13 @@ def get_lessons(series_id):
                     $ref: '#/definitions/Lesson'
                 message:
                   type: string
+      304:
+        description: Not modified (If-None-Match matched the ETag)
     security:
       - BearerAuth: []
     """
-    lessons = get_all_lessons_by_serie(series_id)
-    return jsonify(lessons), 200
+    etag = make_etag("lessons", series_id, *get_lessons_version(series_id))
+    return conditional(etag, lambda: (jsonify(get_all_lessons_by_serie(series_id)), 200))
 
 
 @bp.route("/<lesson_id>", methods=["GET"])
@@ -197,8 +282,9 @@ def del_lesson(series_id, lesson_id):
         security:
           - BearerAuth: []
         """
-        deleted = delete_lesson(series_id, lesson_id)
-        if not deleted:
+        try:
+                delete_lesson(series_id, lesson_id)
+        except ValueError:
                 return jsonify({"message": "Lesson not found"}), 404
         return jsonify({"message": "Lesson deleted successfully"}), 200
 
@@ -1,14 +1,19 @@
 from flask import Blueprint, request, jsonify, g
 from app.middleware.auth import authenticate_jwt
+from app.utils.etag import conditional, doc_etag, doc_version, make_etag
+from app.utils.batch import parse_ids, parse_fields
 from app.services.serie_service import (
     create_serie,
     get_all_series,
     get_serie_by_id,
+    get_series_by_ids,
+    get_serie_with_lessons,
     update_serie,
     delete_serie,
     subscribe_serie,
     unsubscribe_serie,
     search_series_by_title,
+    autocomplete_series,
     get_series_subscribed_by_user,
     get_all_series_by_user,
 )
@@ -99,11 +104,25 @@ def get_series():
 @bp.route("/subscribed", methods=["GET"])
 @authenticate_jwt
 def get_subscribed():
-    """Get series subscribed by user
+    """Get series subscribed by user, most recent subscription first
 
     ---
     tags:
       - Series
+    parameters:
+      - in: query
+        name: page
+        required: false
+        schema:
+          type: integer
+          default: 1
+      - in: query
+        name: limit
+        required: false
+        schema:
+          type: integer
+          default: 50
+          maximum: 100
     responses:
       200:
         description: OK
@@ -123,7 +142,9 @@ def get_subscribed():
     security:
       - BearerAuth: []
     """
-    res = get_series_subscribed_by_user(g.user.get("userId"))
+    page = request.args.get("page", 1, type=int)
+    limit = request.args.get("limit", 50, type=int)
+    res = get_series_subscribed_by_user(g.user.get("userId"), page, limit)
     return jsonify(res), 200
 
 
@@ -171,19 +192,116 @@ def search():
         required: true
         schema:
           type: string
+        description: Accent-insensitive; "bai hoc" matches "Bài học"
+      - in: query
+        name: limit
+        required: false
+        schema:
+          type: integer
+          default: 20
+          maximum: 100
     responses:
       200:
-        description: OK
+        description: OK, best matches first
       400:
         description: Missing keyword
     """
     keyword = request.args.get("keyword")
     if not keyword:
         return jsonify({"message": "Thiếu từ khóa tìm kiếm"}), 400
-    res = search_series_by_title(keyword)
+    limit = request.args.get("limit", 20, type=int)
+    res = search_series_by_title(keyword, limit)
     return jsonify(res), 200
 
 
+@bp.route("/autocomplete", methods=["GET"])
+def autocomplete():
+    """Complete a published series title from its prefix
+
+    ---
+    tags:
+      - Series
+    parameters:
+      - in: query
+        name: q
+        required: true
+        schema:
+          type: string
+        description: Title prefix, accent-insensitive
+      - in: query
+        name: limit
+        required: false
+        schema:
+          type: integer
+          default: 10
+          maximum: 20
+    responses:
+      200:
+        description: Matching titles, alphabetically
+        content:
+          application/json:
+            schema:
+              type: array
+              items:
+                type: object
+                properties:
+                  _id:
+                    type: string
+                  serie_title:
+                    type: string
+    """
+    prefix = request.args.get("q", "")
+    limit = request.args.get("limit", 10, type=int)
+    return jsonify(autocomplete_series(prefix, limit)), 200
+
+
+@bp.route("/batch", methods=["GET"])
+def get_series_batch():
+    """Get many series by id in one request
+
+    ---
+    tags:
+      - Series
+    parameters:
+      - in: query
+        name: ids
+        required: true
+        schema:
+          type: string
+        description: Comma-separated serie ids (at most MAX_BATCH_IDS)
+      - in: query
+        name: fields
+        required: false
+        schema:
+          type: string
+        description: Comma-separated fields to return; `_id` is always included
+    responses:
+      200:
+        description: Found series in the requested order, plus the ids that were not found
+        content:
+          application/json:
+            schema:
+              type: object
+              properties:
+                data:
+                  type: array
+                  items:
+                    $ref: '#/definitions/Serie'
+                missing:
+                  type: array
+                  items:
+                    type: string
+      400:
+        description: No ids, or too many
+    """
+    try:
+        ids = parse_ids(request.args)
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+    series, missing = get_series_by_ids(ids, parse_fields(request.args))
+    return jsonify({"data": series, "missing": missing}), 200
+
+
 @bp.route("/<serie_id>", methods=["GET"])
 def get_serie(serie_id):
     """Get a series by id
@@ -197,6 +315,13 @@ def get_serie(serie_id):
         required: true
         schema:
           type: string
+      - in: query
+        name: expand
+        required: false
+        schema:
+          type: string
+          enum: [lessons]
+        description: Embed lesson summaries (ordered as in serie_lessons) as `lessons`
     responses:
       200:
         description: OK
@@ -204,13 +329,22 @@ def get_serie(serie_id):
           application/json:
             schema:
               $ref: '#/definitions/Serie'
+      304:
+        description: Not modified (If-None-Match matched the ETag)
       404:
         description: Not found
     """
+    if "lessons" in request.args.get("expand", "").split(","):
+        s = get_serie_with_lessons(serie_id)
+        if not s:
+            return jsonify({"message": "Serie not found"}), 404
+        etag = make_etag("serie+lessons", s["_id"], doc_version({k: v for k, v in s.items() if k != "lessons"}),
+                         *(doc_version(l) for l in s["lessons"]))
+        return conditional(etag, lambda: (jsonify(s), 200))
     s = get_serie_by_id(serie_id)
     if not s:
         return jsonify({"message": "Serie not found"}), 404
-    return jsonify(s), 200
+    return conditional(doc_etag("serie", s), lambda: (jsonify(s), 200))
 
 
 @bp.route("/<serie_id>", methods=["PATCH"])
@@ -265,6 +399,8 @@ def subscribe(serie_id):
     responses:
       200:
         description: OK
+      404:
+        description: Serie not found
     security:
       - BearerAuth: []
     """
@@ -272,7 +408,10 @@ def subscribe(serie_id):
     user_email = g.user.get("email")
     if not user_id or not user_email:
         return jsonify({"message": "Thiếu thông tin người dùng"}), 400
-    result = subscribe_serie(serie_id, user_id, user_email)
+    try:
+        result = subscribe_serie(serie_id, user_id, user_email)
+    except ValueError:
+        return jsonify({"message": "Serie not found"}), 404
     return jsonify(result), 200
 
 
@@ -293,6 +432,8 @@ def unsubscribe(serie_id):
     responses:
       200:
         description: OK
+      404:
+        description: Serie not found
     security:
       - BearerAuth: []
     """
@@ -300,7 +441,10 @@ def unsubscribe(serie_id):
     user_email = g.user.get("email")
     if not user_id or not user_email:
         return jsonify({"message": "Thiếu thông tin người dùng"}), 400
-    result = unsubscribe_serie(serie_id, user_id, user_email)
+    try:
+        result = unsubscribe_serie(serie_id, user_id, user_email)
+    except ValueError:
+        return jsonify({"message": "Serie not found"}), 404
     return jsonify(result), 200
 
 
@@ -323,12 +467,18 @@ def delete(serie_id):
         description: Deleted
       404:
         description: Not found
+      409:
+        description: The serie still has lessons
     security:
       - BearerAuth: []
     """
-    deleted = delete_serie(serie_id)
-    if not deleted:
+    try:
+        deleted = delete_serie(serie_id)
+    except ValueError:
         return jsonify({"message": "Serie not found"}), 404
+    if isinstance(deleted, dict):
+        # refused: the serie still has lessons
+        return jsonify({"message": deleted["warning"]}), 409
     return jsonify({"message": "Serie deleted successfully"}), 200
 
 
@@ -2,10 +2,13 @@ from flask import Blueprint, request, jsonify, g
 from app.services.user_service import (
     create_user,
     get_user_by_id,
+    get_users_by_ids,
     get_user_by_cognito_id,
     update_user,
 )
 from app.middleware.auth import authenticate_jwt
+from app.utils.etag import conditional, doc_etag
+from app.utils.batch import parse_ids, parse_fields
 
 bp = Blueprint("users", __name__, url_prefix="/api/users")
 
@@ -75,6 +78,8 @@ def get_current_profile():
           application/json:
             schema:
               $ref: '#/definitions/User'
+      304:
+        description: Not modified (If-None-Match matched the ETag)
     security:
       - BearerAuth: []
     """
@@ -91,7 +96,62 @@ def get_current_profile():
             }
             user = create_user(user_data)
             return jsonify({"success": True, "data": user, "message": "User profile created automatically"}), 201
-        return jsonify({"success": True, "data": user}), 200
+        return conditional(doc_etag("user", user), lambda: (jsonify({"success": True, "data": user}), 200))
+    except Exception as e:
+        return jsonify({"success": False, "message": str(e)}), 500
+
+
+@bp.route("/batch", methods=["GET"])
+@authenticate_jwt
+def get_users_batch():
+    """Get many users by id in one request
+
+    ---
+    tags:
+      - Users
+    parameters:
+      - in: query
+        name: ids
+        required: true
+        schema:
+          type: string
+        description: Comma-separated user ids (at most MAX_BATCH_IDS)
+      - in: query
+        name: fields
+        required: false
+        schema:
+          type: string
+        description: Comma-separated fields to return; `_id` is always included
+    responses:
+      200:
+        description: Found users in the requested order, plus the ids that were not found
+        content:
+          application/json:
+            schema:
+              type: object
+              properties:
+                success:
+                  type: boolean
+                data:
+                  type: array
+                  items:
+                    $ref: '#/definitions/User'
+                missing:
+                  type: array
+                  items:
+                    type: string
+      400:
+        description: No ids, or too many
+    security:
+      - BearerAuth: []
+    """
+    try:
+        ids = parse_ids(request.args)
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+    try:
+        users, missing = get_users_by_ids(ids, parse_fields(request.args))
+        return jsonify({"success": True, "data": users, "missing": missing}), 200
     except Exception as e:
         return jsonify({"success": False, "message": str(e)}), 500
 
@@ -165,10 +225,9 @@ def put_user(user_id):
     """
     try:
         data = request.get_json() or {}
-        existing = get_user_by_id(user_id)
-        if not existing:
-            return jsonify({"success": False, "message": "User not found"}), 404
         updated = update_user(user_id, data)
+        if not updated:
+            return jsonify({"success": False, "message": "User not found"}), 404
         return jsonify({"success": True, "data": updated, "message": "User updated successfully"}), 200
     except Exception as e:
         return jsonify({"success": False, "message": str(e)}), 500
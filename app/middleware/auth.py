@@ -5,11 +5,18 @@ import time
 import json
 import requests
 import jwt
+from app.utils import tracing
+from app.utils.metrics import AUTH_LATENCY, observe
 
 # Simple cached JWKS loader. Cached for JWKS_CACHE_TTL seconds (default 3600).
 _JWKS_CACHE = {"keys": None, "fetched_at": 0}
 JWKS_CACHE_TTL = int(os.environ.get("JWKS_CACHE_TTL", "3600"))
 
+# WSGI environ key carrying claims that were already verified for this request
+# (set by the /api/batch dispatcher for its sub-requests). Only server code can
+# put it there: client headers arrive as HTTP_* keys.
+VERIFIED_CLAIMS_KEY = "paas.verified_claims"
+
 
 def _get_jwks_url():
     # Priority: explicit URL, else construct from pool id + region
@@ -79,73 +86,103 @@ def authenticate_jwt(f):
 
     @wraps(f)
     def decorated(*args, **kwargs):
-        auth = request.headers.get("Authorization", "")
-        if not auth.startswith("Bearer "):
-            return jsonify({"message": "Unauthorized"}), 401
-        token = auth.split(" ", 1)[1]
-
-        jwks_url = _get_jwks_url()
-        # Require explicit opt-in to allow insecure/no-verify decoding in local/dev
-        allow_insecure = str(os.environ.get("ALLOW_INSECURE_JWT", "")).lower() in ("1", "true", "yes")
-        if not jwks_url:
-            if not allow_insecure:
-                return jsonify({
-                    "message": "JWKS not configured. Set COGNITO_JWKS_URL or COGNITO_USER_POOL_ID+AWS_REGION; to allow insecure (dev) fallback set ALLOW_INSECURE_JWT=true"
-                }), 401
-            # Insecure fallback explicitly allowed for local development
-            try:
-                payload = jwt.decode(token, options={"verify_signature": False})
-                g.user = payload
-            except Exception:
-                return jsonify({"message": "Invalid token"}), 401
+        claims = request.environ.get(VERIFIED_CLAIMS_KEY)
+        if claims is not None:
+            g.user = claims
             return f(*args, **kwargs)
 
-        # We have a JWKS URL; perform proper verification
+        start = time.perf_counter()
+        with tracing.span("auth.verify_bearer", "auth"):
+            payload, error = _verify_bearer()
+        observe(AUTH_LATENCY, time.perf_counter() - start, outcome="ok" if error is None else "rejected")
+        if error is not None:
+            return error
+        g.user = payload
+        return f(*args, **kwargs)
+
+    return decorated
+
+
+def _verify_bearer():
+    """`(claims, None)` for a valid bearer token, else `(None, error response)`."""
+    auth = request.headers.get("Authorization", "")
+    if not auth.startswith("Bearer "):
+        return None, (jsonify({"message": "Unauthorized"}), 401)
+    token = auth.split(" ", 1)[1]
+
+    jwks_url = _get_jwks_url()
+    # Require explicit opt-in to allow insecure/no-verify decoding in local/dev
+    allow_insecure = str(os.environ.get("ALLOW_INSECURE_JWT", "")).lower() in ("1", "true", "yes")
+    if not jwks_url:
+        if not allow_insecure:
+            return None, (jsonify({
+                "message": "JWKS not configured. Set COGNITO_JWKS_URL or COGNITO_USER_POOL_ID+AWS_REGION; to allow insecure (dev) fallback set ALLOW_INSECURE_JWT=true"
+            }), 401)
+        # Insecure fallback explicitly allowed for local development
         try:
-            unverified_header = jwt.get_unverified_header(token)
+            return jwt.decode(token, options={"verify_signature": False}), None
         except Exception:
-            return jsonify({"message": "Invalid token header"}), 401
+            return None, (jsonify({"message": "Invalid token"}), 401)
 
-        kid = unverified_header.get("kid")
-        if not kid:
-            return jsonify({"message": "Invalid token (no kid)"}), 401
+    # We have a JWKS URL; perform proper verification
+    try:
+        unverified_header = jwt.get_unverified_header(token)
+    except Exception:
+        return None, (jsonify({"message": "Invalid token header"}), 401)
 
+    kid = unverified_header.get("kid")
+    if not kid:
+        return None, (jsonify({"message": "Invalid token (no kid)"}), 401)
+
+    public_key = _get_public_key_for_kid(kid)
+    if not public_key:
+        # Try refetching JWKS once and retry
+        _JWKS_CACHE["keys"] = None
         public_key = _get_public_key_for_kid(kid)
         if not public_key:
-            # Try refetching JWKS once and retry
-            _JWKS_CACHE["keys"] = None
-            public_key = _get_public_key_for_kid(kid)
-            if not public_key:
-                return jsonify({"message": "Unable to find key for token"}), 401
-
-        # Validate audience/issuer if provided
-        audience = os.environ.get("JWT_AUDIENCE") or os.environ.get("COGNITO_CLIENT_ID")
-        issuer = os.environ.get("JWT_ISSUER") or os.environ.get("COGNITO_ISSUER")
-        # If issuer not set but pool+region present, derive it
-        if not issuer:
-            pool = os.environ.get("COGNITO_USER_POOL_ID") or os.environ.get("COGNITO_POOL_ID")
-            region = os.environ.get("AWS_REGION") or os.environ.get("COGNITO_REGION")
-            if pool and region:
-                issuer = f"https://cognito-idp.{region}.amazonaws.com/{pool}"
+            return None, (jsonify({"message": "Unable to find key for token"}), 401)
+
+    # Validate audience/issuer if provided
+    audience = os.environ.get("JWT_AUDIENCE") or os.environ.get("COGNITO_CLIENT_ID")
+    issuer = os.environ.get("JWT_ISSUER") or os.environ.get("COGNITO_ISSUER")
+    # If issuer not set but pool+region present, derive it
+    if not issuer:
+        pool = os.environ.get("COGNITO_USER_POOL_ID") or os.environ.get("COGNITO_POOL_ID")
+        region = os.environ.get("AWS_REGION") or os.environ.get("COGNITO_REGION")
+        if pool and region:
+            issuer = f"https://cognito-idp.{region}.amazonaws.com/{pool}"
 
-        try:
-            decode_kwargs = {"algorithms": ["RS256"]}
-            if audience:
-                decode_kwargs["audience"] = audience
-            if issuer:
-                decode_kwargs["issuer"] = issuer
-
-            payload = jwt.decode(token, key=public_key, **decode_kwargs)
-            g.user = payload
-        except jwt.ExpiredSignatureError:
-            return jsonify({"message": "Token expired"}), 401
-        except jwt.InvalidAudienceError:
-            return jsonify({"message": "Invalid token audience"}), 401
-        except jwt.InvalidIssuerError:
-            return jsonify({"message": "Invalid token issuer"}), 401
-        except Exception:
-            return jsonify({"message": "Invalid token"}), 401
+    try:
+        decode_kwargs = {"algorithms": ["RS256"]}
+        if audience:
+            decode_kwargs["audience"] = audience
+        if issuer:
+            decode_kwargs["issuer"] = issuer
+
+        payload = jwt.decode(token, key=public_key, **decode_kwargs)
+    except jwt.ExpiredSignatureError:
+        return None, (jsonify({"message": "Token expired"}), 401)
+    except jwt.InvalidAudienceError:
+        return None, (jsonify({"message": "Invalid token audience"}), 401)
+    except jwt.InvalidIssuerError:
+        return None, (jsonify({"message": "Invalid token issuer"}), 401)
+    except Exception:
+        return None, (jsonify({"message": "Invalid token"}), 401)
+    return payload, None
 
+
+def require_admin(f):
+    """`authenticate_jwt`, then require membership of the ADMIN_GROUP Cognito
+    group (default "admin") in the token's `cognito:groups` claim."""
+
+    @authenticate_jwt
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        groups = g.user.get("cognito:groups") or []
+        if isinstance(groups, str):
+            groups = groups.split(",")
+        if os.environ.get("ADMIN_GROUP", "admin") not in groups:
+            return jsonify({"message": "Forbidden"}), 403
         return f(*args, **kwargs)
 
     return decorated
@@ -0,0 +1,93 @@
+"""gzip/brotli response compression.
+
+Registered as an `after_request` hook by `init_app`. Responses are only
+compressed when the client accepts an encoding we support, the mimetype is
+textual, the body is at least COMPRESS_MIN_SIZE bytes and it is neither
+streamed nor already encoded. Bodies carrying a strong ETag are compressed
+once per (ETag, encoding) and served from an LRU afterwards.
+
+Settings (app.config, falling back to the environment):
+  - COMPRESS_MIN_SIZE   : smallest body worth compressing (default 500)
+  - COMPRESS_LEVEL      : gzip level 1-9 (default 6)
+  - COMPRESS_BR_QUALITY : brotli quality 0-11 (default 4)
+  - COMPRESS_CACHE_SIZE : number of cached compressed bodies (default 512)
+"""
+import gzip
+import os
+from flask import request, current_app
+from app.utils.cache import LRUCache
+
+try:
+    import brotli
+except Exception:
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = {
+    "application/json",
+    "application/javascript",
+    "application/xml",
+    "image/svg+xml",
+}
+
+_COMPRESSED = LRUCache(maxsize=int(os.environ.get("COMPRESS_CACHE_SIZE", "512")))
+
+
+def _setting(name, default):
+    return int(current_app.config.get(name, os.environ.get(name, default)))
+
+
+def supported_encodings():
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def compress(data, encoding, level=None):
+    if encoding == "br":
+        quality = _setting("COMPRESS_BR_QUALITY", 4) if level is None else level
+        return brotli.compress(data, quality=quality)
+    level = _setting("COMPRESS_LEVEL", 6) if level is None else level
+    # mtime=0 keeps the output deterministic so cached bodies are byte-identical
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+def _is_compressible(response):
+    mimetype = response.mimetype or ""
+    return mimetype.startswith("text/") or mimetype in COMPRESSIBLE_MIMETYPES
+
+
+def compress_response(response):
+    if (
+        response.status_code < 200
+        or response.status_code in (204, 304)
+        or response.direct_passthrough
+        or response.is_streamed
+        or "Content-Encoding" in response.headers
+        or not _is_compressible(response)
+    ):
+        return response
+
+    response.vary.add("Accept-Encoding")
+    encoding = request.accept_encodings.best_match(supported_encodings())
+    if not encoding:
+        return response
+    data = response.get_data()
+    if len(data) < _setting("COMPRESS_MIN_SIZE", 500):
+        return response
+
+    etag, weak = response.get_etag()
+    key = (etag, encoding) if etag and not weak else None
+    body = _COMPRESSED.get(key) if key else None
+    if body is None:
+        body = compress(data, encoding)
+        if key:
+            _COMPRESSED.set(key, body)
+
+    response.set_data(body)
+    response.headers["Content-Encoding"] = encoding
+    if etag and not weak:
+        # each encoding is its own representation and needs its own strong tag
+        response.set_etag(f"{etag}-{encoding}")
+    return response
+
+
+def init_app(app):
+    app.after_request(compress_response)
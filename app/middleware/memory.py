@@ -0,0 +1,70 @@
+"""Per-route memory telemetry.
+
+Records, for every endpoint, the largest RSS growth across one request and
+the highest RSS seen at the end of one. With tracemalloc on
+(TRACEMALLOC_FRAMES > 0) it also records the peak of Python allocations
+during the request. Readings are per worker process and, under threaded
+workers, include whatever concurrent requests allocated at the same time.
+They are served with the tracemalloc top allocations by
+GET /api/admin/memory.
+
+Settings (app.config, falling back to the environment):
+  - MEMORY_TELEMETRY  : record per-route readings (default true)
+  - TRACEMALLOC_FRAMES: frames kept per traced allocation (default 0, off;
+                        tracing slows every allocation down)
+"""
+import os
+import tracemalloc
+from threading import Lock
+
+from flask import current_app, request
+
+from app.utils import memory
+
+_STARTED = "paas.memory_started"
+
+
+class RouteMemory:
+    def __init__(self):
+        self._routes = {}
+        self._lock = Lock()
+
+    def record(self, endpoint, rss_before, rss_after, python_peak=None):
+        with self._lock:
+            stats = self._routes.setdefault(endpoint, {"requests": 0, "max_rss_growth": 0, "max_rss": 0,
+                                                       "max_python_peak": None})
+            stats["requests"] += 1
+            stats["max_rss_growth"] = max(stats["max_rss_growth"], rss_after - rss_before)
+            stats["max_rss"] = max(stats["max_rss"], rss_after)
+            if python_peak is not None:
+                stats["max_python_peak"] = max(stats["max_python_peak"] or 0, python_peak)
+
+    def snapshot(self):
+        """Routes by largest RSS growth first."""
+        with self._lock:
+            rows = [{"endpoint": endpoint, **stats} for endpoint, stats in self._routes.items()]
+        return sorted(rows, key=lambda r: r["max_rss_growth"], reverse=True)
+
+
+def _before():
+    if tracemalloc.is_tracing():
+        tracemalloc.reset_peak()
+    request.environ[_STARTED] = memory.rss_bytes()
+
+
+def _teardown(exc):
+    before = request.environ.pop(_STARTED, None)
+    if before is None:
+        return
+    peak = tracemalloc.get_traced_memory()[1] if tracemalloc.is_tracing() else None
+    current_app.extensions["route_memory"].record(request.endpoint or "unmatched", before, memory.rss_bytes(), peak)
+
+
+def init_app(app):
+    memory.start_tracing(int(app.config.get("TRACEMALLOC_FRAMES", os.environ.get("TRACEMALLOC_FRAMES", "0"))))
+    enabled = app.config.get("MEMORY_TELEMETRY", os.environ.get("MEMORY_TELEMETRY", "true"))
+    if str(enabled).lower() in ("0", "false", "no"):
+        return
+    app.extensions["route_memory"] = RouteMemory()
+    app.before_request(_before)
+    app.teardown_request(_teardown)
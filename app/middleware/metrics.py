@@ -0,0 +1,63 @@
+"""Per-request Prometheus metrics and the `/metrics` endpoint.
+
+Registered by `init_app` before the blueprints, so its `before_request`
+hook runs first and its `after_request` hook last: the recorded latency
+covers auth, the view and compression. Requests are labelled by endpoint
+name (e.g. "series.get_serie"), never by raw path, so the label set stays
+bounded; unrouted requests share the "unmatched" label.
+
+Set METRICS_TOKEN to require `Authorization: Bearer <token>` on `/metrics`.
+Does nothing without prometheus_client (see app.utils.metrics).
+"""
+import hmac
+import os
+import time
+
+from flask import Response, request
+
+from app.utils import metrics
+
+_STARTED = "paas.metrics_started"
+
+
+def _before():
+    endpoint = request.endpoint or "unmatched"
+    request.environ[_STARTED] = (time.perf_counter(), endpoint)
+    metrics.HTTP_IN_PROGRESS.labels(endpoint).inc()
+
+
+def _after(response):
+    started = request.environ.get(_STARTED)
+    if started is not None:
+        start, endpoint = started
+        labels = (endpoint, request.method, str(response.status_code))
+        metrics.HTTP_REQUESTS.labels(*labels).inc()
+        metrics.HTTP_LATENCY.labels(*labels).observe(time.perf_counter() - start)
+    return response
+
+
+def _teardown(exc):
+    # runs even when the response could not be built
+    started = request.environ.pop(_STARTED, None)
+    if started is not None:
+        metrics.HTTP_IN_PROGRESS.labels(started[1]).dec()
+
+
+def metrics_view():
+    token = os.environ.get("METRICS_TOKEN")
+    if token and not hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}"):
+        return Response("Unauthorized\n", status=401, mimetype="text/plain")
+    body, content_type = metrics.render()
+    return Response(body, content_type=content_type)
+
+
+def init_app(app):
+    if not metrics.ENABLED:
+        return
+    app.before_request(_before)
+    app.after_request(_after)
+    app.teardown_request(_teardown)
+    app.add_url_rule("/metrics", "metrics", metrics_view, methods=["GET"])
+    repos = app.extensions.get("repositories")
+    if repos is not None and repos.metrics is not None:
+        repos.metrics.subscribe(metrics.observe_repository_call)
@@ -0,0 +1,173 @@
+"""On-demand profiling of single requests.
+
+A request carrying a valid `X-Profile` header is profiled and answered with
+an `X-Profile-Id` header naming the file written to PROFILE_DIR:
+
+  - sampling (default): the request thread's stack is sampled every
+    PROFILE_INTERVAL_MS from a helper thread and written as collapsed
+    stacks (`<id>.collapsed`), which flamegraph.pl and speedscope read.
+  - cprofile: deterministic cProfile stats (`<id>.pstats`), for snakeviz or
+    flameprof; use it where threads cannot observe each other (gevent).
+
+The header is `<expires>:<signature>`, the hex HMAC-SHA256 under
+PROFILE_SECRET of "<expires>\\n<METHOD>\\n<path>", so a header only profiles
+the request it was signed for and only until it expires. Generate one with
+
+    PROFILE_SECRET=... python -m app.middleware.profiling GET /api/series/<id>
+
+The middleware is only installed when PROFILE_SECRET is set, and requests
+without the header pass straight through. One request per process is
+profiled at a time; others are served normally. Streamed bodies are
+profiled up to the point the view returns.
+
+Settings (app.config, falling back to the environment):
+  - PROFILE_SECRET      : enables profiling (unset: off)
+  - PROFILE_DIR         : where profiles are written (default /tmp/paas-profiles)
+  - PROFILER            : sampling | cprofile (default sampling)
+  - PROFILE_INTERVAL_MS : sampling interval (default 1)
+  - PROFILE_MAX_TTL     : longest accepted header lifetime in seconds (default 3600)
+"""
+import cProfile
+import hashlib
+import hmac
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+HEADER = "HTTP_X_PROFILE"
+PROFILE_ID_HEADER = "X-Profile-Id"
+
+
+def signature(secret, expires, method, path):
+    message = f"{expires}\n{method.upper()}\n{path}".encode()
+    return hmac.new(secret.encode(), message, hashlib.sha256).hexdigest()
+
+
+def profile_header(secret, method, path, ttl=300):
+    """The `X-Profile` value that profiles `method path` for `ttl` seconds."""
+    expires = int(time.time()) + ttl
+    return f"{expires}:{signature(secret, expires, method, path)}"
+
+
+def verify(secret, value, method, path, max_ttl):
+    expires, _, sig = value.partition(":")
+    try:
+        expires = int(expires)
+    except ValueError:
+        return False
+    now = time.time()
+    if not now < expires <= now + max_ttl:
+        return False
+    return hmac.compare_digest(sig, signature(secret, expires, method, path))
+
+
+def _label(code):
+    name = getattr(code, "co_qualname", code.co_name)
+    return f"{name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """Counts the stacks of one thread, sampled from a helper thread."""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            names = []
+            while frame is not None:
+                names.append(_label(frame.f_code))
+                frame = frame.f_back
+            if names:
+                self.stacks[";".join(reversed(names))] += 1
+
+    def collapsed(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class ProfilingMiddleware:
+    """WSGI middleware around `app.wsgi_app`; see the module docstring."""
+
+    def __init__(self, wsgi_app, secret, directory, profiler="sampling", interval=0.001, max_ttl=3600):
+        self.wsgi_app = wsgi_app
+        self.secret = secret
+        self.directory = directory
+        self.profiler = profiler
+        self.interval = interval
+        self.max_ttl = max_ttl
+        self._busy = threading.Lock()
+
+    def __call__(self, environ, start_response):
+        value = environ.get(HEADER)
+        if value is None:
+            return self.wsgi_app(environ, start_response)
+        if not verify(self.secret, value, environ.get("REQUEST_METHOD", ""), environ.get("PATH_INFO", ""),
+                      self.max_ttl) or not self._busy.acquire(blocking=False):
+            return self.wsgi_app(environ, start_response)
+        try:
+            return self._profiled(environ, start_response)
+        finally:
+            self._busy.release()
+
+    def _profiled(self, environ, start_response):
+        profile_id = f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+
+        def start_with_id(status, headers, exc_info=None):
+            return start_response(status, [*headers, (PROFILE_ID_HEADER, profile_id)], exc_info)
+
+        os.makedirs(self.directory, exist_ok=True)
+        if self.profiler == "cprofile":
+            profile = cProfile.Profile()
+            try:
+                return profile.runcall(self.wsgi_app, environ, start_with_id)
+            finally:
+                profile.dump_stats(os.path.join(self.directory, f"{profile_id}.pstats"))
+        sampler = StackSampler(threading.get_ident(), self.interval)
+        sampler.start()
+        try:
+            return self.wsgi_app(environ, start_with_id)
+        finally:
+            sampler.stop()
+            with open(os.path.join(self.directory, f"{profile_id}.collapsed"), "w", encoding="utf-8") as fh:
+                fh.write(sampler.collapsed())
+
+
+def _setting(app, name, default=None):
+    return app.config.get(name, os.environ.get(name, default))
+
+
+def init_app(app):
+    secret = _setting(app, "PROFILE_SECRET")
+    if not secret:
+        return
+    profiler = _setting(app, "PROFILER", "sampling")
+    if profiler not in ("sampling", "cprofile"):
+        raise ValueError(f"PROFILER must be sampling or cprofile, not {profiler!r}")
+    app.config["PROFILE_DIR"] = directory = _setting(app, "PROFILE_DIR", "/tmp/paas-profiles")
+    app.wsgi_app = ProfilingMiddleware(
+        app.wsgi_app, secret, directory, profiler,
+        interval=float(_setting(app, "PROFILE_INTERVAL_MS", "1")) / 1000,
+        max_ttl=int(_setting(app, "PROFILE_MAX_TTL", "3600")),
+    )
+
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (3, 4) or not os.environ.get("PROFILE_SECRET"):
+        raise SystemExit("usage: PROFILE_SECRET=... python -m app.middleware.profiling METHOD PATH [TTL]")
+    ttl = int(sys.argv[3]) if len(sys.argv) == 4 else 300
+    print(f"X-Profile: {profile_header(os.environ['PROFILE_SECRET'], sys.argv[1], sys.argv[2], ttl)}")
@@ -0,0 +1,84 @@
+"""Per-request traces: the Server-Timing header and sampled span export.
+
+Registered by `init_app` right after the metrics hooks, so the root span
+covers auth, the view and compression. Spans come from app.utils.tracing
+(auth, services, Mongo commands, S3/SNS calls).
+
+Settings (app.config, falling back to the environment):
+  - SERVER_TIMING      : add a Server-Timing header to every response (default false)
+  - TRACE_EXPORT_FILE  : append sampled traces to this file as OTLP/JSON lines
+  - TRACE_EXPORT_URL   : POST them to an OTLP/HTTP collector
+                         (e.g. http://localhost:4318/v1/traces)
+  - TRACE_SAMPLE_RATE  : fraction of requests exported (default 0.01); the
+                         sampled flag of an incoming `traceparent` wins
+  - TRACE_SERVICE_NAME : `service.name` of the exported spans (default paas-backend)
+
+With neither Server-Timing nor an exporter, no hooks are registered.
+"""
+import os
+import random
+
+from flask import current_app, g, request
+
+from app.utils import tracing
+
+
+def _setting(app, name, default=None):
+    return app.config.get(name, os.environ.get(name, default))
+
+
+def _before():
+    settings = current_app.extensions["tracing"]
+    exporter = settings["exporter"]
+    parent = tracing.parse_traceparent(request.headers.get("traceparent"))
+    if exporter is None:
+        sampled = False
+    elif parent is not None:
+        sampled = parent[2]
+    else:
+        sampled = random.random() < settings["sample_rate"]
+    if not sampled and not settings["server_timing"]:
+        return
+    trace = g.trace = tracing.Trace(*(parent[:2] if parent else ()), sampled=sampled)
+    trace.start(request.endpoint or "unmatched", "total", tracing.SERVER,
+                **{"http.method": request.method, "http.target": request.path})
+
+
+def _after(response):
+    trace = g.get("trace")
+    if trace is not None:
+        root = trace.spans[0]
+        trace.finish(root)
+        root.attributes["http.status_code"] = response.status_code
+        if current_app.extensions["tracing"]["server_timing"]:
+            response.headers["Server-Timing"] = tracing.server_timing(trace)
+    return response
+
+
+def _teardown(exc):
+    trace = g.pop("trace", None)
+    if trace is None:
+        return
+    root = trace.spans[0]
+    if root.end is None:
+        trace.finish(root, exc)
+    if trace.sampled:
+        current_app.extensions["tracing"]["exporter"].submit(trace)
+
+
+def init_app(app):
+    server_timing = str(_setting(app, "SERVER_TIMING", "false")).lower() in ("1", "true", "yes")
+    path, url = _setting(app, "TRACE_EXPORT_FILE"), _setting(app, "TRACE_EXPORT_URL")
+    exporter = None
+    if path or url:
+        exporter = tracing.Exporter(path, url, _setting(app, "TRACE_SERVICE_NAME", "paas-backend"))
+    if not server_timing and exporter is None:
+        return
+    app.extensions["tracing"] = {
+        "server_timing": server_timing,
+        "exporter": exporter,
+        "sample_rate": float(_setting(app, "TRACE_SAMPLE_RATE", "0.01")),
+    }
+    app.before_request(_before)
+    app.after_request(_after)
+    app.teardown_request(_teardown)
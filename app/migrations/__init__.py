@@ -0,0 +1,5 @@
+"""One-off data migrations.
+
+Each module exposes `run(db)` and can be executed against the configured
+database with `python -m app.migrations.<name>`.
+"""
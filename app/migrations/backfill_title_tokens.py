@@ -0,0 +1,27 @@
+"""Populate `serie_title_tokens` on series written before title search
+switched to accent-folded tokens."""
+from pymongo import UpdateOne
+from app.utils.mongodb import connect_to_database
+from app.utils.search import tokenize
+
+BATCH_SIZE = 1000
+
+
+def run(db):
+    series = db.get_collection("series")
+    ops, updated = [], 0
+    for doc in series.find({}, {"serie_title": 1}):
+        ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": {"serie_title_tokens": tokenize(doc.get("serie_title"))}}))
+        if len(ops) >= BATCH_SIZE:
+            updated += series.bulk_write(ops, ordered=False).modified_count
+            ops = []
+    if ops:
+        updated += series.bulk_write(ops, ordered=False).modified_count
+    return updated
+
+
+if __name__ == "__main__":
+    db = connect_to_database()
+    if db is None:
+        raise SystemExit("MONGODB_URI is not set")
+    print(f"updated {run(db)} series")
@@ -0,0 +1,82 @@
+"""Store every serie reference as an ObjectId (see app.utils.ids).
+
+Rewrites string `lessons.lesson_serie`, string entries of
+`series.serie_lessons` and string `subscriptions.serie_id` values. A string
+subscription that duplicates an ObjectId one is dropped instead, since the
+(user_id, serie_id) index is unique. Malformed ids are left alone and
+counted. Safe to re-run.
+"""
+from pymongo import DeleteOne, UpdateOne
+from pymongo.errors import BulkWriteError
+from app.utils import ids
+from app.utils.mongodb import connect_to_database
+
+BATCH_SIZE = 1000
+
+
+def _flush(col, ops):
+    """Apply `ops`; returns how many documents changed."""
+    if not ops:
+        return 0
+    try:
+        result = col.bulk_write(ops, ordered=False)
+    except BulkWriteError as exc:
+        return exc.details.get("nModified", 0) + exc.details.get("nRemoved", 0)
+    return result.modified_count + result.deleted_count
+
+
+def _normalize_field(col, field, existing=None):
+    """Convert string `field` values to ObjectIds. `existing(doc, oid)`
+    says whether converting `doc` would duplicate another document, which
+    is then deleted instead."""
+    ops, changed, skipped = [], 0, 0
+    for doc in col.find({field: {"$type": "string"}}):
+        oid = ids.parse(doc[field])
+        if oid is None:
+            skipped += 1
+            continue
+        if existing is not None and existing(doc, oid):
+            ops.append(DeleteOne({"_id": doc["_id"]}))
+        else:
+            ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": {field: oid}}))
+        if len(ops) >= BATCH_SIZE:
+            changed += _flush(col, ops)
+            ops = []
+    return changed + _flush(col, ops), skipped
+
+
+def _normalize_serie_lessons(series):
+    ops, changed, skipped = [], 0, 0
+    for serie in series.find({"serie_lessons": {"$type": "string"}}, {"serie_lessons": 1}):
+        lessons = []
+        for lesson_id in serie["serie_lessons"]:
+            oid = ids.parse(lesson_id)
+            skipped += oid is None
+            lessons.append(lesson_id if oid is None else oid)
+        ops.append(UpdateOne({"_id": serie["_id"]}, {"$set": {"serie_lessons": lessons}}))
+        if len(ops) >= BATCH_SIZE:
+            changed += _flush(series, ops)
+            ops = []
+    return changed + _flush(series, ops), skipped
+
+
+def run(db):
+    """Returns `{collection: (changed, malformed)}`."""
+    subs = db.get_collection("subscriptions")
+
+    def _duplicate(sub, oid):
+        return subs.find_one({"user_id": sub.get("user_id"), "serie_id": oid}, {"_id": 1}) is not None
+
+    return {
+        "lessons": _normalize_field(db.get_collection("lessons"), "lesson_serie"),
+        "series": _normalize_serie_lessons(db.get_collection("series")),
+        "subscriptions": _normalize_field(subs, "serie_id", existing=_duplicate),
+    }
+
+
+if __name__ == "__main__":
+    db = connect_to_database()
+    if db is None:
+        raise SystemExit("MONGODB_URI is not set")
+    for collection, (changed, malformed) in run(db).items():
+        print(f"{collection}: {changed} updated, {malformed} malformed ids left as-is")
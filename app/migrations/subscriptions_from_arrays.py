@@ -0,0 +1,87 @@
+"""Copy the legacy `users.serie_subcribe` arrays into the `subscriptions`
+collection, unset the arrays and recount `series.serie_subcribe_num`.
+
+The arrays carry no subscription dates (and legacy users have
+`updatedAt: None`), so copied subscriptions get distinct `createdAt` stamps
+just before the run started: older than every subscription made through the
+new collection, later array entries newer, so newest-first listings and
+their `before` paging see them in a defined order. Subscriptions an earlier
+run left without `createdAt` are stamped the same way.
+
+The arrays are unset once copied, since subscribe/unsubscribe no longer
+maintain them: GET /api/users/profile stops returning `serie_subcribe`
+(GET /api/series/subscribed lists a user's series).
+
+Every user or serie the run changes gets its VERSION incremented, so its
+ETag changes with its body.
+
+Safe to re-run: subscriptions are upserted on their unique (user_id, serie_id)
+key.
+"""
+from datetime import datetime, timedelta, timezone
+from itertools import count
+from pymongo import UpdateOne
+from app.repositories.base import VERSION
+from app.utils import ids
+from app.utils.mongodb import connect_to_database, ensure_indexes
+
+BATCH_SIZE = 1000
+
+
+def _flush(col, ops):
+    if ops:
+        col.bulk_write(ops, ordered=False)
+    return []
+
+
+def run(db):
+    ensure_indexes(db)
+    users = db.get_collection("users")
+    subs = db.get_collection("subscriptions")
+    series = db.get_collection("series")
+    started = datetime.now(timezone.utc)
+    stamps = (started - timedelta(milliseconds=n) for n in count(1))
+
+    ops, copied = [], 0
+    for user in users.find({"serie_subcribe.0": {"$exists": True}}, {"serie_subcribe": 1}):
+        # the last entry is the most recent subscription: it gets the newest stamp
+        for sid in reversed(user["serie_subcribe"]):
+            serie_oid = ids.parse(sid)
+            if serie_oid is None:
+                continue
+            key = {"user_id": user["_id"], "serie_id": serie_oid}
+            ops.append(UpdateOne(key, {"$setOnInsert": {**key, "createdAt": next(stamps)}}, upsert=True))
+            copied += 1
+            if len(ops) >= BATCH_SIZE:
+                ops = _flush(subs, ops)
+    ops = _flush(subs, ops)
+    for sub in subs.find({"createdAt": None}, {"_id": 1}):
+        ops.append(UpdateOne({"_id": sub["_id"]}, {"$set": {"createdAt": next(stamps)}}))
+        if len(ops) >= BATCH_SIZE:
+            ops = _flush(subs, ops)
+    _flush(subs, ops)
+    users.update_many({"serie_subcribe": {"$exists": True}},
+                      {"$unset": {"serie_subcribe": ""}, "$inc": {VERSION: 1}})
+
+    ops, counts = [], {}
+    for row in subs.aggregate([{"$group": {"_id": "$serie_id", "count": {"$sum": 1}}}]):
+        counts[row["_id"]] = row["count"]
+        ops.append(UpdateOne({"_id": row["_id"], "serie_subcribe_num": {"$ne": row["count"]}},
+                             {"$set": {"serie_subcribe_num": row["count"]}, "$inc": {VERSION: 1}}))
+        if len(ops) >= BATCH_SIZE:
+            ops = _flush(series, ops)
+    # series whose subscribers have all left keep a stale count otherwise
+    for serie in series.find({"serie_subcribe_num": {"$nin": [0, None]}}, {"_id": 1}):
+        if serie["_id"] not in counts:
+            ops.append(UpdateOne({"_id": serie["_id"]}, {"$set": {"serie_subcribe_num": 0}, "$inc": {VERSION: 1}}))
+            if len(ops) >= BATCH_SIZE:
+                ops = _flush(series, ops)
+    _flush(series, ops)
+    return copied
+
+
+if __name__ == "__main__":
+    db = connect_to_database()
+    if db is None:
+        raise SystemExit("MONGODB_URI is not set")
+    print(f"copied {run(db)} subscriptions")
@@ -0,0 +1,158 @@
+"""Storage behind the services: one repository per aggregate (series,
+lessons, subscriptions, users) over Mongo or the local store.
+
+`init_app` picks the backend once per app, when it is created: Mongo when
+MONGODB_URI is set, otherwise the local store (LOCAL_STORE, see
+app.utils.localstore). It wraps every repository with the metrics and
+query-budget decorators (app.repositories.decorators); Mongo lookups by id
+also go through a short-lived cache. Services reach them through
+`get_repositories()`: the current app's inside an app context, otherwise
+the process-wide ones scripts use (built on first use, or set with `use`).
+"""
+import os
+from threading import Lock
+
+from flask import current_app, has_app_context
+
+from app.repositories.base import VERSION, DuplicateError
+from app.repositories.decorators import (
+    REPOSITORY_QUERY_BUDGET,
+    REPOSITORY_QUERY_BUDGET_STRICT,
+    BudgetedRepository,
+    CachingRepository,
+    MeteredRepository,
+    RepositoryMetrics,
+)
+from app.utils.batch import BATCH_CACHE_SIZE, BATCH_CACHE_TTL
+from app.utils.cache import LRUCache
+from app.utils.localstore import open_store
+from app.utils.mongodb import connect_to_database, run_in_transaction
+
+__all__ = ["VERSION", "DuplicateError", "Repositories", "build", "get_repositories", "init_app", "use"]
+
+AGGREGATES = ("series", "lessons", "subscriptions", "users")
+# methods that change the document named by their first argument
+_CACHED_WRITES = {
+    "series": ("update", "add_lessons", "remove_lessons", "add_subscribers", "delete_if_empty"),
+    "users": ("upsert", "update"),
+}
+
+
+class Repositories:
+    """The repositories of one backend, plus its transaction runner."""
+
+    def __init__(self, series, lessons, subscriptions, users, transaction, backend, metrics=None):
+        self.series = series
+        self.lessons = lessons
+        self.subscriptions = subscriptions
+        self.users = users
+        self.backend = backend
+        self.metrics = metrics
+        self._transaction = transaction
+
+    def transaction(self, callback):
+        """Run `callback(session)` in a transaction where the backend has
+        them, else once with `session=None` (see run_in_transaction)."""
+        return self._transaction(callback)
+
+    def decorate(self, wrap):
+        """A copy with every repository replaced by `wrap(name, repository)`."""
+        return Repositories(
+            transaction=self._transaction,
+            backend=self.backend,
+            metrics=self.metrics,
+            **{name: wrap(name, getattr(self, name)) for name in AGGREGATES},
+        )
+
+
+def mongo_repositories(db):
+    from app.repositories import mongo
+
+    return Repositories(
+        series=mongo.MongoSeriesRepository(db),
+        lessons=mongo.MongoLessonRepository(db),
+        subscriptions=mongo.MongoSubscriptionRepository(db),
+        users=mongo.MongoUserRepository(db),
+        transaction=lambda callback: run_in_transaction(db, callback),
+        backend="mongo",
+    )
+
+
+def local_repositories(open_store=open_store):
+    """Repositories over `open_store(name, indexes=..., text=...)` stores."""
+    from app.repositories import local
+
+    series = open_store("series", indexes=("serie_user", "isPublish"), text=("serie_title",))
+    lessons = open_store("lessons", indexes=("lesson_serie",))
+    return Repositories(
+        series=local.LocalSeriesRepository(series, lessons),
+        lessons=local.LocalLessonRepository(lessons),
+        subscriptions=local.LocalSubscriptionRepository(open_store("subscriptions", indexes=("user_id", "serie_id")), series),
+        users=local.LocalUserRepository(open_store("users")),
+        transaction=lambda callback: callback(None),
+        backend=os.environ.get("LOCAL_STORE", "memory").lower(),
+    )
+
+
+def _cached(name, repository):
+    writes = _CACHED_WRITES.get(name)
+    if writes is None:
+        return repository
+    return CachingRepository(name, repository, LRUCache(BATCH_CACHE_SIZE, BATCH_CACHE_TTL), writes)
+
+
+def build(db=None, metrics=None, budget=0, strict=False):
+    """Repositories over `db`, or over the configured database.
+
+    With `metrics` (a RepositoryMetrics) every call is timed; with a
+    `budget` calls are counted per request. Mongo lookups by id are served
+    from a per-process cache outside both, so cache hits cost nothing."""
+    if db is None:
+        db = connect_to_database()
+    repos = mongo_repositories(db) if db is not None else local_repositories()
+    if metrics is not None:
+        repos = repos.decorate(lambda name, repo: MeteredRepository(name, repo, metrics))
+        repos.metrics = metrics
+    if budget:
+        repos = repos.decorate(lambda name, repo: BudgetedRepository(name, repo, budget, strict))
+    if repos.backend == "mongo":
+        repos = repos.decorate(_cached)
+    return repos
+
+
+_STATE = {"repositories": None}
+_BUILD = Lock()
+
+
+def use(repos):
+    """Make `repos` the repositories the services use outside an app
+    context; returns the previous ones."""
+    previous, _STATE["repositories"] = _STATE["repositories"], repos
+    return previous
+
+
+def get_repositories():
+    if has_app_context():
+        repos = current_app.extensions.get("repositories")
+        if repos is not None:
+            return repos
+    repos = _STATE["repositories"]
+    if repos is None:
+        # scripts and shells that never created an app
+        with _BUILD:
+            if _STATE["repositories"] is None:
+                _STATE["repositories"] = build()
+            repos = _STATE["repositories"]
+    return repos
+
+
+def init_app(app):
+    """Choose and decorate the repositories the services use in `app`."""
+    repos = build(
+        metrics=RepositoryMetrics(),
+        budget=int(app.config.get("REPOSITORY_QUERY_BUDGET", REPOSITORY_QUERY_BUDGET)),
+        strict=bool(app.config.get("REPOSITORY_QUERY_BUDGET_STRICT", REPOSITORY_QUERY_BUDGET_STRICT)),
+    )
+    repos.series.warm_up()
+    app.extensions["repositories"] = repos
+    return repos
@@ -0,0 +1,201 @@
+"""Repository interfaces, one per aggregate.
+
+Ids cross this boundary as strings; documents come back in the shape the API
+serves (internal search fields stripped). Methods that take `session` run
+inside `Repositories.transaction` when one is passed; backends without
+transactions get `None` and the caller compensates, exactly as with
+`app.utils.mongodb.run_in_transaction`.
+
+Every write to a serie, lesson or user increments its VERSION field in the
+same command (inserts start it at 1); ETags are derived from it
+(app.utils.etag), so callers must not pass it in `changes`.
+
+The interfaces are abstract: a backend missing a method fails when it is
+constructed, not on the first request that calls it.
+"""
+from abc import ABC, abstractmethod
+
+VERSION = "_version"
+
+
+class DuplicateError(Exception):
+    """Raised when a write would break a uniqueness guarantee."""
+
+
+class SeriesRepository(ABC):
+    @abstractmethod
+    def new_id(self):
+        """An id for a serie that is about to be inserted."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def insert(self, doc):
+        """Store `doc` (which carries its `_id`) and return it."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def get(self, serie_id):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_many(self, serie_ids):
+        """`{id: serie}` for the ids that exist."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def find(self, query=None):
+        """Series equal to every field of `query`."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_with_lessons(self, serie_id, fields):
+        """The serie with a `lessons` array (`_id` plus `fields` of each
+        lesson), in `serie_lessons` order; None when missing."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def search(self, keyword, limit):
+        """Published series sharing title tokens with `keyword`, most shared
+        tokens first."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def autocomplete(self, prefix, limit):
+        """`{"_id", "serie_title"}` of published series whose folded title
+        starts with `prefix`, alphabetically."""
+        raise NotImplementedError
+
+    def warm_up(self):
+        """Build in-process state (the autocomplete index) before the first
+        request needs it."""
+
+    @abstractmethod
+    def update(self, serie_id, changes, return_before=False):
+        """Set `changes`; the updated serie (or the one before the update),
+        None when missing."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def add_lessons(self, serie_id, lesson_ids, session=None):
+        """Append to `serie_lessons`; returns `{"_id", "serie_title",
+        "serie_sns"}`, or None when the serie is missing."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def remove_lessons(self, serie_id, lesson_ids, session=None):
+        raise NotImplementedError
+
+    @abstractmethod
+    def add_subscribers(self, serie_id, delta, require_topic=False, session=None):
+        """Add `delta` to `serie_subcribe_num`; returns `{"_id", "serie_sns"}`,
+        or None when the serie is missing (or has no topic and
+        `require_topic` is set)."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete_if_empty(self, serie_id, session=None):
+        """Delete and return the serie unless it still has lessons."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def exists(self, serie_id):
+        raise NotImplementedError
+
+
+class SubscriptionRepository(ABC):
+    @abstractmethod
+    def add(self, user_id, serie_id, session=None):
+        """Record the subscription; raises DuplicateError if it exists."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def remove(self, user_id, serie_id, session=None):
+        """Delete and return the subscription, or None."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def restore(self, subscription, session=None):
+        """Put back a subscription `remove` returned."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def series_for_user(self, user_id, skip, limit):
+        """The subscribed series, most recent subscription first; deleted
+        series are left out."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def subscribers(self, serie_id, limit, before=None):
+        """Newest-first `{"user_id", "createdAt"}`, older than `before`."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def remove_for_serie(self, serie_id, session=None):
+        raise NotImplementedError
+
+
+class LessonRepository(ABC):
+    @abstractmethod
+    def new_id(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    def insert(self, doc, session=None):
+        raise NotImplementedError
+
+    @abstractmethod
+    def insert_many(self, docs):
+        """Insert every doc independently; returns `{position: error}` for
+        the ones that failed."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def list_by_serie(self, serie_id):
+        raise NotImplementedError
+
+    @abstractmethod
+    def version(self, serie_id):
+        """`(count, max updatedAt, sum of VERSION)` of the serie's lessons;
+        the sum changes on every write, even within one millisecond."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def get(self, serie_id, lesson_id):
+        """The lesson, if it belongs to `serie_id`."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def update(self, serie_id, lesson_id, changes, return_before=False):
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete(self, serie_id, lesson_id, session=None):
+        """Delete and return the lesson, or None."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def pull_document(self, serie_id, lesson_id, url):
+        """Remove `url` from `lesson_documents`; False when the lesson or the
+        url is missing."""
+        raise NotImplementedError
+
+
+class UserRepository(ABC):
+    @abstractmethod
+    def upsert(self, user_id, changes, on_insert=None):
+        """Set `changes`, creating the user (with `on_insert` too) if needed."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def get(self, user_id):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_many(self, user_ids):
+        """`{id: user}` for the ids that exist."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def update(self, user_id, changes):
+        """The updated user, or None when missing."""
+        raise NotImplementedError
@@ -0,0 +1,156 @@
+"""Wrappers that add behaviour to any repository without touching the
+backends. Each one proxies every public method of the repository it wraps,
+so they stack: `Repositories.decorate` applies them to every aggregate.
+
+- `CachingRepository`: `get_many` through an `LRUCache`; writes evict the
+  document they were called for.
+- `MeteredRepository`: call counts and time per method (`RepositoryMetrics`).
+- `BudgetedRepository`: counts calls per request and warns (or raises) past
+  REPOSITORY_QUERY_BUDGET.
+"""
+import logging
+import os
+import time
+from threading import Lock
+
+logger = logging.getLogger(__name__)
+
+REPOSITORY_QUERY_BUDGET = int(os.environ.get("REPOSITORY_QUERY_BUDGET", "0"))
+REPOSITORY_QUERY_BUDGET_STRICT = str(os.environ.get("REPOSITORY_QUERY_BUDGET_STRICT", "false")).lower() in ("1", "true", "yes")
+
+
+class QueryBudgetExceeded(RuntimeError):
+    """Raised in strict mode when a request makes too many repository calls."""
+
+
+class _Proxy:
+    def __init__(self, name, inner):
+        self.name = name
+        self._inner = inner
+
+    def __getattr__(self, attr):
+        value = getattr(self._inner, attr)
+        if attr.startswith("_") or not callable(value):
+            return value
+
+        def call(*args, **kwargs):
+            return self._call(attr, value, args, kwargs)
+
+        call.__name__ = attr
+        # bound once; later lookups find it on the instance
+        setattr(self, attr, call)
+        return call
+
+    def _call(self, method, fn, args, kwargs):
+        return fn(*args, **kwargs)
+
+
+class CachingRepository(_Proxy):
+    """Serves `get_many` from `cache`; calling any of `writes` evicts the id
+    passed as its first argument once the call returns (or raises)."""
+
+    def __init__(self, name, inner, cache, writes):
+        super().__init__(name, inner)
+        self.cache = cache
+        self._writes = frozenset(writes)
+
+    def get_many(self, ids):
+        return self.cache.get_many([str(i) for i in ids], self._inner.get_many)
+
+    def _call(self, method, fn, args, kwargs):
+        if method not in self._writes:
+            return fn(*args, **kwargs)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            if args:
+                self.cache.delete(str(args[0]))
+
+
+class RepositoryMetrics:
+    """Per `(aggregate, method)` call count, error count and total seconds.
+    Observers registered with `subscribe` see every call as
+    `observer(aggregate, method, seconds, error)`."""
+
+    def __init__(self):
+        self._stats = {}
+        self._observers = []
+        self._lock = Lock()
+
+    def subscribe(self, observer):
+        # idempotent: an observer registered twice would count every call twice
+        if observer not in self._observers:
+            self._observers.append(observer)
+
+    def observe(self, aggregate, method, seconds, error=None):
+        with self._lock:
+            stats = self._stats.setdefault((aggregate, method), [0, 0, 0.0])
+            stats[0] += 1
+            stats[1] += error is not None
+            stats[2] += seconds
+        for observer in self._observers:
+            observer(aggregate, method, seconds, error)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                f"{aggregate}.{method}": {"calls": calls, "errors": errors, "seconds": round(seconds, 6)}
+                for (aggregate, method), (calls, errors, seconds) in sorted(self._stats.items())
+            }
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+
+class MeteredRepository(_Proxy):
+    def __init__(self, name, inner, metrics):
+        super().__init__(name, inner)
+        self.metrics = metrics
+
+    def _call(self, method, fn, args, kwargs):
+        start = time.perf_counter()
+        error = None
+        try:
+            return fn(*args, **kwargs)
+        except Exception as exc:
+            error = exc
+            raise
+        finally:
+            self.metrics.observe(self.name, method, time.perf_counter() - start, error)
+
+
+def _request_calls():
+    """The current request's call list, or None outside a request."""
+    from flask import g, has_request_context
+
+    if not has_request_context():
+        return None
+    calls = g.get("repository_calls")
+    if calls is None:
+        calls = g.repository_calls = []
+    return calls
+
+
+class BudgetedRepository(_Proxy):
+    """Records `aggregate.method` on `flask.g.repository_calls` and reports
+    the request once it goes over `budget` calls."""
+
+    def __init__(self, name, inner, budget, strict=False):
+        super().__init__(name, inner)
+        self.budget = budget
+        self.strict = strict
+
+    def _call(self, method, fn, args, kwargs):
+        calls = _request_calls()
+        if calls is not None:
+            calls.append(f"{self.name}.{method}")
+            if len(calls) > self.budget:
+                if self.strict:
+                    raise QueryBudgetExceeded(f"{len(calls)} repository calls, budget is {self.budget}: {calls}")
+                if len(calls) == self.budget + 1:
+                    from flask import request
+
+                    logger.warning("%s %s went over its repository budget of %d calls: %s",
+                                   request.method, request.path, self.budget, calls)
+        return fn(*args, **kwargs)
@@ -0,0 +1,228 @@
+"""Repositories over the local document stores (see app.utils.localstore).
+
+Documents have the same shape as in Mongo, with uuid string ids. There are
+no transactions: `session` is always None and the services compensate.
+Writes that depend on the current document go through the store's `modify`
+or guarded `delete`, so they are atomic like their single Mongo commands.
+"""
+from datetime import datetime, timezone
+from uuid import uuid4
+
+from app.repositories.base import (
+    VERSION,
+    DuplicateError,
+    LessonRepository,
+    SeriesRepository,
+    SubscriptionRepository,
+    UserRepository,
+)
+from app.utils.autocomplete import AUTOCOMPLETE_TTL, RefreshingPrefixIndex
+from app.utils.memstore import DuplicateIdError
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+_BUMP = {VERSION: 1}
+
+
+class LocalSeriesRepository(SeriesRepository):
+    def __init__(self, store, lessons):
+        self._store = store
+        self._lessons = lessons
+        # authoritative for a process-local store; a shared one is also
+        # written by other workers
+        self._titles = RefreshingPrefixIndex(self._published_titles, AUTOCOMPLETE_TTL if store.shared else None)
+
+    def _published_titles(self):
+        return ((s["_id"], s.get("serie_title", "")) for s in self._store.find({"isPublish": True}))
+
+    def new_id(self):
+        return str(uuid4())
+
+    def insert(self, doc):
+        serie = self._store.insert({**doc, VERSION: 1})
+        self._titles.sync(serie["_id"], serie)
+        return serie
+
+    def get(self, serie_id):
+        return self._store.get(serie_id)
+
+    def get_many(self, serie_ids):
+        return self._store.get_many(serie_ids)
+
+    def find(self, query=None):
+        return self._store.find(dict(query) if query else None)
+
+    def get_with_lessons(self, serie_id, fields):
+        serie = self._store.get(serie_id)
+        if serie is None:
+            return None
+        order = serie.get("serie_lessons") or []
+        found = self._lessons.get_many(order)
+        lessons = [
+            {"_id": lid, **{f: found[lid][f] for f in fields if f in found[lid]}}
+            for lid in order if lid in found
+        ]
+        return {**serie, "lessons": lessons}
+
+    def search(self, keyword, limit):
+        # the store ranks every matching title; drafts are skipped here, so
+        # ask for more until `limit` published ones are found or none are left
+        want = limit
+        while True:
+            matches = self._store.search("serie_title", keyword, want)
+            published = [s for s in matches if s.get("isPublish") is True]
+            if len(published) >= limit or len(matches) < want:
+                return published[:limit]
+            want *= 4
+
+    def autocomplete(self, prefix, limit):
+        return self._titles.complete(prefix, limit)
+
+    def warm_up(self):
+        self._titles.start()
+
+    def update(self, serie_id, changes, return_before=False):
+        before, serie = self._store.modify(serie_id, lambda serie: changes, inc=_BUMP)
+        if serie is None:
+            return None
+        self._titles.sync(serie_id, serie)
+        return before if return_before else serie
+
+    def add_lessons(self, serie_id, lesson_ids, session=None):
+        added, now = list(lesson_ids), _now()
+        _, serie = self._store.modify(
+            serie_id, lambda serie: {"serie_lessons": (serie.get("serie_lessons") or []) + added, "updatedAt": now},
+            inc=_BUMP)
+        return None if serie is None else {k: serie.get(k) for k in ("_id", "serie_title", "serie_sns")}
+
+    def remove_lessons(self, serie_id, lesson_ids, session=None):
+        removed, now = set(lesson_ids), _now()
+        self._store.modify(
+            serie_id,
+            lambda serie: {"serie_lessons": [lid for lid in serie.get("serie_lessons") or [] if lid not in removed],
+                           "updatedAt": now},
+            inc=_BUMP)
+
+    def add_subscribers(self, serie_id, delta, require_topic=False, session=None):
+        now = _now()
+        _, serie = self._store.modify(
+            serie_id, lambda serie: None if require_topic and not serie.get("serie_sns") else {"updatedAt": now},
+            inc={"serie_subcribe_num": delta, **_BUMP})
+        return None if serie is None else {"_id": serie["_id"], "serie_sns": serie.get("serie_sns")}
+
+    def delete_if_empty(self, serie_id, session=None):
+        serie = self._store.delete(serie_id, guard=lambda serie: not serie.get("serie_lessons"))
+        if serie is not None:
+            self._titles.sync(serie_id, None)
+        return serie
+
+    def exists(self, serie_id):
+        return serie_id in self._store
+
+
+def _subscription_id(user_id, serie_id):
+    # one subscription per (user, serie), like the unique Mongo index
+    return f"{user_id}\x1f{serie_id}"
+
+
+class LocalSubscriptionRepository(SubscriptionRepository):
+    def __init__(self, store, series):
+        self._store = store
+        self._series = series
+
+    def add(self, user_id, serie_id, session=None):
+        doc = {"_id": _subscription_id(user_id, serie_id), "user_id": user_id, "serie_id": serie_id, "createdAt": _now()}
+        try:
+            return self._store.insert(doc)
+        except DuplicateIdError:
+            raise DuplicateError(f"{user_id} already subscribed to {serie_id}") from None
+
+    def remove(self, user_id, serie_id, session=None):
+        return self._store.delete(_subscription_id(user_id, serie_id))
+
+    def restore(self, subscription, session=None):
+        self._store.insert(subscription)
+
+    def series_for_user(self, user_id, skip, limit):
+        subs = self._store.find({"user_id": user_id}, reverse=True, skip=skip, limit=limit)
+        found = self._series.get_many([sub["serie_id"] for sub in subs])
+        return [found[sub["serie_id"]] for sub in subs if sub["serie_id"] in found]
+
+    def subscribers(self, serie_id, limit, before=None):
+        subs = self._store.find(
+            {"serie_id": serie_id},
+            where=None if before is None else (lambda sub: sub["createdAt"] < before),
+            reverse=True,
+            limit=limit,
+        )
+        return [{"user_id": sub["user_id"], "createdAt": sub["createdAt"]} for sub in subs]
+
+    def remove_for_serie(self, serie_id, session=None):
+        self._store.delete_many({"serie_id": serie_id})
+
+
+class LocalLessonRepository(LessonRepository):
+    def __init__(self, store):
+        self._store = store
+
+    def new_id(self):
+        return str(uuid4())
+
+    def insert(self, doc, session=None):
+        return self._store.insert({**doc, VERSION: 1})
+
+    def insert_many(self, docs):
+        taken = set(self._store.insert_many([{**doc, VERSION: 1} for doc in docs]))
+        return {pos: "Duplicate _id" for pos, doc in enumerate(docs) if doc["_id"] in taken}
+
+    def list_by_serie(self, serie_id):
+        return self._store.find({"lesson_serie": serie_id})
+
+    def version(self, serie_id):
+        lessons = self._store.find({"lesson_serie": serie_id})
+        stamps = [l.get("updatedAt") for l in lessons if l.get("updatedAt") is not None]
+        return len(lessons), max(stamps) if stamps else None, sum(l.get(VERSION) or 0 for l in lessons)
+
+    def get(self, serie_id, lesson_id):
+        lesson = self._store.get(lesson_id)
+        return lesson if lesson is not None and lesson.get("lesson_serie") == serie_id else None
+
+    def update(self, serie_id, lesson_id, changes, return_before=False):
+        before, lesson = self._store.modify(
+            lesson_id, lambda lesson: changes if lesson.get("lesson_serie") == serie_id else None, inc=_BUMP)
+        if lesson is None:
+            return None
+        return before if return_before else lesson
+
+    def delete(self, serie_id, lesson_id, session=None):
+        return self._store.delete(lesson_id, guard=lambda lesson: lesson.get("lesson_serie") == serie_id)
+
+    def pull_document(self, serie_id, lesson_id, url):
+        def pull(lesson):
+            docs = lesson.get("lesson_documents") or []
+            if lesson.get("lesson_serie") != serie_id or url not in docs:
+                return None
+            return {"lesson_documents": [d for d in docs if d != url], "updatedAt": now}
+
+        now = _now()
+        return self._store.modify(lesson_id, pull, inc=_BUMP)[1] is not None
+
+
+class LocalUserRepository(UserRepository):
+    def __init__(self, store):
+        self._store = store
+
+    def upsert(self, user_id, changes, on_insert=None):
+        return self._store.upsert(user_id, changes, on_insert=on_insert, inc=_BUMP)
+
+    def get(self, user_id):
+        return self._store.get(user_id)
+
+    def get_many(self, user_ids):
+        return self._store.get_many(user_ids)
+
+    def update(self, user_id, changes):
+        return self._store.update(user_id, changes, inc=_BUMP)
@@ -0,0 +1,337 @@
+"""MongoDB repositories.
+
+Every method is one round trip; the services' "Round trips: N" docstrings
+count calls into this module. Ids and the references between documents are
+stored as ObjectIds and accepted in either form (see app.utils.ids).
+"""
+from datetime import datetime, timezone
+
+from pymongo import ReturnDocument
+
+from app.repositories.base import (
+    VERSION,
+    DuplicateError,
+    LessonRepository,
+    SeriesRepository,
+    SubscriptionRepository,
+    UserRepository,
+)
+from app.utils import ids
+from app.utils.autocomplete import AUTOCOMPLETE_TTL, RefreshingPrefixIndex
+from app.utils.search import SEARCH_CANDIDATES, tokenize
+
+# Internal search field kept off API responses.
+_HIDDEN_FIELDS = ("serie_title_tokens",)
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+def _hidden():
+    # a fresh projection each call: drivers and mocks may annotate the mapping
+    return {f: 0 for f in _HIDDEN_FIELDS}
+
+
+def _versioned(update):
+    """`update` plus the VERSION increment, so the bump costs no extra command."""
+    return {**update, "$inc": {**update.get("$inc", {}), VERSION: 1}}
+
+
+def _serie_oid(serie_id):
+    return ids.require(serie_id, "Serie not found")
+
+
+class MongoSeriesRepository(SeriesRepository):
+    def __init__(self, db):
+        self._col = db.get_collection("series")
+        # Published-title prefix index, rebuilt in the background every
+        # AUTOCOMPLETE_TTL seconds to pick up writes made by other workers.
+        self._titles = RefreshingPrefixIndex(self._published_titles, AUTOCOMPLETE_TTL)
+
+    def _published_titles(self):
+        cursor = self._col.find({"isPublish": True}, {"serie_title": 1})
+        return ((d["_id"], d.get("serie_title", "")) for d in cursor)
+
+    def new_id(self):
+        return ids.new_id()
+
+    def insert(self, doc):
+        doc = {**doc, VERSION: 1}
+        self._col.insert_one({**doc, "serie_title_tokens": tokenize(doc.get("serie_title"))})
+        self._titles.sync(ids.to_str(doc["_id"]), doc)
+        return doc
+
+    def get(self, serie_id):
+        oid = ids.parse(serie_id)
+        if oid is None:
+            return None
+        return self._col.find_one({"_id": oid}, _hidden())
+
+    def get_many(self, serie_ids):
+        oids = ids.parse_many(serie_ids)
+        if not oids:
+            return {}
+        return {ids.to_str(s["_id"]): s for s in self._col.find({"_id": {"$in": oids}}, _hidden())}
+
+    def find(self, query=None):
+        return list(self._col.find(dict(query) if query else {}, _hidden()))
+
+    def get_with_lessons(self, serie_id, fields):
+        oid = ids.parse(serie_id)
+        if oid is None:
+            return None
+        summary = {"_id": "$$l._id", **{f: f"$$l.{f}" for f in fields}}
+        rows = list(self._col.aggregate([
+            {"$match": {"_id": oid}},
+            {"$project": _hidden()},
+            {"$lookup": {"from": "lessons", "localField": "serie_lessons", "foreignField": "_id", "as": "lessons"}},
+            {"$addFields": {"lessons": {"$map": {"input": "$lessons", "as": "l", "in": summary}}}},
+        ]))
+        if not rows:
+            return None
+        serie = rows[0]
+        # $lookup does not preserve the order of the local array
+        position = {lid: i for i, lid in enumerate(serie.get("serie_lessons") or [])}
+        serie["lessons"].sort(key=lambda l: position.get(l["_id"], len(position)))
+        return serie
+
+    def search(self, keyword, limit):
+        terms = tokenize(keyword)
+        if not terms:
+            return []
+        # one window per term, the most subscribed titles read in order from
+        # the (serie_title_tokens, isPublish, serie_subcribe_num, _id) index:
+        # a rare term's titles are all scored however common the others are,
+        # and the windows together stay within SEARCH_CANDIDATES
+        window = max(limit, SEARCH_CANDIDATES // len(terms))
+        found = {}
+        for term in terms:
+            # the tokens are read for scoring and stripped below
+            for serie in (self._col.find({"serie_title_tokens": term, "isPublish": True})
+                          .sort([("serie_subcribe_num", -1), ("_id", 1)]).limit(window)):
+                found.setdefault(serie["_id"], serie)
+        wanted = set(terms)
+
+        def rank(serie):
+            # shared terms first, as InvertedIndex and SQLiteStore rank
+            score = len(wanted.intersection(serie.get("serie_title_tokens") or ()))
+            return -score, -(serie.get("serie_subcribe_num") or 0), serie["_id"]
+
+        best = sorted(found.values(), key=rank)[:limit]
+        for serie in best:
+            for field in _HIDDEN_FIELDS:
+                serie.pop(field, None)
+        return best
+
+    def autocomplete(self, prefix, limit):
+        return self._titles.complete(prefix, limit)
+
+    def warm_up(self):
+        self._titles.start()
+
+    def update(self, serie_id, changes, return_before=False):
+        oid = ids.parse(serie_id)
+        if oid is None:
+            return None
+        update = dict(changes)
+        if "serie_title" in update:
+            update["serie_title_tokens"] = tokenize(update["serie_title"])
+        doc = self._col.find_one_and_update(
+            {"_id": oid},
+            _versioned({"$set": update}),
+            projection=_hidden(),
+            return_document=ReturnDocument.BEFORE if return_before else ReturnDocument.AFTER,
+        )
+        if doc is not None:
+            self._titles.sync(ids.to_str(oid), {**doc, **changes} if return_before else doc)
+        return doc
+
+    def add_lessons(self, serie_id, lesson_ids, session=None):
+        # registers the ids and reads back what notifications need in one command
+        return self._col.find_one_and_update(
+            {"_id": _serie_oid(serie_id)},
+            _versioned({"$push": {"serie_lessons": {"$each": ids.parse_many(lesson_ids)}}, "$set": {"updatedAt": _now()}}),
+            projection={"serie_title": 1, "serie_sns": 1},
+            session=session,
+        )
+
+    def remove_lessons(self, serie_id, lesson_ids, session=None):
+        oid = ids.parse(serie_id)
+        if oid is not None:
+            self._col.update_one(
+                {"_id": oid},
+                _versioned({"$pull": {"serie_lessons": {"$in": ids.parse_many(lesson_ids)}}, "$set": {"updatedAt": _now()}}),
+                session=session,
+            )
+
+    def add_subscribers(self, serie_id, delta, require_topic=False, session=None):
+        query = {"_id": _serie_oid(serie_id)}
+        if require_topic:
+            query["serie_sns"] = {"$nin": [None, ""]}
+        return self._col.find_one_and_update(
+            query,
+            _versioned({"$inc": {"serie_subcribe_num": delta}, "$set": {"updatedAt": _now()}}),
+            projection={"serie_sns": 1},
+            session=session,
+        )
+
+    def delete_if_empty(self, serie_id, session=None):
+        oid = _serie_oid(serie_id)
+        serie = self._col.find_one_and_delete({"_id": oid, "serie_lessons.0": {"$exists": False}}, session=session)
+        if serie is not None:
+            self._titles.sync(ids.to_str(oid), None)
+        return serie
+
+    def exists(self, serie_id):
+        oid = ids.parse(serie_id)
+        return oid is not None and self._col.find_one({"_id": oid}, {"_id": 1}) is not None
+
+
+class MongoSubscriptionRepository(SubscriptionRepository):
+    """One document per (user, serie); the unique index on the pair is the
+    "already subscribed" check."""
+
+    def __init__(self, db):
+        self._col = db.get_collection("subscriptions")
+
+    def add(self, user_id, serie_id, session=None):
+        from pymongo.errors import DuplicateKeyError
+
+        doc = {"user_id": user_id, "serie_id": _serie_oid(serie_id), "createdAt": _now()}
+        try:
+            self._col.insert_one(doc, session=session)
+        except DuplicateKeyError:
+            raise DuplicateError(f"{user_id} already subscribed to {serie_id}") from None
+        return doc
+
+    def remove(self, user_id, serie_id, session=None):
+        return self._col.find_one_and_delete({"user_id": user_id, "serie_id": _serie_oid(serie_id)}, session=session)
+
+    def restore(self, subscription, session=None):
+        self._col.insert_one(subscription, session=session)
+
+    def series_for_user(self, user_id, skip, limit):
+        return list(self._col.aggregate([
+            # served in order by the (user_id, createdAt, _id) index
+            {"$match": {"user_id": user_id}},
+            {"$sort": {"createdAt": -1, "_id": -1}},
+            {"$skip": skip},
+            {"$limit": limit},
+            {"$lookup": {"from": "series", "localField": "serie_id", "foreignField": "_id", "as": "serie"}},
+            # drops subscriptions whose serie has since been deleted
+            {"$unwind": "$serie"},
+            {"$replaceRoot": {"newRoot": "$serie"}},
+            {"$project": _hidden()},
+        ]))
+
+    def subscribers(self, serie_id, limit, before=None):
+        query = {"serie_id": _serie_oid(serie_id)}
+        if before is not None:
+            query["createdAt"] = {"$lt": before}
+        cursor = self._col.find(query, {"_id": 0, "user_id": 1, "createdAt": 1})
+        return list(cursor.sort([("createdAt", -1), ("_id", -1)]).limit(limit))
+
+    def remove_for_serie(self, serie_id, session=None):
+        self._col.delete_many({"serie_id": _serie_oid(serie_id)}, session=session)
+
+
+class MongoLessonRepository(LessonRepository):
+    def __init__(self, db):
+        self._col = db.get_collection("lessons")
+
+    @staticmethod
+    def _filter(serie_id, lesson_id):
+        lesson_oid, serie_oid = ids.parse(lesson_id), ids.parse(serie_id)
+        if lesson_oid is None or serie_oid is None:
+            return None
+        return {"_id": lesson_oid, "lesson_serie": serie_oid}
+
+    @staticmethod
+    def _stored(doc):
+        return {**doc, "lesson_serie": _serie_oid(doc["lesson_serie"]), VERSION: 1}
+
+    def new_id(self):
+        return ids.new_id()
+
+    def insert(self, doc, session=None):
+        self._col.insert_one(self._stored(doc), session=session)
+        return {**doc, VERSION: 1}
+
+    def insert_many(self, docs):
+        from pymongo.errors import BulkWriteError
+
+        try:
+            self._col.insert_many([self._stored(doc) for doc in docs], ordered=False)
+        except BulkWriteError as exc:
+            return {e["index"]: e.get("errmsg", "Insert failed") for e in exc.details.get("writeErrors", [])}
+        return {}
+
+    def list_by_serie(self, serie_id):
+        oid = ids.parse(serie_id)
+        return [] if oid is None else list(self._col.find({"lesson_serie": oid}))
+
+    def version(self, serie_id):
+        oid = ids.parse(serie_id)
+        if oid is None:
+            return 0, None, 0
+        rows = list(self._col.aggregate([
+            {"$match": {"lesson_serie": oid}},
+            {"$group": {"_id": None, "count": {"$sum": 1}, "updatedAt": {"$max": "$updatedAt"},
+                        "versions": {"$sum": f"${VERSION}"}}},
+        ]))
+        if not rows:
+            return 0, None, 0
+        return rows[0]["count"], rows[0]["updatedAt"], rows[0]["versions"]
+
+    def get(self, serie_id, lesson_id):
+        query = self._filter(serie_id, lesson_id)
+        return None if query is None else self._col.find_one(query)
+
+    def update(self, serie_id, lesson_id, changes, return_before=False):
+        query = self._filter(serie_id, lesson_id)
+        if query is None:
+            return None
+        return self._col.find_one_and_update(
+            query,
+            _versioned({"$set": changes}),
+            return_document=ReturnDocument.BEFORE if return_before else ReturnDocument.AFTER,
+        )
+
+    def delete(self, serie_id, lesson_id, session=None):
+        query = self._filter(serie_id, lesson_id)
+        return None if query is None else self._col.find_one_and_delete(query, session=session)
+
+    def pull_document(self, serie_id, lesson_id, url):
+        query = self._filter(serie_id, lesson_id)
+        if query is None:
+            return False
+        pulled = self._col.find_one_and_update(
+            {**query, "lesson_documents": url},
+            _versioned({"$pull": {"lesson_documents": url}, "$set": {"updatedAt": _now()}}),
+            projection={"_id": 1},
+        )
+        return pulled is not None
+
+
+class MongoUserRepository(UserRepository):
+    """Users are keyed by their Cognito id."""
+
+    def __init__(self, db):
+        self._col = db.get_collection("users")
+
+    def upsert(self, user_id, changes, on_insert=None):
+        update = _versioned({"$set": changes})
+        if on_insert:
+            update["$setOnInsert"] = on_insert
+        return self._col.find_one_and_update({"_id": user_id}, update, upsert=True, return_document=ReturnDocument.AFTER)
+
+    def get(self, user_id):
+        return self._col.find_one({"_id": user_id})
+
+    def get_many(self, user_ids):
+        return {u["_id"]: u for u in self._col.find({"_id": {"$in": list(user_ids)}})}
+
+    def update(self, user_id, changes):
+        return self._col.find_one_and_update({"_id": user_id}, _versioned({"$set": changes}),
+                                             return_document=ReturnDocument.AFTER)
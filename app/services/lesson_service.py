@@ -1,176 +1,245 @@
-"""Lesson service that uses MongoDB when available, otherwise in-memory fallback.
-This ports the Node.js lesson.service.js behavior (uploading files, publishing SNS notifications,
-and updating the series' lesson list).
+"""Lesson service: business rules over the lessons and series repositories
+(app.repositories). This ports the Node.js lesson.service.js behavior
+(uploading files, publishing SNS notifications, and updating the series'
+lesson list).
+
+Mongo round trips per write are noted on each function (happy path) and
+asserted by tests/test_round_trips.py.
 """
+import os
+from datetime import datetime, timezone
 from uuid import uuid4
-from app.utils.mongodb import connect_to_database
+from app.repositories import VERSION, get_repositories
+from app.utils import ids
 from app.utils.s3 import upload_via_cloudfront, delete_via_cloudfront
 from app.utils.sns import publish_to_topic
+from app.utils.tracing import traced
+
+MAX_BULK_LESSONS = int(os.environ.get("MAX_BULK_LESSONS", "500"))
+# set by the service, never taken from a bulk payload
+_BULK_RESERVED = ("_id", "lesson_serie", "createdAt", "updatedAt", VERSION)
+# titles listed in a bulk import's digest notification
+_DIGEST_TITLES = 5
+
+
+def _repos():
+    return get_repositories()
+
 
-_LESSONS = {}
+def _now():
+    return datetime.now(timezone.utc)
 
 
-def _db():
-    return connect_to_database()
+def _files(files, key):
+    """All uploads under `key` from a werkzeug MultiDict or a plain dict."""
+    if not files:
+        return []
+    if hasattr(files, "getlist"):
+        return files.getlist(key)
+    found = files.get(key)
+    if not found:
+        return []
+    return list(found) if isinstance(found, (list, tuple)) else [found]
 
 
+@traced
 def create_lesson(data, user_id=None, id_token=None, files=None):
-    db = _db()
+    """Round trips: 2 (serie find_one_and_update, lesson insert), in one
+    transaction where supported."""
     video_url = ""
     document_urls = []
     # normalize files for two styles: werkzeug FileStorage or dict-like
-    if files:
-        # files might be a dict with keys 'lesson_video' and 'lesson_documents'
-        video = files.get("lesson_video") if hasattr(files, 'get') else None
-        docs = files.get("lesson_documents") if hasattr(files, 'get') else None
-        if video:
-            vf = video[0] if isinstance(video, (list, tuple)) else video
-            buffer = vf.read()
-            video_url = upload_via_cloudfront(id_token, buffer, f"{uuid4()}_{getattr(vf,'filename','video')}", getattr(vf, 'mimetype', None), f"files/user-{user_id}/videos")
-        if docs:
-            doc_files = docs if isinstance(docs, (list, tuple)) else [docs]
-            for doc in doc_files:
-                buf = doc.read()
-                document_urls.append(upload_via_cloudfront(id_token, buf, f"{uuid4()}_{getattr(doc,'filename','doc')}", getattr(doc, 'mimetype', None), f"files/user-{user_id}/docs"))
-
-    if db:
-        lesson_col = db.collection("lessons")
-        series_col = db.collection("series")
-        new_lesson = {**data, "lesson_video": video_url, "lesson_documents": document_urls, "createdAt": None, "updatedAt": None}
-        result = lesson_col.insert_one(new_lesson)
-        lesson_id = result.inserted_id
-        # push lesson id to series
-        series_col.update_one({"_id": data.get("lesson_serie")}, {"$push": {"serie_lessons": lesson_id}})
-        serie = series_col.find_one({"_id": data.get("lesson_serie")})
-        custom_message = f"Bài học mới \"{new_lesson.get('lesson_title')}\" đã được thêm vào series \"{serie.get('serie_title') if serie else ''}\". Truy cập ngay để xem nội dung!"
-        if serie and serie.get("serie_sns"):
-            publish_to_topic(serie.get("serie_sns"), f"New Lesson in \"{serie.get('serie_title')}\"", custom_message)
-        return {"_id": str(lesson_id), **new_lesson}
-
-    # fallback in-memory
+    video = _files(files, "lesson_video")
+    if video:
+        vf = video[0]
+        video_url = upload_via_cloudfront(id_token, vf, f"{uuid4()}_{getattr(vf,'filename','video')}", getattr(vf, 'mimetype', None), f"files/user-{user_id}/videos")
+    for doc in _files(files, "lesson_documents"):
+        document_urls.append(upload_via_cloudfront(id_token, doc, f"{uuid4()}_{getattr(doc,'filename','doc')}", getattr(doc, 'mimetype', None), f"files/user-{user_id}/docs"))
+
+    repos = _repos()
     series_id = data.get("lesson_serie")
     if not series_id:
         raise ValueError("lesson_serie is required")
-    lid = str(uuid4())
-    lesson = {"_id": lid, **data, "created_by": user_id, "lesson_video": video_url, "lesson_documents": document_urls}
-    series_lessons = _LESSONS.setdefault(series_id, {})
-    series_lessons[lid] = lesson
-    return lesson
+    now = _now()
+    lesson_id = repos.lessons.new_id()
+    new_lesson = {**data, "_id": lesson_id, "lesson_video": video_url, "lesson_documents": document_urls, "createdAt": now, "updatedAt": now}
+
+    def _create(session):
+        # register the pre-generated id on the serie and read back what the
+        # notification needs in the same command
+        serie = repos.series.add_lessons(series_id, [lesson_id], session=session)
+        if serie is None:
+            raise ValueError("Serie not found")
+        try:
+            repos.lessons.insert(new_lesson, session=session)
+        except Exception:
+            if session is None:
+                repos.series.remove_lessons(series_id, [lesson_id])
+            raise
+        return serie
+
+    serie = repos.transaction(_create)
+    custom_message = f"Bài học mới \"{new_lesson.get('lesson_title')}\" đã được thêm vào series \"{serie.get('serie_title')}\". Truy cập ngay để xem nội dung!"
+    if serie.get("serie_sns"):
+        publish_to_topic(serie.get("serie_sns"), f"New Lesson in \"{serie.get('serie_title')}\"", custom_message)
+    return {**new_lesson, "_id": ids.to_str(lesson_id)}
+
+
+def _validate_bulk_lesson(item):
+    """Return an error message for an unusable bulk item, else None."""
+    if not isinstance(item, dict):
+        return "Lesson must be a JSON object"
+    title = item.get("lesson_title")
+    if not isinstance(title, str) or not title.strip():
+        return "lesson_title is required"
+    return None
+
+
+def _notify_bulk(serie, lessons):
+    if not serie or not serie.get("serie_sns") or not lessons:
+        return
+    titles = ", ".join(f"\"{l.get('lesson_title')}\"" for l in lessons[:_DIGEST_TITLES])
+    if len(lessons) > _DIGEST_TITLES:
+        titles += f" và {len(lessons) - _DIGEST_TITLES} bài khác"
+    message = f"{len(lessons)} bài học mới đã được thêm vào series \"{serie.get('serie_title')}\": {titles}. Truy cập ngay để xem nội dung!"
+    publish_to_topic(serie.get("serie_sns"), f"New Lessons in \"{serie.get('serie_title')}\"", message)
+
+
+@traced
+def create_lessons_bulk(series_id, items, user_id=None):
+    """Create many JSON-only lessons (no uploads) in one serie.
+
+    Every item is validated before anything is written; invalid items are
+    skipped. Returns one `{"index", "status", "_id" | "error"}` result per
+    item, in input order, with status "created", "invalid" or "failed".
+    Raises ValueError("Serie not found").
+
+    Round trips: 2 (serie $push $each, lessons insert_many). Not
+    transactional: items fail independently, and the ids of lessons that
+    failed to insert are pulled back off the serie (one more round trip).
+    """
+    items = list(items)
+    results = [None] * len(items)
+    valid = []
+    for index, item in enumerate(items):
+        error = _validate_bulk_lesson(item)
+        if error:
+            results[index] = {"index": index, "status": "invalid", "error": error}
+        else:
+            valid.append((index, {k: v for k, v in item.items() if k not in _BULK_RESERVED}))
+
+    repos = _repos()
+    now = _now()
+    lessons = [
+        {**data, "_id": repos.lessons.new_id(), "lesson_serie": series_id, "lesson_video": data.get("lesson_video", ""),
+         "lesson_documents": data.get("lesson_documents", []), "createdAt": now, "updatedAt": now}
+        for _, data in valid
+    ]
+    serie = repos.series.add_lessons(series_id, [l["_id"] for l in lessons])
+    if serie is None:
+        raise ValueError("Serie not found")
+    failed = repos.lessons.insert_many(lessons) if lessons else {}
+    if failed:
+        repos.series.remove_lessons(series_id, [lessons[i]["_id"] for i in failed])
+    created = []
+    for pos, (index, _) in enumerate(valid):
+        if pos in failed:
+            results[index] = {"index": index, "status": "failed", "error": failed[pos]}
+        else:
+            results[index] = {"index": index, "status": "created", "_id": ids.to_str(lessons[pos]["_id"])}
+            created.append(lessons[pos])
+    _notify_bulk(serie, created)
+    return results
+
+
+@traced
+def get_all_lessons_by_serie(series_id):
+    return _repos().lessons.list_by_serie(series_id)
 
 
-def get_all_lessons_by_serie(series_id):
-    db = _db()
-    if db:
-        lesson_col = db.collection("lessons")
-        return list(lesson_col.find({"lesson_serie": series_id}))
-    return list(_LESSONS.get(series_id, {}).values())
+@traced
+def get_lessons_version(series_id):
+    """Return `(count, max updatedAt, sum of versions)` for a serie's lessons;
+    enough to derive a list ETag without fetching the lessons themselves."""
+    return _repos().lessons.version(series_id)
 
 
+@traced
 def get_lesson_by_id(series_id, lesson_id):
-    db = _db()
-    if db:
-        lesson_col = db.collection("lessons")
-        try:
-            from bson import ObjectId
-            return lesson_col.find_one({"_id": ObjectId(lesson_id), "lesson_serie": series_id})
-        except Exception:
-            return None
-    return _LESSONS.get(series_id, {}).get(lesson_id)
+    return _repos().lessons.get(series_id, lesson_id)
 
 
+@traced
 def update_lesson(series_id, lesson_id, data, user_id=None, id_token=None, files=None):
-    db = _db()
+    """Round trips: 1 (find_one_and_update). New files are uploaded first and
+    the replaced ones deleted from the pre-image the update returns."""
+    lessons = _repos().lessons
     data = dict(data or {})
-    if db:
-        lesson_col = db.collection("lessons")
-        data["updatedAt"] = None
-        current = lesson_col.find_one({"_id": lesson_id}) if isinstance(lesson_id, str) else lesson_col.find_one({"_id": lesson_id})
-        # note: this simple translation assumes caller provides proper ids; implement full ObjectId handling when wiring DB
-        if not current:
-            return None
-        # handle file uploads similar to create_lesson
-        if files and files.get("lesson_video"):
-            # delete old video
-            if current.get("lesson_video"):
-                delete_via_cloudfront(current.get("lesson_video"))
-            vf = files.get("lesson_video")[0]
-            buf = vf.read()
-            data["lesson_video"] = upload_via_cloudfront(id_token, buf, f"{uuid4()}_{getattr(vf,'filename','video')}", getattr(vf, 'mimetype', None), f"files/user-{user_id}/videos")
-        if files and files.get("lesson_documents"):
-            # delete old docs
-            if current.get("lesson_documents"):
-                docs = current.get("lesson_documents")
-                for doc_url in docs:
-                    delete_via_cloudfront(doc_url)
-            doc_urls = []
-            for df in files.get("lesson_documents"):
-                buf = df.read()
-                doc_urls.append(upload_via_cloudfront(id_token, buf, f"{uuid4()}_{getattr(df,'filename','doc')}", getattr(df, 'mimetype', None), f"files/user-{user_id}/docs"))
-            data["lesson_documents"] = doc_urls
-        update_result = lesson_col.update_one({"_id": lesson_id}, {"$set": data})
-        if update_result.matched_count == 0:
-            return None
-        return lesson_col.find_one({"_id": lesson_id})
-
-    series_lessons = _LESSONS.get(series_id, {})
-    if lesson_id not in series_lessons:
+    data["updatedAt"] = _now()
+    for k in ("_id", "lesson_serie", "createdAt", VERSION):
+        data.pop(k, None)
+    new_video = _files(files, "lesson_video")
+    new_docs = _files(files, "lesson_documents")
+    if new_video:
+        vf = new_video[0]
+        data["lesson_video"] = upload_via_cloudfront(id_token, vf, f"{uuid4()}_{getattr(vf,'filename','video')}", getattr(vf, 'mimetype', None), f"files/user-{user_id}/videos")
+    if new_docs:
+        doc_urls = []
+        for df in new_docs:
+            doc_urls.append(upload_via_cloudfront(id_token, df, f"{uuid4()}_{getattr(df,'filename','doc')}", getattr(df, 'mimetype', None), f"files/user-{user_id}/docs"))
+        data["lesson_documents"] = doc_urls
+    if not new_video and not new_docs:
+        return lessons.update(series_id, lesson_id, data)
+
+    before = lessons.update(series_id, lesson_id, data, return_before=True)
+    if before is None:
+        # nothing to attach the fresh uploads to
+        for url in [data.get("lesson_video")] + data.get("lesson_documents", []):
+            if url:
+                delete_via_cloudfront(url)
         return None
-    series_lessons[lesson_id].update(data)
-    return series_lessons[lesson_id]
+    if new_video and before.get("lesson_video"):
+        delete_via_cloudfront(before.get("lesson_video"))
+    if new_docs:
+        for doc_url in before.get("lesson_documents") or []:
+            delete_via_cloudfront(doc_url)
+    return {**before, **data}
 
 
+@traced
 def delete_lesson(series_id, lesson_id):
-    db = _db()
-    if db:
-        lesson_col = db.collection("lessons")
-        # find and delete
-        try:
-            from bson import ObjectId
-            lesson = lesson_col.find_one({"_id": ObjectId(lesson_id), "lesson_serie": series_id})
-            if not lesson:
-                raise ValueError("Lesson không tồn tại.")
-            result = lesson_col.delete_one({"_id": ObjectId(lesson_id), "lesson_serie": series_id})
-            if result.deleted_count > 0:
-                series_col = db.collection("series")
-                series_col.update_one({"_id": ObjectId(series_id)}, {"$pull": {"serie_lessons": ObjectId(lesson_id)}})
-                if lesson.get("lesson_video"):
-                    delete_via_cloudfront(lesson.get("lesson_video"))
-                if isinstance(lesson.get("lesson_documents"), list):
-                    for doc in lesson.get("lesson_documents"):
-                        delete_via_cloudfront(doc)
-                elif lesson.get("lesson_documents"):
-                    delete_via_cloudfront(lesson.get("lesson_documents"))
-            return result.deleted_count > 0
-        except Exception as e:
-            raise e
-    series_lessons = _LESSONS.get(series_id, {})
-    return series_lessons.pop(lesson_id, None)
+    """Round trips: 2 (lesson find_one_and_delete, serie $pull), in one
+    transaction where supported. Raises ValueError when the lesson does not
+    exist."""
+    repos = _repos()
+
+    def _delete(session):
+        lesson = repos.lessons.delete(series_id, lesson_id, session=session)
+        if lesson:
+            repos.series.remove_lessons(series_id, [lesson["_id"]], session=session)
+        return lesson
+
+    lesson = repos.transaction(_delete)
+    if not lesson:
+        raise ValueError("Lesson không tồn tại.")
+    if lesson.get("lesson_video"):
+        delete_via_cloudfront(lesson.get("lesson_video"))
+    if isinstance(lesson.get("lesson_documents"), list):
+        for doc in lesson.get("lesson_documents"):
+            delete_via_cloudfront(doc)
+    elif lesson.get("lesson_documents"):
+        delete_via_cloudfront(lesson.get("lesson_documents"))
+    return True
 
 
+@traced
 def delete_document_by_url(series_id, lesson_id, doc_url):
-    db = _db()
-    if db:
-        lesson_col = db.collection("lessons")
-        try:
-            from bson import ObjectId
-            lesson = lesson_col.find_one({"_id": ObjectId(lesson_id), "lesson_serie": series_id})
-            if not lesson:
-                raise ValueError("Lesson không tồn tại.")
-            docs = lesson.get("lesson_documents", [])
-            if doc_url not in docs:
-                raise ValueError("Document URL không tồn tại trong lesson.")
-            # delete file
-            delete_via_cloudfront(doc_url)
-            updated = [d for d in docs if d != doc_url]
-            lesson_col.update_one({"_id": ObjectId(lesson_id), "lesson_serie": series_id}, {"$set": {"lesson_documents": updated, "updatedAt": None}})
-            return True
-        except Exception as e:
-            raise e
-    lesson = get_lesson_by_id(series_id, lesson_id)
-    if not lesson:
-        raise ValueError("Lesson không tồn tại.")
-    docs = lesson.get("lesson_documents", [])
-    if doc_url not in docs:
+    """Round trips: 1 (conditional $pull); a second find_one only tells the
+    two failure cases apart."""
+    lessons = _repos().lessons
+    if not lessons.pull_document(series_id, lesson_id, doc_url):
+        if lessons.get(series_id, lesson_id) is None:
+            raise ValueError("Lesson không tồn tại.")
         raise ValueError("Document URL không tồn tại trong lesson.")
-    lesson["lesson_documents"] = [d for d in docs if d != doc_url]
+    delete_via_cloudfront(doc_url)
     return True
@@ -1,229 +1,262 @@
-"""Serie service that uses MongoDB when available, otherwise falls back to in-memory storage.
-This ports the logic from the original Node.js implementation (uploading thumbnails, SNS topic management,
-and updating MongoDB collections).
+"""Serie service: business rules over the series and subscriptions
+repositories (app.repositories), which hold the Mongo and local store
+implementations. This ports the logic from the original Node.js implementation
+(uploading thumbnails, SNS topic management, and updating the collections).
+
+Mongo round trips per write are noted on each function (happy path) and
+asserted by tests/test_round_trips.py.
 """
+from datetime import datetime, timezone
 from uuid import uuid4
-from app.utils.mongodb import connect_to_database
+from app.repositories import VERSION, DuplicateError, get_repositories
+from app.utils import ids
 from app.utils.s3 import upload_via_cloudfront, delete_via_cloudfront
 from app.utils.sns import create_topic, delete_topic, subscribe_to_serie, unsubscribe_from_topic
+from app.utils.tracing import traced
+from app.utils.search import tokenize
+from app.utils.batch import project
+
+SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 100
+AUTOCOMPLETE_LIMIT = 10
+MAX_AUTOCOMPLETE_LIMIT = 20
+SUBSCRIBED_LIMIT = 50
+MAX_SUBSCRIBED_LIMIT = 100
+
+
+def _repos():
+    return get_repositories()
+
 
-_SERIES = {}
-_SUBSCRIPTIONS = {}
+def _now():
+    return datetime.now(timezone.utc)
 
 
-def _db():
-    return connect_to_database()
+def _coerce_publish(data):
+    if isinstance(data.get("isPublish"), str):
+        data["isPublish"] = data["isPublish"].lower() == "true"
 
 
+def _upload_thumbnail(file, user_id, id_token):
+    unique_name = f"{uuid4()}_{getattr(file, 'filename', 'file')}"
+    # streamed to S3 when it is a file object (see upload_via_cloudfront)
+    buffer = file if hasattr(file, "read") else None
+    mimetype = getattr(file, 'mimetype', None) or getattr(file, 'content_type', None)
+    return upload_via_cloudfront(id_token, buffer, unique_name, mimetype, f"files/user-{user_id}/thumbnail")
+
+
+@traced
 def create_serie(data, user_id=None, id_token=None, file=None):
-    db = _db()
-    # if we have a real DB, run Mongo logic similar to Node
-    if db:
-        series_col = db.collection("series")
-        image_url = ""
-        if file:
-            unique_name = f"{uuid4()}_{getattr(file, 'filename', 'file')}"
-            buffer = getattr(file, 'read', lambda: None)()
-            mimetype = getattr(file, 'mimetype', None) or getattr(file, 'content_type', None)
-            image_url = upload_via_cloudfront(id_token, buffer, unique_name, mimetype, f"files/user-{user_id}/thumbnail")
-
-        new_serie = {
-            **data,
-            "serie_thumbnail": image_url,
-            "isPublish": data.get("isPublish", False),
-            "serie_user": user_id,
-            "serie_lessons": data.get("serie_lessons", []),
-            "createdAt": None,
-            "updatedAt": None,
-            "serie_subcribe_num": 0,
-        }
-        result = series_col.insert_one(new_serie)
-        inserted_id = str(result.inserted_id)
-        topic_arn = create_topic(f"serie_{inserted_id}")
-        series_col.update_one({"_id": result.inserted_id}, {"$set": {"serie_sns": topic_arn}})
-        return {"_id": inserted_id, **new_serie, "serie_sns": topic_arn}
-
-    # fallback: in-memory
-    serie_id = str(uuid4())
-    serie = {"_id": serie_id, **data, "created_by": user_id}
-    _SERIES[serie_id] = serie
-    return serie
+    """Round trips: 1 (insert; the id is generated up front so the SNS topic
+    can be named before the document is written)."""
+    repos = _repos()
+    data = dict(data)
+    _coerce_publish(data)
+    image_url = _upload_thumbnail(file, user_id, id_token) if file else ""
+    now = _now()
+    serie_id = repos.series.new_id()
+    topic_arn = create_topic(f"serie_{serie_id}")
+    new_serie = {
+        **data,
+        "_id": serie_id,
+        "serie_thumbnail": image_url,
+        "isPublish": data.get("isPublish", False),
+        "serie_user": user_id,
+        "serie_lessons": data.get("serie_lessons", []),
+        "createdAt": now,
+        "updatedAt": now,
+        "serie_subcribe_num": 0,
+        "serie_sns": topic_arn,
+    }
+    try:
+        new_serie = repos.series.insert(new_serie)
+    except Exception:
+        delete_topic(topic_arn)
+        raise
+    return {**new_serie, "_id": ids.to_str(serie_id)}
 
 
+@traced
 def get_all_series(query=None):
-    db = _db()
-    if db:
-        serie_col = db.collection("series")
-        q = dict(query) if query else {}
-        return list(serie_col.find(q))
-    return list(_SERIES.values())
+    return _repos().series.find(query)
 
 
+@traced
 def get_serie_by_id(serie_id):
-    db = _db()
-    if db:
-        try:
-            from bson import ObjectId
+    return _repos().series.get(serie_id)
+
+
+# Lesson fields embedded by get_serie_with_lessons; long text stays on the
+# lesson endpoint.
+LESSON_SUMMARY_FIELDS = ("lesson_title", "lesson_video", "lesson_documents", "createdAt", "updatedAt", VERSION)
 
-            if not ObjectId.is_valid(serie_id):
-                return None
-            serie_col = db.collection("series")
-            return serie_col.find_one({"_id": ObjectId(serie_id)})
-        except Exception:
-            return None
-    return _SERIES.get(serie_id)
 
+@traced
+def get_series_by_ids(serie_ids, fields=None):
+    """`(series, missing_ids)` for `serie_ids`: series in the requested order,
+    limited to `fields` when given. Round trips: at most 1 (an `$in` over
+    the ids not already cached)."""
+    found = _repos().series.get_many(serie_ids)
+    series = [project(found[sid], fields) for sid in serie_ids if sid in found]
+    return series, [sid for sid in serie_ids if sid not in found]
 
+
+@traced
+def get_serie_with_lessons(serie_id):
+    """The serie with a `lessons` array of lesson summaries, ordered as in
+    `serie_lessons`. Round trips: 1 ($lookup aggregation)."""
+    return _repos().series.get_with_lessons(serie_id, LESSON_SUMMARY_FIELDS)
+
+
+@traced
 def get_all_series_by_user(user_id):
-    db = _db()
-    if db:
-        serie_col = db.collection("series")
-        return list(serie_col.find({"serie_user": user_id}))
-    return [s for s in _SERIES.values() if s.get("created_by") == user_id]
-
-
-def search_series_by_title(keyword):
-    db = _db()
-    if db:
-        serie_col = db.collection("series")
-        # Use text search if index exists, otherwise simple regex
-        try:
-            return list(serie_col.find({"$text": {"$search": keyword}, "isPublish": True}))
-        except Exception:
-            return list(serie_col.find({"serie_title": {"$regex": keyword, "$options": "i"}, "isPublish": True}))
-    keyword_lower = keyword.lower()
-    return [s for s in _SERIES.values() if keyword_lower in str(s.get("serie_title", "")).lower()]
-
-
-def get_series_subscribed_by_user(user_id):
-    db = _db()
-    if db:
-        user_col = db.collection("users")
-        serie_col = db.collection("series")
-        user = user_col.find_one({"_id": user_id}, {"serie_subcribe": 1})
-        if not user or not user.get("serie_subcribe"):
-            return []
-        serie_ids = user.get("serie_subcribe")
-        # Attempt to convert to ObjectId when necessary
-        from bson import ObjectId
-
-        obj_ids = []
-        for sid in serie_ids:
-            try:
-                obj_ids.append(ObjectId(sid))
-            except Exception:
-                pass
-        return list(serie_col.find({"_id": {"$in": obj_ids}}))
-    # in-memory fallback
-    result = []
-    for sid, subs in _SUBSCRIPTIONS.items():
-        if user_id in subs:
-            serie = _SERIES.get(sid)
-            if serie:
-                result.append(serie)
-    return result
+    return _repos().series.find({"serie_user": user_id})
+
+
+@traced
+def search_series_by_title(keyword, limit=SEARCH_LIMIT):
+    """Accent-insensitive title search over published series; series matching
+    more of the keyword's terms rank first, then the most subscribed. "bai hoc"
+    matches "Bài học"."""
+    if not tokenize(keyword):
+        return []
+    limit = max(1, min(int(limit), MAX_SEARCH_LIMIT))
+    return _repos().series.search(keyword, limit)
+
+
+@traced
+def autocomplete_series(prefix, limit=AUTOCOMPLETE_LIMIT):
+    """`{"_id", "serie_title"}` of published series whose title starts with
+    `prefix` (accent-insensitive), alphabetically."""
+    limit = max(1, min(int(limit), MAX_AUTOCOMPLETE_LIMIT))
+    return _repos().series.autocomplete(prefix, limit)
+
 
+@traced
+def get_series_subscribed_by_user(user_id, page=1, limit=SUBSCRIBED_LIMIT):
+    """One page of the series `user_id` subscribed to, most recent
+    subscription first. Round trips: 1 (aggregate on subscriptions)."""
+    page = max(1, int(page))
+    limit = max(1, min(int(limit), MAX_SUBSCRIBED_LIMIT))
+    return _repos().subscriptions.series_for_user(user_id, (page - 1) * limit, limit)
 
+
+@traced
 def update_serie(serie_id, data, user_id=None, id_token=None, file=None):
-    db = _db()
-    if db:
-        serie_col = db.collection("series")
-        # coerce isPublish string
-        if isinstance(data.get("isPublish"), str):
-            data["isPublish"] = data["isPublish"].lower() == "true"
-        if file:
-            # delete old and upload new
-            current = serie_col.find_one({"_id": serie_col.ObjectId(serie_id)})
-            if current and current.get("serie_thumbnail"):
-                delete_via_cloudfront(current.get("serie_thumbnail"))
-            unique_name = f"{uuid4()}_{getattr(file,'filename','file')}"
-            buffer = getattr(file, 'read', lambda: None)()
-            mimetype = getattr(file, 'mimetype', None) or getattr(file, 'content_type', None)
-            new_url = upload_via_cloudfront(id_token, buffer, unique_name, mimetype, f"files/user-{user_id}/thumbnail")
-            data["serie_thumbnail"] = new_url
-        data["updatedAt"] = None
-        res = serie_col.update_one({"_id": serie_col.ObjectId(serie_id)}, {"$set": data})
-        if res.matched_count == 0:
-            return None
-        return serie_col.find_one({"_id": serie_col.ObjectId(serie_id)})
-    existing = _SERIES.get(serie_id)
-    if not existing:
-        return None
+    """Round trips: 1 (find_one_and_update). A new thumbnail is uploaded first
+    and the old one deleted from the pre-image the update returns."""
+    series = _repos().series
+    _coerce_publish(data)
+    for k in ("_id", "serie_user", "serie_sns", "createdAt", VERSION):
+        data.pop(k, None)
     if file:
-        # no-op for in-memory
-        data["serie_thumbnail"] = f"uploaded://{getattr(file,'filename','file')}"
-    existing.update(data)
-    _SERIES[serie_id] = existing
-    return existing
+        data["serie_thumbnail"] = _upload_thumbnail(file, user_id, id_token)
+    data["updatedAt"] = _now()
+    if not file:
+        return series.update(serie_id, data)
+    before = series.update(serie_id, data, return_before=True)
+    if before is None:
+        delete_via_cloudfront(data["serie_thumbnail"])
+        return None
+    if before.get("serie_thumbnail"):
+        delete_via_cloudfront(before.get("serie_thumbnail"))
+    return {**before, **data}
 
 
+@traced
 def subscribe_serie(serie_id, user_id, user_email):
-    db = _db()
-    if db:
-        serie_col = db.collection("series")
-        user_col = db.collection("users")
-        serie = serie_col.find_one({"_id": serie_col.ObjectId(serie_id)})
-        if not serie or not serie.get("serie_sns"):
+    """Round trips: 2 (subscription insert, serie counter find_one_and_update),
+    in one transaction where supported.
+    `user_id` comes from the verified token, so the user document is not read."""
+    repos = _repos()
+
+    def _subscribe(session):
+        # the unique (user_id, serie_id) index is the "already subscribed" check
+        repos.subscriptions.add(user_id, serie_id, session=session)
+        serie = repos.series.add_subscribers(serie_id, 1, require_topic=True, session=session)
+        if serie is None:
+            if session is None:
+                repos.subscriptions.remove(user_id, serie_id)
             raise ValueError("Serie not found")
-        user = user_col.find_one({"_id": user_id})
-        if not user:
-            raise ValueError("User not found")
-        if user.get("serie_subcribe") and serie_id in user.get("serie_subcribe"):
-            return {"message": "Bạn đã đăng ký series này rồi.", "alreadySubscribed": True}
-        subscribe_to_serie(serie.get("serie_sns"), user_email)
-        user_col.update_one({"_id": user_id}, {"$addToSet": {"serie_subcribe": serie_id}, "$set": {"updatedAt": None}})
-        serie_col.update_one({"_id": serie_col.ObjectId(serie_id)}, {"$inc": {"serie_subcribe_num": 1}, "$set": {"updatedAt": None}})
-        return {"message": "Subscribed"}
-    subs = _SUBSCRIPTIONS.setdefault(serie_id, set())
-    if user_id in subs:
+        return serie
+
+    def _undo(session):
+        if repos.subscriptions.remove(user_id, serie_id, session=session):
+            repos.series.add_subscribers(serie_id, -1, session=session)
+
+    try:
+        serie = repos.transaction(_subscribe)
+    except DuplicateError:
         return {"message": "Bạn đã đăng ký series này rồi.", "alreadySubscribed": True}
-    subs.add(user_id)
-    return {"message": "Đăng ký nhận thông báo thành công.", "result": {"serieId": serie_id, "userId": user_id}}
+    try:
+        subscribe_to_serie(serie.get("serie_sns"), user_email)
+    except Exception:
+        repos.transaction(_undo)
+        raise
+    return {"message": "Subscribed"}
 
 
+@traced
 def unsubscribe_serie(serie_id, user_id, user_email):
-    db = _db()
-    if db:
-        serie_col = db.collection("series")
-        user_col = db.collection("users")
-        serie = serie_col.find_one({"_id": serie_col.ObjectId(serie_id)})
-        if not serie or not serie.get("serie_sns"):
+    """Round trips: 2 (subscription find_one_and_delete, serie counter
+    find_one_and_update), in one transaction where supported; both are undone
+    if the serie has no topic, SNS fails or SNS still needs confirmation, so
+    the user can retry."""
+    repos = _repos()
+
+    def _unsubscribe(session):
+        sub = repos.subscriptions.remove(user_id, serie_id, session=session)
+        if sub is None:
+            return None, None
+        return sub, repos.series.add_subscribers(serie_id, -1, session=session)
+
+    def _undo(session):
+        repos.subscriptions.restore(sub, session=session)
+        repos.series.add_subscribers(serie_id, 1, session=session)
+
+    sub, serie = repos.transaction(_unsubscribe)
+    if sub is None:
+        return {"message": "Bạn chưa đăng ký serie này.", "user": None}
+    try:
+        if serie is None or not serie.get("serie_sns"):
             raise ValueError("Serie not found")
-        user = user_col.find_one({"_id": user_id})
-        if not user:
-            raise ValueError("User not found")
-        if not user.get("serie_subcribe") or serie_id not in user.get("serie_subcribe"):
-            return {"message": "Bạn chưa đăng ký serie này.", "user": user}
         result = unsubscribe_from_topic(serie.get("serie_sns"), user_email)
-        if result.get("pendingConfirmation"):
-            return result
-        user_col.update_one({"_id": user_id}, {"$pull": {"serie_subcribe": serie_id}, "$set": {"updatedAt": None}})
-        serie_col.update_one({"_id": serie_col.ObjectId(serie_id)}, {"$inc": {"serie_subcribe_num": -1}, "$set": {"updatedAt": None}})
-        return {"message": "Bạn đã hủy đăng ký thành công.", "user": None}
-    subs = _SUBSCRIPTIONS.get(serie_id, set())
-    if user_id not in subs:
-        return {"message": "Bạn chưa đăng ký serie này.", "user": None}
-    subs.remove(user_id)
-    return {"result": {"serieId": serie_id, "userId": user_id}}
+    except Exception:
+        repos.transaction(_undo)
+        raise
+    if result.get("pendingConfirmation"):
+        repos.transaction(_undo)
+        return result
+    return {"message": "Bạn đã hủy đăng ký thành công.", "user": None}
 
 
+@traced
+def get_serie_subscribers(serie_id, limit=100, before=None):
+    """Newest-first page of `{"user_id", "createdAt"}` for a serie. Pass the
+    last `createdAt` of a page as `before` to fetch the next one."""
+    return _repos().subscriptions.subscribers(serie_id, limit, before)
+
+
+@traced
 def delete_serie(serie_id):
-    db = _db()
-    if db:
-        serie_col = db.collection("series")
-        user_col = db.collection("users")
-        from bson import ObjectId
-
-        serie = serie_col.find_one({"_id": ObjectId(serie_id)})
-        if not serie:
+    """Round trips: 2 (find_one_and_delete guarded on having no lessons,
+    subscriptions delete_many), in one transaction where supported; a find_one
+    only explains a refusal."""
+    repos = _repos()
+
+    def _delete(session):
+        serie = repos.series.delete_if_empty(serie_id, session=session)
+        if serie:
+            repos.subscriptions.remove_for_serie(serie_id, session=session)
+        return serie
+
+    serie = repos.transaction(_delete)
+    if not serie:
+        if not repos.series.exists(serie_id):
             raise ValueError("Serie không tồn tại.")
-        if serie.get("serie_lessons") and len(serie.get("serie_lessons")) > 0:
-            return {"success": False, "warning": "Không thể xóa serie khi vẫn còn bài học trong serie này."}
-        user_col.update_many({"serie_subcribe": serie_id}, {"$pull": {"serie_subcribe": serie_id}, "$set": {"updatedAt": None}})
-        if serie.get("serie_sns"):
-            delete_topic(serie.get("serie_sns"))
-        result = serie_col.delete_one({"_id": ObjectId(serie_id)})
-        if result.deleted_count > 0 and serie.get("serie_thumbnail"):
-            delete_via_cloudfront(serie.get("serie_thumbnail"))
-        return result.deleted_count > 0
-    return _SERIES.pop(serie_id, None)
+        return {"success": False, "warning": "Không thể xóa serie khi vẫn còn bài học trong serie này."}
+    if serie.get("serie_sns"):
+        delete_topic(serie.get("serie_sns"))
+    if serie.get("serie_thumbnail"):
+        delete_via_cloudfront(serie.get("serie_thumbnail"))
+    return True
@@ -1,81 +1,64 @@
-"""User service that uses MongoDB when available; otherwise uses in-memory store.
+"""User service over the users repository (app.repositories).
 This mirrors behaviour from the Node.js user.service.js file where cognitoUserId is used as _id.
+
+Every Mongo write here is a single round trip.
 """
-from uuid import uuid4
-from app.utils.mongodb import connect_to_database
+from datetime import datetime, timezone
+from app.repositories import VERSION, get_repositories
+from app.utils.batch import project
+from app.utils.tracing import traced
+
 
-_USERS = {}
+def _repos():
+    return get_repositories()
 
 
-def _db():
-    return connect_to_database()
+def _now():
+    return datetime.now(timezone.utc)
 
 
+@traced
 def create_user(data: dict) -> dict:
-    db = _db()
-    cognito_id = data.get("cognitoUserId") or data.get("cognitoUserId")
-    if db:
-        users = db.collection("users")
-        if not cognito_id:
-            raise ValueError("cognitoUserId is required")
-        data["createdAt"] = None
-        data["updatedAt"] = None
-        existing = users.find_one({"_id": cognito_id})
-        if existing:
-            # update existing
-            return update_user_by_cognito_id(cognito_id, data)
-        # insert new
-        payload = {"_id": cognito_id, **{k: v for k, v in data.items() if k != "cognitoUserId"}, "serie_subcribe": []}
-        users.insert_one(payload)
-        return {"_id": cognito_id, **payload}
-
-    # fallback in-memory
-    user_id = cognito_id or str(uuid4())
-    user = {"_id": user_id, **data, "serie_subcribe": []}
-    _USERS[user_id] = user
-    return user
+    """Insert the profile, or update it if it already exists, in one upsert."""
+    cognito_id = data.get("cognitoUserId")
+    if not cognito_id:
+        raise ValueError("cognitoUserId is required")
+    now = _now()
+    fields = {k: v for k, v in data.items() if k not in ("_id", "cognitoUserId", "createdAt", VERSION)}
+    fields["updatedAt"] = now
+    return _repos().users.upsert(cognito_id, fields, on_insert={"createdAt": now})
 
 
+@traced
 def get_user_by_id(user_id: str) -> dict:
-    db = _db()
-    if db:
-        users = db.collection("users")
-        return users.find_one({"_id": user_id})
-    return _USERS.get(user_id)
+    return _repos().users.get(user_id)
+
+
+@traced
+def get_users_by_ids(user_ids, fields=None):
+    """`(users, missing_ids)` for `user_ids`: users in the requested order,
+    limited to `fields` when given. Round trips: at most 1 (an `$in` over
+    the ids not already cached)."""
+    found = _repos().users.get_many(user_ids)
+    return [project(found[uid], fields) for uid in user_ids if uid in found], [uid for uid in user_ids if uid not in found]
 
 
+@traced
 def get_user_by_cognito_id(cognito_id: str) -> dict:
     return get_user_by_id(cognito_id)
 
 
+@traced
 def update_user(user_id: str, data: dict) -> dict:
-    db = _db()
-    if db:
-        users = db.collection("users")
-        for k in ("_id", "cognitoUserId", "createdAt"):
-            data.pop(k, None)
-        data["updatedAt"] = None
-        result = users.find_one_and_update({"_id": user_id}, {"$set": data}, return_document=True)
-        return result
-    existing = _USERS.get(user_id)
-    if not existing:
-        return None
-    existing.update(data)
-    _USERS[user_id] = existing
-    return existing
+    for k in ("_id", "cognitoUserId", "createdAt", VERSION):
+        data.pop(k, None)
+    data["updatedAt"] = _now()
+    return _repos().users.update(user_id, data)
 
 
+@traced
 def update_user_by_cognito_id(cognito_id: str, data: dict):
-    db = _db()
-    if db:
-        users = db.collection("users")
-        for k in ("_id", "createdAt"):
-            data.pop(k, None)
-        data["updatedAt"] = None
-        result = users.find_one_and_update({"_id": cognito_id}, {"$set": data}, return_document=True, upsert=True)
-        return result
-    # fallback
-    existing = _USERS.get(cognito_id, {})
-    existing.update(data)
-    _USERS[cognito_id] = existing
-    return existing
+    for k in ("_id", "createdAt", VERSION):
+        data.pop(k, None)
+    data["updatedAt"] = _now()
+    return _repos().users.upsert(cognito_id, data)
@@ -0,0 +1,173 @@
+"""Sorted prefix index for title autocomplete.
+
+Every entry is one string `"<folded title>\\x00<title>\\x00<id>"` kept in a
+sorted list, so a lookup is a single `bisect` followed by a short forward scan
+and each indexed title costs one string object. Keys are folded with
+`app.utils.search.fold` so "bai" completes "Bài học".
+
+`RefreshingPrefixIndex` keeps one built from a store of published series.
+Completions are alphabetical: ranking a prefix's matches by popularity
+would mean visiting all of them, and a one-letter prefix matches a large
+share of the titles.
+"""
+import logging
+import os
+import time
+from bisect import bisect_left, insort
+from threading import Lock, Thread
+
+from app.utils.search import fold
+
+logger = logging.getLogger(__name__)
+
+_SEP = "\x00"
+# longer titles are only distinguishable by prefix up to this many characters
+MAX_KEY_LENGTH = 64
+# how long an index over a shared store (Mongo, SQLite) may miss writes made
+# by other workers
+AUTOCOMPLETE_TTL = int(os.environ.get("AUTOCOMPLETE_TTL", "300"))
+
+
+def _entry(doc_id, title):
+    key = " ".join(fold(title).split())[:MAX_KEY_LENGTH].replace(_SEP, "")
+    return f"{key}{_SEP}{title}{_SEP}{doc_id}"
+
+
+class PrefixIndex:
+    def __init__(self, items=()):
+        self._by_id = {}
+        for doc_id, title in items:
+            self._by_id[str(doc_id)] = _entry(doc_id, title)
+        self._entries = sorted(self._by_id.values())
+        self._lock = Lock()
+        self.built_at = time.monotonic()
+
+    def add(self, doc_id, title):
+        doc_id = str(doc_id)
+        entry = _entry(doc_id, title)
+        with self._lock:
+            self._discard(doc_id)
+            self._by_id[doc_id] = entry
+            insort(self._entries, entry)
+
+    def remove(self, doc_id):
+        with self._lock:
+            self._discard(str(doc_id))
+
+    def _discard(self, doc_id):
+        entry = self._by_id.pop(doc_id, None)
+        if entry is not None:
+            i = bisect_left(self._entries, entry)
+            if i < len(self._entries) and self._entries[i] == entry:
+                del self._entries[i]
+
+    def complete(self, prefix, limit=10):
+        """Up to `limit` `{"_id", "serie_title"}` dicts whose folded title
+        starts with `prefix`, in alphabetical order."""
+        key = " ".join(fold(prefix).split()).replace(_SEP, "")
+        if not key:
+            return []
+        out = []
+        with self._lock:
+            i = bisect_left(self._entries, key)
+            while i < len(self._entries) and len(out) < limit:
+                entry = self._entries[i]
+                if not entry.startswith(key):
+                    break
+                title, _, doc_id = entry.split(_SEP, 1)[1].rpartition(_SEP)
+                out.append({"_id": doc_id, "serie_title": title})
+                i += 1
+        return out
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RefreshingPrefixIndex:
+    """A `PrefixIndex` over the `(id, title)` pairs `load()` returns.
+
+    `start()` builds it and, with a `ttl`, starts a thread that rebuilds it
+    that often to pick up writes made by other workers; without one it is
+    authoritative. Requests never build it, except in scripts that never
+    called `start()`. Writes made through this process are patched in with
+    `sync`, and the ones made while a rebuild is reading the store are
+    replayed onto the new index before it replaces the old one.
+    """
+
+    def __init__(self, load, ttl=None):
+        self._load = load
+        self.ttl = ttl
+        self._index = None
+        # guards `_index` and `_pending` (writes seen during a rebuild)
+        self._lock = Lock()
+        self._pending = None
+        self._rebuild = Lock()
+        self._pid = None
+
+    def start(self):
+        """Build the index now; with a `ttl`, keep rebuilding it in the
+        background (in every process: the thread does not survive a fork)."""
+        if self._index is None:
+            try:
+                self.refresh()
+            except Exception:
+                # the app still starts; the refresh thread retries
+                logger.exception("autocomplete index build failed")
+        if self.ttl is None or self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+        Thread(target=self._run, name="autocomplete-refresh", daemon=True).start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.ttl)
+            try:
+                self.refresh()
+            except Exception:
+                logger.exception("autocomplete index rebuild failed; serving the previous one")
+
+    def refresh(self):
+        """Rebuild the index from `load()` and swap it in."""
+        with self._rebuild:
+            with self._lock:
+                self._pending = []
+            try:
+                index = PrefixIndex(self._load())
+            except BaseException:
+                with self._lock:
+                    self._pending = None
+                raise
+            with self._lock:
+                for doc_id, doc in self._pending:
+                    _apply(index, doc_id, doc)
+                self._pending = None
+                self._index = index
+
+    def sync(self, doc_id, doc):
+        """Reflect a written serie (None once deleted)."""
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((doc_id, doc))
+            index = self._index
+        if index is not None:
+            _apply(index, doc_id, doc)
+
+    def complete(self, prefix, limit=10):
+        if self._pid is not None and self._pid != os.getpid():
+            # forked after start(): this process has no refresh thread yet
+            self.start()
+        index = self._index
+        if index is None:
+            self.refresh()
+            index = self._index
+        return index.complete(prefix, limit)
+
+
+def _apply(index, doc_id, doc):
+    if doc and doc.get("isPublish") is True:
+        index.add(doc_id, doc.get("serie_title", ""))
+    else:
+        index.remove(doc_id)
@@ -0,0 +1,39 @@
+"""Request parsing and shaping shared by the batch get-by-ids endpoints."""
+import os
+
+MAX_BATCH_IDS = int(os.environ.get("MAX_BATCH_IDS", "100"))
+# cached documents for batch lookups; writes made by other workers are only
+# picked up once an entry expires
+BATCH_CACHE_TTL = int(os.environ.get("BATCH_CACHE_TTL", "30"))
+BATCH_CACHE_SIZE = int(os.environ.get("BATCH_CACHE_SIZE", "1024"))
+
+
+def _split(values):
+    out = []
+    for value in values:
+        out.extend(part.strip() for part in value.split(",") if part.strip())
+    return out
+
+
+def parse_ids(args):
+    """Distinct ids from `?ids=a,b&ids=c`, in request order. Raises
+    ValueError when there are none or more than MAX_BATCH_IDS."""
+    ids = list(dict.fromkeys(_split(args.getlist("ids"))))
+    if not ids:
+        raise ValueError("ids is required")
+    if len(ids) > MAX_BATCH_IDS:
+        raise ValueError(f"At most {MAX_BATCH_IDS} ids per request")
+    return ids
+
+
+def parse_fields(args):
+    """Field names from `?fields=a,b`, or None for whole documents."""
+    fields = _split(args.getlist("fields"))
+    return fields or None
+
+
+def project(doc, fields):
+    """A copy of `doc` limited to `fields` (`_id` is always kept)."""
+    if not fields:
+        return dict(doc)
+    return {k: v for k, v in doc.items() if k == "_id" or k in fields}
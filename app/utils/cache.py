@@ -0,0 +1,64 @@
+"""Small thread-safe in-process caches shared by the middleware and services."""
+import time
+from collections import OrderedDict
+from threading import Lock
+
+
+class LRUCache:
+    """Bounded LRU mapping with an optional per-entry TTL (seconds)."""
+
+    def __init__(self, maxsize=256, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            value, expires = entry
+            if expires is not None and expires < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def get_many(self, keys, fetch):
+        """`{key: value}` for `keys`: hits come from the cache and the misses
+        go to `fetch(missing_keys)` in a single call, whose `{key: value}`
+        result is cached. Keys `fetch` leaves out are absent (and not cached)."""
+        found = {}
+        missing = []
+        for key in keys:
+            value = self.get(key)
+            if value is None:
+                missing.append(key)
+            else:
+                found[key] = value
+        if missing:
+            fetched = fetch(missing)
+            for key, value in fetched.items():
+                self.set(key, value)
+            found.update(fetched)
+        return found
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
@@ -0,0 +1,6 @@
+"""Commands the driver sends on its own behalf, which no command listener
+should count, time or log as application queries: connection handshakes
+and heartbeats, authentication and session cleanup. Kept apart from
+app.utils.mongodb, which imports every listener."""
+
+DRIVER_COMMANDS = frozenset({"hello", "ismaster", "isMaster", "ping", "saslStart", "saslContinue", "endSessions"})
@@ -0,0 +1,66 @@
+"""Strong ETag helpers for conditional GETs.
+
+Tags are derived from the write counter every document carries (VERSION,
+see app.repositories.base) or from an aggregate `(count, max(updatedAt))`
+state (lists) so a matching `If-None-Match` can be answered with 304 before
+the response body is ever built. `updatedAt` alone is not enough for single
+documents: Mongo keeps milliseconds, and two writes in the same one would
+share a tag.
+"""
+import hashlib
+import json
+from datetime import datetime, timezone
+
+from flask import request, make_response
+
+from app.repositories.base import VERSION
+
+
+def _ts(value):
+    # Mongo hands back naive UTC datetimes truncated to milliseconds while the
+    # in-memory store keeps aware microsecond ones; normalise both.
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value.isoformat(timespec="milliseconds")
+    return "" if value is None else str(value)
+
+
+def make_etag(*parts):
+    """Hash arbitrary version parts into a strong ETag value."""
+    h = hashlib.sha1()
+    for part in parts:
+        h.update(_ts(part).encode("utf-8"))
+        h.update(b"\x1f")
+    return h.hexdigest()
+
+
+def doc_version(doc):
+    """The document's VERSION, or a hash of its body for legacy documents
+    that have not been written since versions were introduced."""
+    version = doc.get(VERSION)
+    if version is not None:
+        return version
+    return hashlib.sha1(json.dumps(doc, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def doc_etag(kind, doc):
+    """ETag for a single document."""
+    return make_etag(kind, doc.get("_id"), doc_version(doc))
+
+
+# Suffixes the compression middleware appends for encoded representations.
+ENCODING_SUFFIXES = ("", "-gzip", "-br")
+
+
+def conditional(etag, build):
+    """Answer 304 when the client already holds `etag` (in any encoding),
+    otherwise call `build()` (any Flask view return value) and tag the response."""
+    for suffix in ENCODING_SUFFIXES:
+        if request.if_none_match.contains(etag + suffix):
+            resp = make_response("", 304)
+            resp.set_etag(etag + suffix)
+            return resp
+    resp = make_response(build())
+    resp.set_etag(etag)
+    return resp
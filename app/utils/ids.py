@@ -0,0 +1,64 @@
+"""Document id codec.
+
+In Mongo, serie and lesson `_id`s and every reference to them
+(`series.serie_lessons`, `lessons.lesson_serie`, `subscriptions.serie_id`)
+are stored as ObjectIds, so each lookup compares like with like and can use
+the `_id` and reference indexes. Outside the database (URLs, JSON, cache
+keys, the local store) an id is its 24-hex-digit string.
+
+Convert at the storage boundary with `parse` / `require`, and back with
+`to_str`; `JSONProvider` serializes any ObjectId left in a response.
+User ids are Cognito subs and stay plain strings.
+"""
+import re
+
+import bson
+from bson import ObjectId
+from flask.json.provider import DefaultJSONProvider
+
+_HEX_RE = re.compile(r"^[0-9a-fA-F]{24}$")
+
+
+def new_id():
+    """A fresh ObjectId, for documents whose id is needed before the insert."""
+    # looked up on the module at call time so tests can substitute it
+    return bson.ObjectId()
+
+
+def is_valid(value):
+    return isinstance(value, ObjectId) or (isinstance(value, str) and _HEX_RE.match(value) is not None)
+
+
+def parse(value):
+    """`value` as an ObjectId, or None if it is not a well-formed id."""
+    if isinstance(value, ObjectId):
+        return value
+    return ObjectId(value) if is_valid(value) else None
+
+
+def require(value, message="Not found"):
+    """`parse`, raising ValueError(`message`) for a malformed id."""
+    oid = parse(value)
+    if oid is None:
+        raise ValueError(message)
+    return oid
+
+
+def parse_many(values):
+    """The well-formed ids among `values` as ObjectIds; the others are dropped."""
+    return [oid for oid in map(parse, values) if oid is not None]
+
+
+def to_str(value):
+    """The string form of an id (strings pass through)."""
+    return str(value) if isinstance(value, ObjectId) else value
+
+
+class JSONProvider(DefaultJSONProvider):
+    """Flask's JSON provider plus ObjectId -> string."""
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, ObjectId):
+            return str(o)
+        return DefaultJSONProvider.default(o)
@@ -0,0 +1,23 @@
+"""Storage the services use when MONGODB_URI is unset.
+
+LOCAL_STORE selects the backend:
+  - memory (default): `DocumentStore`, private to each worker process
+  - sqlite          : `SQLiteStore` in SQLITE_PATH (default data/paas.sqlite3),
+                      shared by every worker on the node and kept across restarts
+"""
+import os
+
+from app.utils.memstore import DocumentStore
+
+
+def open_store(name, indexes=(), text=()):
+    """A store for collection `name` on the configured backend."""
+    backend = os.environ.get("LOCAL_STORE", "memory").lower()
+    if backend == "sqlite":
+        from app.utils.sqlitestore import SQLiteStore
+
+        path = os.environ.get("SQLITE_PATH", os.path.join("data", "paas.sqlite3"))
+        return SQLiteStore(path, name, indexes=indexes, text=text)
+    if backend != "memory":
+        raise ValueError(f"Unknown LOCAL_STORE backend: {backend!r}")
+    return DocumentStore(indexes=indexes, text=text)
@@ -0,0 +1,45 @@
+"""Process memory readings for the memory telemetry (app.middleware.memory)
+and the RSS-based worker recycling in gunicorn.conf.py."""
+import os
+import resource
+import sys
+import tracemalloc
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def rss_bytes():
+    """Current resident set size, from /proc on Linux; elsewhere the peak
+    (`ru_maxrss`) is the best available approximation."""
+    try:
+        with open("/proc/self/statm") as fh:
+            return int(fh.read().split()[1]) * _PAGE_SIZE
+    except OSError:
+        return peak_rss_bytes()
+
+
+def peak_rss_bytes():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def start_tracing(frames):
+    """Start tracemalloc keeping `frames` frames per allocation (0: don't)."""
+    if frames > 0 and not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+
+
+def top_allocations(limit=20, group_by="lineno"):
+    """The largest live allocation sites, or None when tracemalloc is off."""
+    if not tracemalloc.is_tracing():
+        return None
+    snapshot = tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+    ))
+    return [{
+        "size": stat.size,
+        "count": stat.count,
+        "traceback": [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback],
+    } for stat in snapshot.statistics(group_by)[:limit]]
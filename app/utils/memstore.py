@@ -0,0 +1,301 @@
+"""Thread-safe in-memory document store with secondary indexes.
+
+Backs the services when MONGODB_URI is unset. Documents go in and come out
+as dicts keyed by `_id`; every read builds a fresh one, so callers never
+share mutable state with the store or with each other. Declared fields get
+a value -> ids index (multikey for list values) kept in insertion order, so
+"newest first" is a reverse walk of the index bucket; `text` fields are
+tokenised into an `InvertedIndex` for `search`.
+
+A stored record is one tuple: `(extra, value, value, ...)`, positioned by a
+field map shared by the whole store, instead of a dict per document. Fields
+past the first SHARED_FIELDS a store sees (arbitrary client keys) go in the
+`extra` dict, which is None for ordinary documents, so they can't widen
+every record. At a million 4-field records this is about half the memory of
+a dict per record (see benchmarks/bench_memstore.py).
+
+`app.utils.sqlitestore.SQLiteStore` implements the same interface on disk.
+"""
+from itertools import islice
+from threading import RLock
+
+from app.utils.search import InvertedIndex
+
+
+class DuplicateIdError(KeyError):
+    """Raised by `insert` when a document with the same `_id` exists."""
+
+
+# fields given a position in the shared field map, per store
+SHARED_FIELDS = 64
+# a field the record does not have
+_MISSING = object()
+
+
+def _index_values(value):
+    if isinstance(value, dict):
+        return ()
+    if not isinstance(value, (list, tuple, set)):
+        return (value,)
+    out = []
+    for v in value:
+        try:
+            hash(v)
+        except TypeError:
+            continue
+        out.append(v)
+    return tuple(dict.fromkeys(out))
+
+
+def _matches(doc, criteria):
+    for field, expected in criteria.items():
+        value = doc.get(field)
+        if isinstance(value, list) and not isinstance(expected, list):
+            if expected not in value:
+                return False
+        elif value != expected:
+            return False
+    return True
+
+
+class DocumentStore:
+    """Dict-backed collection with equality lookups on `indexes` and token
+    search on `text` fields. Data lives in this process only."""
+
+    shared = False
+
+    def __init__(self, indexes=(), text=()):
+        self.indexes = tuple(indexes)
+        self.text = tuple(text)
+        self._records = {}
+        # field -> position in the records (after `extra`), in first-seen order
+        self._fields = []
+        self._slot = {}
+        self._index = {field: {} for field in self.indexes}
+        self._text = {field: InvertedIndex() for field in self.text}
+        self._lock = RLock()
+
+    # -- internal (lock held) -------------------------------------------------
+
+    def _pack(self, doc):
+        values, extra = [None], None
+        for field, value in doc.items():
+            pos = self._slot.get(field)
+            if pos is None and len(self._fields) < SHARED_FIELDS:
+                pos = self._slot[field] = len(self._fields) + 1
+                self._fields.append(field)
+            if pos is None:
+                extra = extra or {}
+                extra[field] = value
+                continue
+            if pos >= len(values):
+                values.extend([_MISSING] * (pos + 1 - len(values)))
+            values[pos] = value
+        values[0] = extra
+        return tuple(values)
+
+    def _unpack(self, record):
+        doc = {f: v for f, v in zip(self._fields, islice(record, 1, None)) if v is not _MISSING}
+        if record[0]:
+            doc.update(record[0])
+        return doc
+
+    def _value(self, record, field):
+        pos = self._slot.get(field)
+        if pos is None:
+            return _MISSING if record[0] is None else record[0].get(field, _MISSING)
+        return record[pos] if pos < len(record) else _MISSING
+
+    def _matches(self, record, criteria):
+        for field, expected in criteria.items():
+            value = self._value(record, field)
+            if isinstance(value, list) and not isinstance(expected, list):
+                if expected not in value:
+                    return False
+            elif (None if value is _MISSING else value) != expected:
+                return False
+        return True
+
+    def _keys(self, doc):
+        return tuple(_index_values(doc.get(field)) if field in doc else () for field in self.indexes)
+
+    def _link(self, doc_id, keys):
+        for field, values in zip(self.indexes, keys):
+            buckets = self._index[field]
+            for value in values:
+                buckets.setdefault(value, {})[doc_id] = None
+
+    def _unlink(self, doc_id, keys):
+        for field, values in zip(self.indexes, keys):
+            buckets = self._index[field]
+            for value in values:
+                bucket = buckets.get(value)
+                if bucket is not None:
+                    bucket.pop(doc_id, None)
+                    if not bucket:
+                        del buckets[value]
+
+    def _put(self, doc, old=None):
+        """Store `doc`, replacing `old` (the unpacked current version)."""
+        doc_id = doc["_id"]
+        keys = self._keys(doc)
+        if old is not None:
+            old_keys = self._keys(old)
+            if old_keys != keys:
+                self._unlink(doc_id, old_keys)
+                old = None
+        if old is None:
+            self._link(doc_id, keys)
+        for field, index in self._text.items():
+            if old is None or old.get(field) != doc.get(field):
+                index.add(doc_id, doc.get(field) or "")
+        self._records[doc_id] = self._pack(doc)
+
+    def _candidates(self, criteria):
+        """Ids that may match `criteria`, narrowed by the smallest index bucket."""
+        best = None
+        for field, expected in criteria.items():
+            if field not in self._index:
+                continue
+            try:
+                bucket = self._index[field].get(expected, {})
+            except TypeError:
+                continue
+            if best is None or len(bucket) < len(best):
+                best = bucket
+        return self._records if best is None else best
+
+    # -- writes ---------------------------------------------------------------
+
+    def insert(self, doc):
+        """Store a copy of `doc`; raises DuplicateIdError if `_id` is taken."""
+        with self._lock:
+            if doc["_id"] in self._records:
+                raise DuplicateIdError(doc["_id"])
+            self._put(doc)
+        return dict(doc)
+
+    def insert_many(self, docs):
+        """Insert `docs` under one lock; returns the ids that were taken."""
+        taken = []
+        with self._lock:
+            for doc in docs:
+                if doc["_id"] in self._records:
+                    taken.append(doc["_id"])
+                else:
+                    self._put(doc)
+        return taken
+
+    def update(self, doc_id, changes=None, inc=None):
+        """Set `changes` and add `inc` to numeric fields; returns the updated
+        document, or None when `doc_id` does not exist."""
+        return self.modify(doc_id, lambda doc: changes or {}, inc)[1]
+
+    def modify(self, doc_id, fn, inc=None):
+        """Read-modify-write under one lock: `fn(doc)` returns the changes to
+        set (plus `inc`), or None to leave the document alone. Returns
+        `(before, after)`; `after` is None when nothing was written and both
+        are None when `doc_id` does not exist."""
+        with self._lock:
+            record = self._records.get(doc_id)
+            if record is None:
+                return None, None
+            old = self._unpack(record)
+            changes = fn(dict(old))
+            if changes is None:
+                return old, None
+            doc = {**old, **changes}
+            for field, amount in (inc or {}).items():
+                doc[field] = (doc.get(field) or 0) + amount
+            doc["_id"] = doc_id
+            self._put(doc, old)
+            return old, doc
+
+    def upsert(self, doc_id, changes, on_insert=None, inc=None):
+        """`update`, or insert `{_id, **on_insert, **changes}` (plus `inc`)
+        when missing."""
+        with self._lock:
+            if doc_id in self._records:
+                return self.update(doc_id, changes, inc)
+            doc = {"_id": doc_id, **(on_insert or {}), **changes}
+            for field, amount in (inc or {}).items():
+                doc[field] = (doc.get(field) or 0) + amount
+            self._put(doc)
+            return doc
+
+    def delete(self, doc_id, guard=None):
+        """Remove and return the document, or None; with `guard`, only when
+        `guard(doc)` is true, checked under the same lock."""
+        with self._lock:
+            record = self._records.get(doc_id)
+            if record is None:
+                return None
+            doc = self._unpack(record)
+            if guard is not None and not guard(dict(doc)):
+                return None
+            del self._records[doc_id]
+            self._unlink(doc_id, self._keys(doc))
+            for index in self._text.values():
+                index.remove(doc_id)
+            return doc
+
+    def delete_many(self, criteria):
+        """Remove every document matching `criteria`; returns how many."""
+        with self._lock:
+            ids = [i for i in self._candidates(criteria) if self._matches(self._records[i], criteria)]
+            for doc_id in ids:
+                self.delete(doc_id)
+            return len(ids)
+
+    def clear(self):
+        with self._lock:
+            self._records.clear()
+            self._fields, self._slot = [], {}
+            for buckets in self._index.values():
+                buckets.clear()
+            self._text = {field: InvertedIndex() for field in self.text}
+
+    # -- reads ----------------------------------------------------------------
+
+    def get(self, doc_id):
+        with self._lock:
+            record = self._records.get(doc_id)
+            return self._unpack(record) if record is not None else None
+
+    def get_many(self, ids):
+        """`{id: doc}` for the ids that exist."""
+        with self._lock:
+            return {i: self._unpack(self._records[i]) for i in ids if i in self._records}
+
+    def find(self, criteria=None, where=None, reverse=False, skip=0, limit=None):
+        """Documents equal to `criteria` (a list field matches any element)
+        and accepted by the optional `where(doc)` predicate, in insertion
+        order (newest first with `reverse`)."""
+        criteria = criteria or {}
+        with self._lock:
+            ids = self._candidates(criteria)
+            ids = reversed(ids) if reverse else iter(ids)
+            records = (self._records[i] for i in ids)
+            docs = (self._unpack(r) for r in records if self._matches(r, criteria))
+            if where is not None:
+                docs = (d for d in docs if where(d))
+            stop = None if limit is None else skip + limit
+            return list(islice(docs, skip, stop))
+
+    def search(self, field, query, limit=20):
+        """Documents whose `field` shares tokens with `query`, most shared
+        tokens first."""
+        ids = self._text[field].search(query, limit)
+        found = self.get_many(ids)
+        return [found[i] for i in ids if i in found]
+
+    def count(self, criteria=None):
+        criteria = criteria or {}
+        with self._lock:
+            return sum(1 for i in self._candidates(criteria) if self._matches(self._records[i], criteria))
+
+    def __contains__(self, doc_id):
+        return doc_id in self._records
+
+    def __len__(self):
+        return len(self._records)
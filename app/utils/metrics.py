@@ -0,0 +1,132 @@
+"""Prometheus metrics (optional: needs `prometheus_client`).
+
+Every metric is defined here, together with the helpers the rest of the app
+uses to record into them. Without prometheus_client, or with
+METRICS_ENABLED=false, the metrics are None and the helpers do nothing.
+
+Under gunicorn, set PROMETHEUS_MULTIPROC_DIR (gunicorn.conf.py clears it at
+startup and drops exited workers' gauges) so each worker writes its samples
+to that directory and `/metrics` aggregates all of them; otherwise every
+worker only reports its own.
+"""
+import os
+import time
+from contextlib import contextmanager
+from threading import Lock
+
+from pymongo import monitoring
+
+from app.utils import tracing
+from app.utils.driver_commands import DRIVER_COMMANDS
+
+try:
+    import prometheus_client
+except Exception:
+    prometheus_client = None
+
+ENABLED = prometheus_client is not None and str(os.environ.get("METRICS_ENABLED", "true")).lower() not in ("0", "false", "no")
+
+# request latencies, in seconds
+HTTP_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# single database commands and other dependency calls
+DEPENDENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+
+
+def _metric(kind, name, doc, labels, **kwargs):
+    if not ENABLED:
+        return None
+    return getattr(prometheus_client, kind)(name, doc, labels, **kwargs)
+
+
+HTTP_REQUESTS = _metric("Counter", "http_requests_total", "Requests served.", ("endpoint", "method", "status"))
+HTTP_LATENCY = _metric("Histogram", "http_request_duration_seconds", "Time to build a response.",
+                       ("endpoint", "method", "status"), buckets=HTTP_BUCKETS)
+HTTP_IN_PROGRESS = _metric("Gauge", "http_requests_in_progress", "Requests being served.", ("endpoint",),
+                           multiprocess_mode="livesum")
+AUTH_LATENCY = _metric("Histogram", "auth_verification_duration_seconds", "Time to verify a bearer token.",
+                       ("outcome",), buckets=DEPENDENCY_BUCKETS)
+MONGO_LATENCY = _metric("Histogram", "mongodb_command_duration_seconds", "MongoDB command round trips.",
+                        ("command", "collection", "outcome"), buckets=DEPENDENCY_BUCKETS)
+EXTERNAL_LATENCY = _metric("Histogram", "external_call_duration_seconds", "AWS (S3, SNS) API calls.",
+                           ("service", "operation", "outcome"), buckets=DEPENDENCY_BUCKETS)
+REPOSITORY_LATENCY = _metric("Histogram", "repository_call_duration_seconds", "Repository method calls.",
+                             ("aggregate", "method", "outcome"), buckets=DEPENDENCY_BUCKETS)
+
+
+def observe(histogram, seconds, **labels):
+    if histogram is not None:
+        histogram.labels(**labels).observe(seconds)
+
+
+@contextmanager
+def timed(histogram, **labels):
+    """Observe the duration of the block, with `outcome` "ok" or "error"."""
+    if histogram is None:
+        yield
+        return
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        histogram.labels(outcome=outcome, **labels).observe(time.perf_counter() - start)
+
+
+@contextmanager
+def external_call(service, operation):
+    """`with external_call("s3", "put_object"): ...` around an AWS call; also
+    a span in the request's trace (app.utils.tracing)."""
+    with tracing.span(f"{service}.{operation}", service, tracing.CLIENT), \
+            timed(EXTERNAL_LATENCY, service=service, operation=operation):
+        yield
+
+
+def observe_repository_call(aggregate, method, seconds, error):
+    """A `RepositoryMetrics` observer."""
+    observe(REPOSITORY_LATENCY, seconds, aggregate=aggregate, method=method, outcome="ok" if error is None else "error")
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Records every command's server round trip in MONGO_LATENCY. The
+    collection is only on the started event, so it is held until the
+    command completes."""
+
+    IGNORED = DRIVER_COMMANDS
+
+    def __init__(self):
+        self._pending = {}
+        self._lock = Lock()
+
+    def started(self, event):
+        if event.command_name in self.IGNORED:
+            return
+        target = event.command.get(event.command_name)
+        with self._lock:
+            self._pending[(event.connection_id, event.request_id)] = target if isinstance(target, str) else ""
+
+    def _finish(self, event, outcome):
+        with self._lock:
+            collection = self._pending.pop((event.connection_id, event.request_id), None)
+        if collection is not None:
+            observe(MONGO_LATENCY, event.duration_micros / 1e6,
+                    command=event.command_name, collection=collection, outcome=outcome)
+
+    def succeeded(self, event):
+        self._finish(event, "ok")
+
+    def failed(self, event):
+        self._finish(event, "error")
+
+
+def render():
+    """`(body, content_type)` of the metrics exposition for this node."""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        registry = prometheus_client.CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = prometheus_client.REGISTRY
+    return prometheus_client.generate_latest(registry), prometheus_client.CONTENT_TYPE_LATEST
+
@@ -1,6 +1,102 @@
 import os
-from pymongo import MongoClient
+from pymongo import MongoClient, ASCENDING, DESCENDING, monitoring
 from functools import lru_cache
+from threading import Lock
+from app.utils import metrics, tracing
+from app.utils.driver_commands import DRIVER_COMMANDS
+from app.utils.slow_queries import SLOW_QUERIES
+
+# Indexes every service query relies on, as (collection, keys, options).
+INDEXES = [
+    # lesson lists and their ETag aggregate (count + max updatedAt) are
+    # answered from this index alone
+    ("lessons", [("lesson_serie", ASCENDING), ("updatedAt", ASCENDING)], {}),
+    # accent-folded title search (multikey); the trailing keys serve the
+    # most-subscribed-first order, so a search stops after its page
+    ("series", [("serie_title_tokens", ASCENDING), ("isPublish", ASCENDING),
+                ("serie_subcribe_num", DESCENDING), ("_id", ASCENDING)], {}),
+    # published-title scan that (re)builds the autocomplete prefix index
+    ("series", [("isPublish", ASCENDING), ("serie_title", ASCENDING)], {}),
+    # a creator's series (GET /api/series/created)
+    ("series", [("serie_user", ASCENDING)], {}),
+    # one document per (user, serie) subscription; the unique index doubles
+    # as the "already subscribed" check
+    ("subscriptions", [("user_id", ASCENDING), ("serie_id", ASCENDING)], {"unique": True}),
+    # a user's subscriptions, newest first (_id breaks createdAt ties)
+    ("subscriptions", [("user_id", ASCENDING), ("createdAt", DESCENDING), ("_id", DESCENDING)], {}),
+    # a serie's subscribers (fan-out, listing, delete_serie cleanup)
+    ("subscriptions", [("serie_id", ASCENDING), ("createdAt", DESCENDING), ("_id", DESCENDING)], {}),
+]
+
+
+def ensure_indexes(db):
+    """Create the declared indexes; a no-op when they already exist."""
+    for collection, keys, options in INDEXES:
+        db.get_collection(collection).create_index(keys, **options)
+
+
+class CommandCounter(monitoring.CommandListener):
+    """Records `(command_name, collection)` for every command a client sends,
+    leaving out connection handshakes and index maintenance. Pass it to
+    `MongoClient(event_listeners=[...])` to count round trips."""
+
+    IGNORED = DRIVER_COMMANDS | {"createIndexes", "buildInfo", "getLastError"}
+
+    def __init__(self):
+        self.commands = []
+        self._lock = Lock()
+
+    def started(self, event):
+        if event.command_name not in self.IGNORED:
+            target = event.command.get(event.command_name)
+            with self._lock:
+                self.commands.append((event.command_name, target if isinstance(target, str) else None))
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+    def reset(self):
+        with self._lock:
+            self.commands = []
+
+    def __len__(self):
+        return len(self.commands)
+
+
+_TRANSACTIONS = {}
+
+
+def supports_transactions(db):
+    """True when `db` lives on a replica set or sharded cluster. Checked once
+    per client; MONGODB_TRANSACTIONS=false turns transactions off entirely."""
+    if str(os.environ.get("MONGODB_TRANSACTIONS", "true")).lower() in ("0", "false", "no"):
+        return False
+    client = db.client
+    key = id(client)
+    if key not in _TRANSACTIONS:
+        try:
+            hello = client.admin.command("hello")
+            _TRANSACTIONS[key] = bool(hello.get("setName")) or hello.get("msg") == "isdbgrid"
+        except Exception:
+            # standalone servers answer hello; anything else (mongomock) can't do sessions
+            _TRANSACTIONS[key] = False
+    return _TRANSACTIONS[key]
+
+
+def run_in_transaction(db, callback):
+    """Run `callback(session)` inside a multi-document transaction using the
+    driver's `with_transaction` retry loop, and return its result.
+
+    Without transaction support the callback runs once with `session=None`;
+    callbacks must then undo their own partial writes before raising.
+    """
+    if not supports_transactions(db):
+        return callback(None)
+    with db.client.start_session() as session:
+        return session.with_transaction(callback)
 
 
 @lru_cache()
@@ -10,8 +106,15 @@ def connect_to_database():
     db_name = os.environ.get("MONGODB_NAME")
     if not uri:
         return None
-    client = MongoClient(uri)
+    listeners = [tracing.MongoCommandSpans(), SLOW_QUERIES]
+    if metrics.ENABLED:
+        listeners.append(metrics.MongoCommandMetrics())
+    client = MongoClient(uri, event_listeners=listeners)
+    SLOW_QUERIES.attach(client)
     if db_name:
-        return client[db_name]
-    # If db name not provided, return client database from URI
-    return client.get_default_database()
+        db = client[db_name]
+    else:
+        # If db name not provided, return client database from URI
+        db = client.get_default_database()
+    ensure_indexes(db)
+    return db
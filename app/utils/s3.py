@@ -1,4 +1,5 @@
 import os
+from app.utils.metrics import external_call
 try:
     import boto3
 except Exception:
@@ -6,13 +7,23 @@ except Exception:
 
 
 def upload_via_cloudfront(id_token, buffer, key, content_type, prefix=""):
-    """Upload bytes buffer to S3 and return a URL. If boto3 not configured, return a placeholder URL."""
+    """Upload to S3 and return a URL. If boto3 not configured, return a placeholder URL.
+
+    `buffer` is bytes or a readable file object; file objects (e.g. werkzeug
+    FileStorage, which spools large uploads to disk) are streamed in parts
+    by `upload_fileobj` instead of being read into worker memory."""
     bucket = os.environ.get("S3_BUCKET_NAME")
     region = os.environ.get("AWS_REGION")
     if boto3 and bucket and region:
         s3 = boto3.client("s3")
         full_key = f"{prefix}/{key}" if prefix else key
-        s3.put_object(Bucket=bucket, Key=full_key, Body=buffer, ContentType=content_type)
+        if hasattr(buffer, "read"):
+            extra = {"ContentType": content_type} if content_type else None
+            with external_call("s3", "upload_fileobj"):
+                s3.upload_fileobj(buffer, bucket, full_key, ExtraArgs=extra)
+        else:
+            with external_call("s3", "put_object"):
+                s3.put_object(Bucket=bucket, Key=full_key, Body=buffer, ContentType=content_type)
         return f"https://{bucket}.s3.{region}.amazonaws.com/{full_key}"
     # Fallback: return a deterministic placeholder
     return f"https://cdn.local/{prefix}/{key}" if prefix else f"https://cdn.local/{key}"
@@ -32,7 +43,8 @@ def delete_via_cloudfront(url_or_key):
         else:
             key = url_or_key
         try:
-            s3.delete_object(Bucket=bucket, Key=key)
+            with external_call("s3", "delete_object"):
+                s3.delete_object(Bucket=bucket, Key=key)
         except Exception:
             pass
     return True
@@ -0,0 +1,88 @@
+"""Accent-insensitive tokenisation and an in-process inverted index for titles.
+
+Vietnamese titles are folded to plain ASCII-ish lowercase tokens ("Bài học"
+-> ["bai", "hoc"]) so that users typing without diacritics still match. The
+same tokens are stored on Mongo documents (`serie_title_tokens`, multikey
+indexed) and fed to `InvertedIndex` for the in-memory store.
+"""
+import heapq
+import os
+import re
+import unicodedata
+from collections import Counter
+from itertools import islice
+from operator import itemgetter
+from threading import Lock
+
+_TOKEN_RE = re.compile(r"\w+")
+# titles scored per Mongo search, split evenly between the query's terms: the
+# most subscribed titles containing each term, so common terms don't rank
+# every title that contains them and rare ones are always fully scored
+SEARCH_CANDIDATES = int(os.environ.get("SEARCH_CANDIDATES", "1000"))
+# letters that carry no combining mark under NFD and need an explicit mapping
+_EXTRA_FOLDS = str.maketrans({"đ": "d", "Đ": "d", "ł": "l", "Ł": "l", "ø": "o", "Ø": "o"})
+
+
+def fold(text):
+    """Lowercase `text` and strip diacritics."""
+    decomposed = unicodedata.normalize("NFD", str(text or "").translate(_EXTRA_FOLDS))
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return stripped.casefold()
+
+
+def tokenize(text):
+    """Distinct folded tokens of `text`, in order of first appearance."""
+    return list(dict.fromkeys(_TOKEN_RE.findall(fold(text))))
+
+
+class InvertedIndex:
+    """token -> set(doc_id) postings with ranked multi-term lookup."""
+
+    def __init__(self):
+        self._postings = {}
+        self._doc_tokens = {}
+        self._lock = Lock()
+
+    def add(self, doc_id, text):
+        tokens = tuple(tokenize(text))
+        with self._lock:
+            self._remove(doc_id)
+            self._doc_tokens[doc_id] = tokens
+            for token in tokens:
+                self._postings.setdefault(token, set()).add(doc_id)
+
+    def remove(self, doc_id):
+        with self._lock:
+            self._remove(doc_id)
+
+    def _remove(self, doc_id):
+        for token in self._doc_tokens.pop(doc_id, ()):
+            postings = self._postings.get(token)
+            if postings is not None:
+                postings.discard(doc_id)
+                if not postings:
+                    del self._postings[token]
+
+    def search(self, query, limit=20):
+        """Ids matching any query term, best first (more matched terms wins).
+        Order within a score is arbitrary but stable for an unchanged index."""
+        terms = tokenize(query)
+        with self._lock:
+            postings = [self._postings[t] for t in terms if t in self._postings]
+            if not postings:
+                return []
+            if len(postings) == 1:
+                return list(islice(postings[0], limit))
+            # documents matching every term outrank everything else; when
+            # there are enough of them the (expensive) scoring pass is skipped
+            postings.sort(key=len)
+            complete = postings[0].intersection(*postings[1:])
+            if len(complete) >= limit:
+                return list(islice(complete, limit))
+            scores = Counter()
+            for ids in postings:
+                scores.update(ids)
+        return [doc_id for doc_id, _ in heapq.nlargest(limit, scores.items(), key=itemgetter(1))]
+
+    def __len__(self):
+        return len(self._doc_tokens)
@@ -0,0 +1,192 @@
+"""Slow MongoDB command log with per-shape statistics and plan capture.
+
+`SlowQueryLog` is a pymongo CommandListener. Commands slower than
+MONGO_SLOW_MS are logged with their *shape*: the filter, sort, projection or
+pipeline with every value replaced by "?", so the log carries no user data
+and equal queries group together. The first time a slow shape is seen, its
+command is explained (queryPlanner verbosity) on a background thread and
+plans that scan a whole collection (COLLSCAN) are flagged.
+
+Statistics per (command, collection, shape) are kept in memory for this
+worker and served by the admin blueprint (GET /api/admin/slow-queries).
+
+Settings (environment):
+  - MONGO_SLOW_MS      : threshold in milliseconds (default 100)
+  - MONGO_SLOW_EXPLAIN : explain new slow shapes (default true)
+  - MONGO_SLOW_SHAPES  : distinct shapes kept (default 500)
+"""
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+
+from pymongo import monitoring
+
+from app.utils.driver_commands import DRIVER_COMMANDS
+
+logger = logging.getLogger(__name__)
+
+# the parts of each command that decide its plan
+_SHAPE_FIELDS = {
+    "find": ("filter", "sort", "projection"),
+    "aggregate": ("pipeline",),
+    "findAndModify": ("query", "sort"),
+    "count": ("query",),
+    "distinct": ("key", "query"),
+    "update": ("updates",),
+    "delete": ("deletes",),
+}
+# keys of `updates` / `deletes` entries that shape the plan (not `u`, the values)
+_STATEMENT_FIELDS = ("q", "multi", "limit")
+# session and transaction fields that explain refuses
+_NOT_EXPLAINABLE = ("lsid", "txnNumber", "autocommit", "startTransaction", "$clusterTime", "$db",
+                    "$readPreference", "readConcern", "writeConcern")
+
+
+def shape(value):
+    """`value` with every scalar replaced by "?". Keys (field names and
+    operators) are kept; a list of scalars collapses to ["?"]."""
+    if isinstance(value, dict):
+        return {k: shape(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        items = [shape(v) for v in value]
+        return items if any(isinstance(v, (dict, list)) for v in items) else ["?"]
+    return "?"
+
+
+def command_shape(name, command):
+    fields = _SHAPE_FIELDS.get(name, ())
+    out = {}
+    for field in fields:
+        if field not in command:
+            continue
+        if field in ("updates", "deletes"):
+            out[field] = [shape({k: s[k] for k in _STATEMENT_FIELDS if k in s}) for s in command[field][:1]]
+        elif field == "key":
+            out[field] = command[field]
+        else:
+            out[field] = shape(command[field])
+    return out
+
+
+def plan_stages(explain):
+    """Stage names of every winning plan in an explain document."""
+    stages = []
+
+    def walk(node, in_plan):
+        if isinstance(node, dict):
+            if in_plan and isinstance(node.get("stage"), str):
+                stages.append(node["stage"])
+            for key, child in node.items():
+                walk(child, in_plan or key in ("winningPlan", "queryPlan"))
+        elif isinstance(node, list):
+            for child in node:
+                walk(child, in_plan)
+
+    walk(explain, False)
+    return stages
+
+
+class SlowQueryLog(monitoring.CommandListener):
+    # its own explains and cursor upkeep, and index maintenance
+    IGNORED = DRIVER_COMMANDS | {"explain", "getMore", "killCursors", "createIndexes", "buildInfo"}
+
+    def __init__(self, threshold_ms=None, explain=None, max_shapes=None):
+        env = os.environ.get
+        self.threshold_ms = float(env("MONGO_SLOW_MS", "100") if threshold_ms is None else threshold_ms)
+        if explain is None:
+            explain = str(env("MONGO_SLOW_EXPLAIN", "true")).lower() not in ("0", "false", "no")
+        self.explain = explain
+        self.max_shapes = int(env("MONGO_SLOW_SHAPES", "500") if max_shapes is None else max_shapes)
+        self.client = None
+        self._pending = {}
+        self._shapes = {}
+        self._lock = Lock()
+        self._executor = None
+
+    def attach(self, client):
+        """The client used to explain new slow shapes."""
+        self.client = client
+
+    def started(self, event):
+        if event.command_name in self.IGNORED:
+            return
+        with self._lock:
+            self._pending[(event.connection_id, event.request_id)] = (event.database_name, event.command)
+
+    def _finish(self, event, error):
+        with self._lock:
+            started = self._pending.pop((event.connection_id, event.request_id), None)
+        if started is None:
+            return
+        millis = event.duration_micros / 1000
+        if millis < self.threshold_ms:
+            return
+        database, command = started
+        name = event.command_name
+        target = command.get(name)
+        collection = target if isinstance(target, str) else ""
+        filters = command_shape(name, command)
+        key = (name, collection, json.dumps(filters, sort_keys=True, default=str))
+        with self._lock:
+            stats = self._shapes.get(key)
+            new = stats is None
+            if new:
+                if len(self._shapes) >= self.max_shapes:
+                    return
+                stats = self._shapes[key] = {
+                    "command": name, "collection": collection, "shape": filters,
+                    "count": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0,
+                    "last_seen": None, "plan": None, "collscan": None,
+                }
+            stats["count"] += 1
+            stats["errors"] += error
+            stats["total_ms"] += millis
+            stats["max_ms"] = max(stats["max_ms"], millis)
+            stats["last_seen"] = time.time()
+        logger.warning("slow mongo %s on %s took %.1f ms: %s", name, collection or database, millis, key[2])
+        if new and self.explain and self.client is not None and not error and name in _SHAPE_FIELDS:
+            self._explain_later(key, database, command)
+
+    def _explain_later(self, key, database, command):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="explain")
+        explainable = {k: v for k, v in command.items() if k not in _NOT_EXPLAINABLE}
+        self._executor.submit(self._explain, key, database, explainable)
+
+    def _explain(self, key, database, command):
+        try:
+            result = self.client[database].command("explain", command, verbosity="queryPlanner")
+        except Exception as exc:
+            logger.info("explain of slow %s on %s failed: %s", key[0], key[1], exc)
+            return
+        stages = plan_stages(result)
+        with self._lock:
+            stats = self._shapes.get(key)
+            if stats is not None:
+                stats["plan"] = stages
+                stats["collscan"] = "COLLSCAN" in stages
+        if "COLLSCAN" in stages:
+            logger.warning("slow mongo %s on %s scans the whole collection: %s", key[0], key[1], key[2])
+
+    def succeeded(self, event):
+        self._finish(event, False)
+
+    def failed(self, event):
+        self._finish(event, True)
+
+    def snapshot(self):
+        """Shape statistics, the most total time first."""
+        with self._lock:
+            rows = [dict(s, avg_ms=s["total_ms"] / s["count"]) for s in self._shapes.values()]
+        return sorted(rows, key=lambda s: s["total_ms"], reverse=True)
+
+    def reset(self):
+        with self._lock:
+            self._shapes.clear()
+
+
+# the listener every client from app.utils.mongodb reports to
+SLOW_QUERIES = SlowQueryLog()
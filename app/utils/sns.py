@@ -1,4 +1,5 @@
 import os
+from app.utils.metrics import external_call
 try:
     import boto3
 except Exception:
@@ -9,7 +10,8 @@ def create_topic(name):
     """Create an SNS topic and return its ARN. If boto3 not configured, return a fake ARN."""
     if boto3 and os.environ.get("AWS_REGION"):
         sns = boto3.client("sns")
-        resp = sns.create_topic(Name=name)
+        with external_call("sns", "create_topic"):
+            resp = sns.create_topic(Name=name)
         return resp.get("TopicArn")
     return f"arn:local:sns:{name}"
 
@@ -18,7 +20,8 @@ def delete_topic(arn):
     if boto3 and os.environ.get("AWS_REGION"):
         sns = boto3.client("sns")
         try:
-            sns.delete_topic(TopicArn=arn)
+            with external_call("sns", "delete_topic"):
+                sns.delete_topic(TopicArn=arn)
         except Exception:
             pass
     return True
@@ -27,7 +30,8 @@ def delete_topic(arn):
 def subscribe_to_serie(topic_arn, email):
     if boto3 and os.environ.get("AWS_REGION"):
         sns = boto3.client("sns")
-        return sns.subscribe(TopicArn=topic_arn, Protocol="email", Endpoint=email)
+        with external_call("sns", "subscribe"):
+            return sns.subscribe(TopicArn=topic_arn, Protocol="email", Endpoint=email)
     # fallback: pretend subscription succeeded
     return {"SubscriptionArn": f"arn:local:sub:{email}"}
 
@@ -40,6 +44,7 @@ def unsubscribe_from_topic(topic_arn, email):
 def publish_to_topic(topic_arn, subject, message):
     if boto3 and os.environ.get("AWS_REGION"):
         sns = boto3.client("sns")
-        sns.publish(TopicArn=topic_arn, Subject=subject, Message=message)
+        with external_call("sns", "publish"):
+            sns.publish(TopicArn=topic_arn, Subject=subject, Message=message)
         return True
     return True
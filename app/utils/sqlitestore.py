@@ -0,0 +1,301 @@
+"""SQLite-backed document store with the `DocumentStore` interface.
+
+One database file (WAL mode) holds every collection, so all gunicorn
+workers on a node see the same data and it survives restarts. Each
+collection is a `(seq, id, doc)` table with the document as JSON, plus a
+`(field, value, seq)` side table that serves the declared equality indexes
+(multikey for lists) and the token postings of `text` fields. `seq` is
+the insertion order, so "newest first" is a reverse index scan.
+
+Connections are opened per process and thread; statements are fixed SQL
+with parameters, so sqlite3's per-connection statement cache reuses the
+prepared statements. Every write, including `modify`'s read-modify-write
+and `delete`'s guard, runs in one `BEGIN IMMEDIATE` transaction and is
+therefore atomic across workers; a `get` followed by a separate write is
+not, so callers that derive a write from a read use `modify`.
+"""
+import json
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime
+from itertools import islice
+
+from app.utils.memstore import DuplicateIdError, _index_values, _matches
+from app.utils.search import tokenize
+
+_NAME_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+# SQLite's default limit on host parameters is 999 on older builds
+_CHUNK = 500
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        return {"$date": value.isoformat()}
+    if isinstance(value, (set, tuple)):
+        return list(value)
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def _hook(obj):
+    if len(obj) == 1 and "$date" in obj:
+        return datetime.fromisoformat(obj["$date"])
+    return obj
+
+
+def _dumps(doc):
+    return json.dumps(doc, default=_default, ensure_ascii=False, separators=(",", ":"))
+
+
+def _loads(text):
+    return json.loads(text, object_hook=_hook)
+
+
+def _text_key(field):
+    return f"{field}#text"
+
+
+class SQLiteStore:
+    """Collection `name` in the SQLite database at `path`."""
+
+    shared = True
+
+    def __init__(self, path, name, indexes=(), text=()):
+        if not _NAME_RE.match(name):
+            raise ValueError(f"Invalid collection name: {name!r}")
+        self.path = path
+        self.name = name
+        self.indexes = tuple(indexes)
+        self.text = tuple(text)
+        self._local = threading.local()
+        t, idx = f'"{name}"', f'"{name}__idx"'
+        self._sql = {
+            "insert": f"INSERT INTO {t} (id, doc) VALUES (?, ?)",
+            "link": f"INSERT OR IGNORE INTO {idx} (field, value, seq) VALUES (?, ?, ?)",
+            "unlink": f"DELETE FROM {idx} WHERE seq = ?",
+            "get": f"SELECT seq, doc FROM {t} WHERE id = ?",
+            "replace": f"UPDATE {t} SET doc = ? WHERE seq = ?",
+            "delete": f"DELETE FROM {t} WHERE seq = ?",
+            "all": f"SELECT seq, doc FROM {t} ORDER BY seq",
+            "all_desc": f"SELECT seq, doc FROM {t} ORDER BY seq DESC",
+            "by_index": f"SELECT d.seq, d.doc FROM {idx} i JOIN {t} d ON d.seq = i.seq WHERE i.field = ? AND i.value = ? ORDER BY i.seq",
+            "by_index_desc": f"SELECT d.seq, d.doc FROM {idx} i JOIN {t} d ON d.seq = i.seq WHERE i.field = ? AND i.value = ? ORDER BY i.seq DESC",
+            "count_index": f"SELECT COUNT(*) FROM {idx} WHERE field = ? AND value = ?",
+            "count": f"SELECT COUNT(*) FROM {t}",
+            "clear": f"DELETE FROM {t}",
+            "clear_index": f"DELETE FROM {idx}",
+            "many": f"SELECT id, doc FROM {t} WHERE id IN ({{}})",
+            "rank": (f"SELECT d.doc FROM {idx} i JOIN {t} d ON d.seq = i.seq WHERE i.field = ? AND i.value IN ({{}}) "
+                     "GROUP BY i.seq ORDER BY COUNT(*) DESC, i.seq LIMIT ?"),
+        }
+        self._schema = (
+            f"CREATE TABLE IF NOT EXISTS {t} (seq INTEGER PRIMARY KEY AUTOINCREMENT, id TEXT NOT NULL UNIQUE, doc TEXT NOT NULL)",
+            f"CREATE TABLE IF NOT EXISTS {idx} (field TEXT NOT NULL, value, seq INTEGER NOT NULL, "
+            "PRIMARY KEY (field, value, seq)) WITHOUT ROWID",
+            f'CREATE INDEX IF NOT EXISTS "{name}__idx_seq" ON {idx} (seq)',
+        )
+
+    # -- connection -------------------------------------------------------------
+
+    def _conn(self):
+        # connections must not cross a fork, nor (by default) threads
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, cached_statements=256)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=30000")
+        for statement in self._schema:
+            conn.execute(statement)
+        self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def _write(self):
+        """Context manager running a write transaction on this thread's connection."""
+        return _Transaction(self._conn())
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    # -- internal ---------------------------------------------------------------
+
+    def _keys(self, doc):
+        keys = []
+        for field in self.indexes:
+            if field in doc:
+                keys.extend((field, v) for v in _index_values(doc[field]))
+        for field in self.text:
+            keys.extend((_text_key(field), token) for token in tokenize(doc.get(field)))
+        return keys
+
+    def _link(self, conn, seq, doc):
+        conn.executemany(self._sql["link"], [(field, value, seq) for field, value in self._keys(doc)])
+
+    def _load(self, conn, doc_id):
+        row = conn.execute(self._sql["get"], (str(doc_id),)).fetchone()
+        return (row[0], _loads(row[1])) if row else (None, None)
+
+    def _replace(self, conn, seq, old, doc):
+        conn.execute(self._sql["replace"], (_dumps(doc), seq))
+        if self._keys(old) != self._keys(doc):
+            conn.execute(self._sql["unlink"], (seq,))
+            self._link(conn, seq, doc)
+
+    def _scan(self, conn, criteria, reverse):
+        suffix = "_desc" if reverse else ""
+        for field, expected in criteria.items():
+            if field in self.indexes and not isinstance(expected, (list, dict)):
+                return conn.execute(self._sql["by_index" + suffix], (field, expected))
+        return conn.execute(self._sql["all" + suffix])
+
+    # -- writes -----------------------------------------------------------------
+
+    def insert(self, doc):
+        with self._write() as conn:
+            try:
+                seq = conn.execute(self._sql["insert"], (str(doc["_id"]), _dumps(doc))).lastrowid
+            except sqlite3.IntegrityError:
+                raise DuplicateIdError(doc["_id"]) from None
+            self._link(conn, seq, doc)
+        return dict(doc)
+
+    def insert_many(self, docs):
+        taken = []
+        with self._write() as conn:
+            for doc in docs:
+                try:
+                    seq = conn.execute(self._sql["insert"], (str(doc["_id"]), _dumps(doc))).lastrowid
+                except sqlite3.IntegrityError:
+                    taken.append(doc["_id"])
+                    continue
+                self._link(conn, seq, doc)
+        return taken
+
+    def update(self, doc_id, changes=None, inc=None):
+        return self.modify(doc_id, lambda doc: changes or {}, inc)[1]
+
+    def modify(self, doc_id, fn, inc=None):
+        with self._write() as conn:
+            seq, old = self._load(conn, doc_id)
+            if old is None:
+                return None, None
+            changes = fn(dict(old))
+            if changes is None:
+                return old, None
+            doc = {**old, **changes}
+            for field, amount in (inc or {}).items():
+                doc[field] = (doc.get(field) or 0) + amount
+            doc["_id"] = old["_id"]
+            self._replace(conn, seq, old, doc)
+        return old, doc
+
+    def upsert(self, doc_id, changes, on_insert=None, inc=None):
+        with self._write() as conn:
+            seq, old = self._load(conn, doc_id)
+            doc = {"_id": doc_id, **(on_insert or {}), **changes} if old is None else {**old, **changes, "_id": old["_id"]}
+            for field, amount in (inc or {}).items():
+                doc[field] = (doc.get(field) or 0) + amount
+            if old is None:
+                seq = conn.execute(self._sql["insert"], (str(doc_id), _dumps(doc))).lastrowid
+                self._link(conn, seq, doc)
+            else:
+                self._replace(conn, seq, old, doc)
+        return doc
+
+    def delete(self, doc_id, guard=None):
+        with self._write() as conn:
+            seq, doc = self._load(conn, doc_id)
+            if doc is not None and guard is not None and not guard(dict(doc)):
+                return None
+            if doc is not None:
+                conn.execute(self._sql["unlink"], (seq,))
+                conn.execute(self._sql["delete"], (seq,))
+        return doc
+
+    def delete_many(self, criteria):
+        with self._write() as conn:
+            seqs = [seq for seq, text in self._scan(conn, criteria, False).fetchall() if _matches(_loads(text), criteria)]
+            for seq in seqs:
+                conn.execute(self._sql["unlink"], (seq,))
+                conn.execute(self._sql["delete"], (seq,))
+        return len(seqs)
+
+    def clear(self):
+        with self._write() as conn:
+            conn.execute(self._sql["clear_index"])
+            conn.execute(self._sql["clear"])
+
+    # -- reads ------------------------------------------------------------------
+
+    def get(self, doc_id):
+        return self._load(self._conn(), doc_id)[1]
+
+    def get_many(self, ids):
+        ids = [str(i) for i in ids]
+        conn = self._conn()
+        found = {}
+        for start in range(0, len(ids), _CHUNK):
+            chunk = ids[start:start + _CHUNK]
+            sql = self._sql["many"].format(",".join("?" * len(chunk)))
+            found.update((doc_id, _loads(text)) for doc_id, text in conn.execute(sql, chunk))
+        return found
+
+    def find(self, criteria=None, where=None, reverse=False, skip=0, limit=None):
+        criteria = criteria or {}
+        rows = self._scan(self._conn(), criteria, reverse)
+        try:
+            docs = (_loads(text) for _, text in rows)
+            docs = (d for d in docs if _matches(d, criteria) and (where is None or where(d)))
+            stop = None if limit is None else skip + limit
+            return list(islice(docs, skip, stop))
+        finally:
+            # an unfinished SELECT would keep this connection's read snapshot open
+            rows.close()
+
+    def count(self, criteria=None):
+        criteria = criteria or {}
+        conn = self._conn()
+        if not criteria:
+            return conn.execute(self._sql["count"]).fetchone()[0]
+        if len(criteria) == 1:
+            (field, expected), = criteria.items()
+            if field in self.indexes and not isinstance(expected, (list, dict)):
+                return conn.execute(self._sql["count_index"], (field, expected)).fetchone()[0]
+        return len(self.find(criteria))
+
+    def search(self, field, query, limit=20):
+        """Documents whose `field` shares tokens with `query`, most shared
+        tokens first (oldest first within a score)."""
+        terms = tokenize(query)
+        if not terms:
+            return []
+        sql = self._sql["rank"].format(",".join("?" * len(terms)))
+        return [_loads(text) for text, in self._conn().execute(sql, (_text_key(field), *terms, limit))]
+
+    def __contains__(self, doc_id):
+        return self._load(self._conn(), doc_id)[1] is not None
+
+    def __len__(self):
+        return self.count()
+
+
+class _Transaction:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        # take the write lock up front so read-modify-write cannot interleave
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("COMMIT" if exc_type is None else "ROLLBACK")
+        return False
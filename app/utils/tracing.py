@@ -0,0 +1,278 @@
+"""Lightweight per-request spans.
+
+app.middleware.tracing starts a `Trace` on `flask.g` when a request needs
+one (Server-Timing is on, or the request is sampled for export). `span()`,
+`traced` and `MongoCommandSpans` record into it, and do nothing outside a
+traced request, so they are cheap to leave in place.
+
+Spans carry W3C/OpenTelemetry ids (a `traceparent` header continues the
+caller's trace) and are exported as OTLP/JSON, one trace per line or POST,
+from a background thread.
+"""
+import json
+import os
+import queue
+import re
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+import requests
+from flask import g, has_app_context
+from pymongo import monitoring
+
+from app.utils.driver_commands import DRIVER_COMMANDS
+
+# OTLP span kinds
+INTERNAL, SERVER, CLIENT = 1, 2, 3
+
+_TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+
+class Span:
+    __slots__ = ("span_id", "parent_id", "name", "category", "kind", "start", "end", "attributes", "error")
+
+    def __init__(self, parent_id, name, category, kind, start, attributes):
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.category = category
+        self.kind = kind
+        self.start = start
+        self.end = None
+        self.attributes = attributes
+        self.error = None
+
+    @property
+    def duration(self):
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+
+class Trace:
+    """The spans of one request. Times are `perf_counter` seconds, anchored
+    to the wall clock once so exported timestamps stay monotonic."""
+
+    def __init__(self, trace_id=None, parent_id=None, sampled=False):
+        self.trace_id = trace_id or secrets.token_hex(16)
+        self.parent_id = parent_id
+        self.sampled = sampled
+        self.spans = []
+        self._open = []
+        # Mongo commands in flight, by (connection_id, request_id)
+        self.pending = {}
+        self._wall_ns = time.time_ns()
+        self._perf = time.perf_counter()
+
+    def unix_nanos(self, perf):
+        return self._wall_ns + int((perf - self._perf) * 1e9)
+
+    def _parent(self):
+        return self._open[-1].span_id if self._open else self.parent_id
+
+    def start(self, name, category, kind=INTERNAL, **attributes):
+        """Open a span; spans started before it is finished are its children."""
+        span = Span(self._parent(), name, category, kind, time.perf_counter(), attributes)
+        self.spans.append(span)
+        self._open.append(span)
+        return span
+
+    def finish(self, span, error=None):
+        span.end = time.perf_counter()
+        if error is not None:
+            span.error = f"{type(error).__name__}: {error}"
+        if span in self._open:
+            self._open.remove(span)
+
+    def add(self, name, category, start, end, kind=INTERNAL, error=None, **attributes):
+        """Record an already timed span under the innermost open one."""
+        span = Span(self._parent(), name, category, kind, start, attributes)
+        span.end = end
+        span.error = error
+        self.spans.append(span)
+        return span
+
+
+def current():
+    """The request's `Trace`, or None."""
+    return g.get("trace") if has_app_context() else None
+
+
+@contextmanager
+def span(name, category, kind=INTERNAL, **attributes):
+    trace = current()
+    if trace is None:
+        yield None
+        return
+    opened = trace.start(name, category, kind, **attributes)
+    try:
+        yield opened
+    except BaseException as exc:
+        trace.finish(opened, exc)
+        raise
+    trace.finish(opened)
+
+
+def traced(func):
+    """Decorator: a "svc" span named `<module>.<function>` around each call."""
+    name = f"{func.__module__.rsplit('.', 1)[-1]}.{func.__name__}"
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if current() is None:
+            return func(*args, **kwargs)
+        with span(name, "svc"):
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+class MongoCommandSpans(monitoring.CommandListener):
+    """A CLIENT span for every command sent while a trace is active. pymongo
+    calls listeners on the thread running the command, so the request's
+    trace is reachable through `flask.g`."""
+
+    IGNORED = DRIVER_COMMANDS
+
+    def started(self, event):
+        trace = current()
+        if trace is None or event.command_name in self.IGNORED:
+            return
+        target = event.command.get(event.command_name)
+        trace.pending[(event.connection_id, event.request_id)] = (
+            time.perf_counter(), target if isinstance(target, str) else "")
+
+    def _finish(self, event, error=None):
+        trace = current()
+        started = trace.pending.pop((event.connection_id, event.request_id), None) if trace is not None else None
+        if started is None:
+            return
+        start, collection = started
+        name = f"mongo.{event.command_name} {collection}".rstrip()
+        trace.add(name, "mongo", start, start + event.duration_micros / 1e6, CLIENT, error,
+                  **{"db.system": "mongodb", "db.operation": event.command_name, "db.collection": collection})
+
+    def succeeded(self, event):
+        self._finish(event)
+
+    def failed(self, event):
+        self._finish(event, str(event.failure.get("errmsg", "failed")))
+
+
+def parse_traceparent(header):
+    """`(trace_id, parent_span_id, sampled)` from a W3C traceparent header,
+    or None when it is missing or malformed."""
+    match = _TRACEPARENT.match((header or "").strip().lower())
+    if match is None or match.group(1) == "0" * 32 or match.group(2) == "0" * 16:
+        return None
+    return match.group(1), match.group(2), bool(int(match.group(3), 16) & 1)
+
+
+def server_timing(trace):
+    """Server-Timing header value: total milliseconds per category. A span
+    nested in another of the same category (a service calling a service)
+    is only counted through its ancestor."""
+    by_id = {s.span_id: s for s in trace.spans}
+    totals = {}
+    for s in trace.spans:
+        parent = by_id.get(s.parent_id)
+        while parent is not None and parent.category != s.category:
+            parent = by_id.get(parent.parent_id)
+        if parent is None:
+            entry = totals.setdefault(s.category, [0.0, 0])
+            entry[0] += s.duration
+            entry[1] += 1
+    parts = []
+    for category, (seconds, count) in totals.items():
+        part = f"{category};dur={seconds * 1000:.1f}"
+        if count > 1:
+            part += f';desc="{count} calls"'
+        parts.append(part)
+    if trace.sampled:
+        parts.append(f'trace;desc="{trace.trace_id}"')
+    return ", ".join(parts)
+
+
+def _attribute(key, value):
+    if isinstance(value, bool):
+        encoded = {"boolValue": value}
+    elif isinstance(value, int):
+        encoded = {"intValue": str(value)}
+    elif isinstance(value, float):
+        encoded = {"doubleValue": value}
+    else:
+        encoded = {"stringValue": str(value)}
+    return {"key": key, "value": encoded}
+
+
+def to_otlp(trace, service_name):
+    """The trace as an OTLP/JSON ExportTraceServiceRequest."""
+    spans = []
+    for s in trace.spans:
+        doc = {
+            "traceId": trace.trace_id,
+            "spanId": s.span_id,
+            "name": s.name,
+            "kind": s.kind,
+            "startTimeUnixNano": str(trace.unix_nanos(s.start)),
+            "endTimeUnixNano": str(trace.unix_nanos(s.end if s.end is not None else s.start)),
+            "attributes": [_attribute(k, v) for k, v in s.attributes.items()],
+            "status": {"code": 2, "message": s.error} if s.error else {"code": 1},
+        }
+        if s.parent_id:
+            doc["parentSpanId"] = s.parent_id
+        spans.append(doc)
+    return {"resourceSpans": [{
+        "resource": {"attributes": [_attribute("service.name", service_name)]},
+        "scopeSpans": [{"scope": {"name": __name__}, "spans": spans}],
+    }]}
+
+
+class Exporter:
+    """Writes sampled traces to `path` (OTLP/JSON lines) and/or POSTs them to
+    an OTLP/HTTP collector `url`, from a daemon thread so requests never wait
+    on it. Traces are dropped, and counted, when the queue is full."""
+
+    def __init__(self, path=None, url=None, service_name="paas-backend", maxsize=1000):
+        self.path = path
+        self.url = url
+        self.service_name = service_name
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def submit(self, trace):
+        # started lazily, and again after a fork (gunicorn workers)
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    threading.Thread(target=self._run, name="trace-exporter", daemon=True).start()
+                    self._pid = os.getpid()
+        try:
+            self._queue.put_nowait(trace)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            trace = self._queue.get()
+            try:
+                self.export(trace)
+            except Exception:
+                self.dropped += 1
+            finally:
+                self._queue.task_done()
+
+    def export(self, trace):
+        payload = json.dumps(to_otlp(trace, self.service_name), separators=(",", ":"))
+        if self.path:
+            with open(self.path, "a", encoding="utf-8") as fh:
+                fh.write(payload + "\n")
+        if self.url:
+            requests.post(self.url, data=payload, headers={"Content-Type": "application/json"}, timeout=2)
+
+    def flush(self):
+        """Wait until every submitted trace is written."""
+        self._queue.join()
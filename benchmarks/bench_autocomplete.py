@@ -0,0 +1,49 @@
+"""Autocomplete prefix index: build time, memory and lookup latency.
+
+    python -m benchmarks.bench_autocomplete [--series 1000000] [--queries 10000]
+"""
+import argparse
+import random
+import time
+import tracemalloc
+
+from app.utils.autocomplete import PrefixIndex
+from benchmarks.bench_search import SYLLABLES
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--series", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=10_000)
+    parser.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    rnd = random.Random(7)
+    items = [(f"{i:024x}", " ".join(rnd.choices(SYLLABLES, k=rnd.randint(2, 6)))) for i in range(args.series)]
+    tracemalloc.start()
+    start = time.perf_counter()
+    index = PrefixIndex(items)
+    build = time.perf_counter() - start
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"build: {len(index)} titles in {build:.1f}s, {size / 1e6:.0f} MB retained")
+
+    for chars in (1, 3, 8):
+        samples = []
+        for _ in range(args.queries):
+            prefix = rnd.choice(items)[1][:chars]
+            start = time.perf_counter()
+            index.complete(prefix, args.limit)
+            samples.append(time.perf_counter() - start)
+        samples.sort()
+        p50, p99 = samples[len(samples) // 2], samples[int(len(samples) * 0.99)]
+        print(f"{chars}-char prefix: p50 {p50 * 1e6:.0f} us  p99 {p99 * 1e6:.0f} us")
+
+    start = time.perf_counter()
+    for doc_id, title in items[:1000]:
+        index.add(doc_id, title + " v2")
+    print(f"incremental update: {(time.perf_counter() - start) * 1000:.2f} us/op")
+
+
+if __name__ == "__main__":
+    main()
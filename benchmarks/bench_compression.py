@@ -0,0 +1,71 @@
+"""CPU vs bytes trade-off of response compression levels.
+
+Builds a realistic lesson-list JSON body (long `content` fields) and reports,
+for every gzip level and brotli quality, the compression time per response,
+the compressed size and the ratio. Cached (pre-compressed) bodies skip the
+compression cost entirely, so the numbers here are the per-miss cost.
+
+    python -m benchmarks.bench_compression [--lessons 200] [--repeat 20]
+"""
+import argparse
+import gzip
+import json
+import random
+import time
+
+try:
+    import brotli
+except Exception:
+    brotli = None
+
+WORDS = ("bài học python flask mongodb series video tài liệu lập trình "
+         "hướng dẫn cơ bản nâng cao dữ liệu api backend triển khai").split()
+
+
+def lesson_list_body(n_lessons, seed=42):
+    rnd = random.Random(seed)
+    lessons = [
+        {
+            "_id": f"{i:024x}",
+            "lesson_title": " ".join(rnd.choices(WORDS, k=6)),
+            "lesson_serie": "0" * 24,
+            "content": " ".join(rnd.choices(WORDS, k=400)),
+            "lesson_video": f"https://cdn.local/files/user-1/videos/{i}.mp4",
+            "lesson_documents": [f"https://cdn.local/files/user-1/docs/{i}-{d}.pdf" for d in range(3)],
+        }
+        for i in range(n_lessons)
+    ]
+    return json.dumps(lessons, ensure_ascii=False).encode("utf-8")
+
+
+def _time(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, out
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lessons", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    body = lesson_list_body(args.lessons)
+    print(f"body: {len(body)} bytes ({args.lessons} lessons)")
+    print(f"{'codec':<10}{'level':>6}{'ms':>10}{'bytes':>12}{'ratio':>8}{'MB/s':>10}")
+    rows = [("gzip", level, lambda l=level: gzip.compress(body, compresslevel=l, mtime=0)) for level in range(1, 10)]
+    if brotli is not None:
+        rows += [("brotli", q, lambda q=q: brotli.compress(body, quality=q)) for q in range(0, 12)]
+    for codec, level, fn in rows:
+        seconds, out = _time(fn, args.repeat)
+        print(f"{codec:<10}{level:>6}{seconds * 1000:>10.2f}{len(out):>12}{len(body) / len(out):>8.1f}"
+              f"{len(body) / seconds / 1e6:>10.1f}")
+    if brotli is None:
+        print("(brotli not installed; pip install brotli to include it)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""In-memory DocumentStore: build cost, memory and indexed query latency at
+1M records, against the dict of dicts (and linear scans) it replaced.
+
+    python -m benchmarks.bench_memstore [--records 1000000] [--users 20000] [--queries 200]
+"""
+import argparse
+import random
+import time
+import tracemalloc
+
+from app.utils.memstore import DocumentStore
+
+
+def _timed(label, fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    print(f"  {label:<34} p50 {samples[len(samples) // 2] * 1000:8.3f} ms   max {samples[-1] * 1000:8.3f} ms")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--records", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=20_000)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args(argv)
+
+    rnd = random.Random(7)
+    users = [f"user-{i}" for i in range(args.users)]
+    series = [f"{i:024x}" for i in range(args.records // 100 or 1)]
+
+    docs = [{"_id": i, "user_id": rnd.choice(users), "serie_id": rnd.choice(series), "createdAt": i}
+            for i in range(args.records)]
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    store = DocumentStore(indexes=("user_id", "serie_id"))
+    for doc in docs:
+        store.insert(doc)
+    build = time.perf_counter() - start
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"build: {args.records} records in {build:.1f}s, {size / 1e6:.0f} MB retained "
+          f"({size / args.records:.0f} B/record with indexes)")
+
+    # the records themselves, as the store packs them and as plain dict copies
+    tracemalloc.start()
+    packed = [store._pack(doc) for doc in docs]
+    tuples, _ = tracemalloc.get_traced_memory()
+    plain = {doc["_id"]: dict(doc) for doc in docs}
+    dicts = tracemalloc.get_traced_memory()[0] - tuples
+    tracemalloc.stop()
+    print(f"records: {tuples / args.records:.0f} B each as tuples, {dicts / args.records:.0f} B as dicts")
+    del packed, docs
+
+    print(f"queries ({args.queries} each):")
+    _timed("indexed: user's newest 50", lambda: store.find({"user_id": rnd.choice(users)}, reverse=True, limit=50), args.queries)
+    _timed("indexed: serie subscriber count", lambda: store.count({"serie_id": rnd.choice(series)}), args.queries)
+    _timed("indexed: get by id", lambda: store.get(rnd.randrange(args.records)), args.queries)
+    repeat = max(1, args.queries // 20)
+    _timed("dict scan: user's subscriptions", lambda: [d for d in plain.values() if d["user_id"] == users[0]], repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Overhead of the Prometheus instrumentation (app.utils.metrics).
+
+Times the same requests through the Flask test client with and without the
+metrics hooks, then the per-call cost of a histogram observation and of the
+Mongo command listener's started/succeeded pair.
+
+    python -m benchmarks.bench_metrics [--requests 5000] [--calls 200000]
+"""
+import argparse
+import time
+from types import SimpleNamespace
+
+from app import create_app
+from app.utils import metrics
+
+
+def _client(enabled):
+    saved = metrics.ENABLED
+    metrics.ENABLED = enabled
+    try:
+        app = create_app()
+    finally:
+        metrics.ENABLED = saved
+    app.testing = True
+    return app.test_client()
+
+
+def _per_request(client, paths, n):
+    for path in paths:  # warm up routing and the label children
+        client.get(path)
+    start = time.perf_counter()
+    for i in range(n):
+        client.get(paths[i % len(paths)])
+    return (time.perf_counter() - start) / n
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=5_000)
+    parser.add_argument("--calls", type=int, default=200_000)
+    args = parser.parse_args(argv)
+
+    if not metrics.ENABLED:
+        raise SystemExit("prometheus_client is not installed (or METRICS_ENABLED is false)")
+
+    paths = ("/health", "/api/series/search?keyword=python", "/api/series/missing")
+    plain = _per_request(_client(False), paths, args.requests)
+    measured = _per_request(_client(True), paths, args.requests)
+    print(f"request without metrics: {plain * 1e6:.0f} us")
+    print(f"request with metrics:    {measured * 1e6:.0f} us  (+{(measured - plain) * 1e6:.1f} us)")
+
+    child = metrics.HTTP_LATENCY.labels("bench", "GET", "200")
+    start = time.perf_counter()
+    for _ in range(args.calls):
+        child.observe(0.01)
+    print(f"histogram observe (bound labels): {(time.perf_counter() - start) / args.calls * 1e9:.0f} ns")
+
+    start = time.perf_counter()
+    for _ in range(args.calls):
+        metrics.observe(metrics.HTTP_LATENCY, 0.01, endpoint="bench", method="GET", status="200")
+    print(f"histogram observe (label lookup): {(time.perf_counter() - start) / args.calls * 1e9:.0f} ns")
+
+    listener = metrics.MongoCommandMetrics()
+    started = SimpleNamespace(command_name="find", command={"find": "series"}, connection_id=("db", 27017), request_id=0)
+    done = SimpleNamespace(command_name="find", connection_id=("db", 27017), request_id=0, duration_micros=850)
+    start = time.perf_counter()
+    for i in range(args.calls):
+        started.request_id = done.request_id = i
+        listener.started(started)
+        listener.succeeded(done)
+    print(f"mongo listener started+succeeded: {(time.perf_counter() - start) / args.calls * 1e9:.0f} ns")
+
+
+if __name__ == "__main__":
+    main()
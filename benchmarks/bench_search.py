@@ -0,0 +1,48 @@
+"""Title search index build time, memory and query latency at scale.
+
+    python -m benchmarks.bench_search [--series 1000000] [--queries 1000]
+"""
+import argparse
+import random
+import time
+import tracemalloc
+
+from app.utils.search import InvertedIndex
+
+SYLLABLES = ("bài học lập trình cơ bản nâng cao python java mạng máy tính dữ liệu "
+             "thuật toán web thiết kế đồ họa tiếng anh giao tiếp kinh tế toán lý hóa").split()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--series", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    rnd = random.Random(7)
+    titles = [" ".join(rnd.choices(SYLLABLES, k=rnd.randint(2, 6))) for _ in range(args.series)]
+    index = InvertedIndex()
+    tracemalloc.start()
+    start = time.perf_counter()
+    for i, title in enumerate(titles):
+        index.add(f"{i:024x}", title)
+    build = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"build: {args.series} titles in {build:.1f}s, {peak / 1e6:.0f} MB")
+
+    for terms in (1, 2, 3):
+        samples = []
+        for _ in range(args.queries):
+            query = " ".join(rnd.choices(SYLLABLES, k=terms))
+            start = time.perf_counter()
+            index.search(query, args.limit)
+            samples.append(time.perf_counter() - start)
+        samples.sort()
+        p50, p99 = samples[len(samples) // 2], samples[int(len(samples) * 0.99)]
+        print(f"{terms}-term query: p50 {p50 * 1000:.2f} ms  p99 {p99 * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
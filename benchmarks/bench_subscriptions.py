@@ -0,0 +1,109 @@
+"""Subscription storage: legacy `users.serie_subcribe` arrays vs the
+`subscriptions` collection, at up to 1M subscriptions.
+
+Needs a local mongod; everything happens in a scratch database that is
+dropped afterwards.
+
+    MONGODB_URI=mongodb://localhost:27017 python -m benchmarks.bench_subscriptions \\
+        [--subscriptions 1000000] [--users 20000] [--series 2000]
+"""
+import argparse
+import os
+import random
+import time
+from datetime import datetime, timezone
+
+from bson import ObjectId
+from pymongo import MongoClient, ASCENDING
+
+from app.utils.mongodb import INDEXES
+
+
+def _timed(label, fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    print(f"  {label:<34} p50 {samples[len(samples) // 2] * 1000:8.2f} ms   max {samples[-1] * 1000:8.2f} ms")
+
+
+def seed(db, n_subs, n_users, n_series, rnd):
+    series_ids = [ObjectId() for _ in range(n_series)]
+    user_ids = [f"user-{i}" for i in range(n_users)]
+    per_user = {uid: set() for uid in user_ids}
+    # skewed popularity: a few series carry most subscribers
+    weights = [1 / (i + 1) for i in range(n_series)]
+    while sum(len(v) for v in per_user.values()) < n_subs:
+        uid = rnd.choice(user_ids)
+        per_user[uid].update(rnd.choices(series_ids, weights, k=50))
+    now = datetime.now(timezone.utc)
+    db.users.insert_many(
+        [{"_id": uid, "serie_subcribe": [str(s) for s in sids]} for uid, sids in per_user.items()], ordered=False
+    )
+    db.users.create_index([("serie_subcribe", ASCENDING)])
+    batch = []
+    for uid, sids in per_user.items():
+        batch.extend({"user_id": uid, "serie_id": sid, "createdAt": now} for sid in sids)
+        if len(batch) >= 50_000:
+            db.subscriptions.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        db.subscriptions.insert_many(batch, ordered=False)
+    for collection, keys, options in INDEXES:
+        if collection == "subscriptions":
+            db[collection].create_index(keys, **options)
+    heavy_user = max(per_user, key=lambda u: len(per_user[u]))
+    return series_ids, user_ids, heavy_user
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--uri", default=os.environ.get("MONGODB_URI", "mongodb://localhost:27017"))
+    parser.add_argument("--subscriptions", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=20_000)
+    parser.add_argument("--series", type=int, default=2_000)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args(argv)
+
+    rnd = random.Random(3)
+    client = MongoClient(args.uri)
+    db = client[f"bench_subscriptions_{os.getpid()}"]
+    try:
+        start = time.perf_counter()
+        series_ids, user_ids, heavy_user = seed(db, args.subscriptions, args.users, args.series, rnd)
+        print(f"seeded {db.subscriptions.estimated_document_count()} subscriptions in {time.perf_counter() - start:.0f}s")
+        popular = str(series_ids[0])
+
+        print("subscriber listing (popular serie, first 100)")
+        _timed("array: find users by element", lambda: list(db.users.find({"serie_subcribe": popular}, {"_id": 1}).limit(100)), args.repeat)
+        _timed("collection: serie_id index", lambda: list(db.subscriptions.find({"serie_id": series_ids[0]}, {"user_id": 1}).sort([("createdAt", -1), ("_id", -1)]).limit(100)), args.repeat)
+
+        print(f"user's subscriptions ({heavy_user})")
+        def array_subscribed():
+            user = db.users.find_one({"_id": heavy_user}, {"serie_subcribe": 1})
+            return [ObjectId(s) for s in user["serie_subcribe"]]
+        _timed("array: load whole array", array_subscribed, args.repeat)
+        _timed("collection: user_id index", lambda: list(db.subscriptions.find({"user_id": heavy_user}, {"serie_id": 1}).sort([("createdAt", -1), ("_id", -1)])), args.repeat)
+
+        print("subscribe + unsubscribe one (heavy user)")
+        extra = ObjectId()
+        def array_toggle():
+            db.users.update_one({"_id": heavy_user}, {"$addToSet": {"serie_subcribe": str(extra)}})
+            db.users.update_one({"_id": heavy_user}, {"$pull": {"serie_subcribe": str(extra)}})
+        def collection_toggle():
+            db.subscriptions.insert_one({"user_id": heavy_user, "serie_id": extra, "createdAt": datetime.now(timezone.utc)})
+            db.subscriptions.delete_one({"user_id": heavy_user, "serie_id": extra})
+        _timed("array: $addToSet + $pull", array_toggle, args.repeat)
+        _timed("collection: insert + delete", collection_toggle, args.repeat)
+
+        print("delete_serie fan-out (popular serie, run once)")
+        _timed("array: update_many $pull", lambda: db.users.update_many({"serie_subcribe": popular}, {"$pull": {"serie_subcribe": popular}}), 1)
+        _timed("collection: delete_many", lambda: db.subscriptions.delete_many({"serie_id": series_ids[0]}), 1)
+    finally:
+        client.drop_database(db.name)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,422 @@
+"""Hot request paths: throughput, p50 and p99 per case, against a stored baseline.
+
+Cases: bearer verification (RS256 against a locally generated JWKS), JSON
+serialization of large lesson lists, the service functions over mongomock
+(or a scratch database on the mongod at MONGODB_URI) and the upload paths
+under moto. Each case runs --repeat times for --seconds after a short
+warm-up; the median of the repetitions is reported with its spread
+((slowest - fastest) / median p50).
+
+    python -m benchmarks.suite [--filter services.] [--seconds 0.5] [--repeat 5]
+    python -m benchmarks.suite --against main      # run main's suite too, then compare
+    python -m benchmarks.suite --save              # write benchmarks/baseline.json
+    python -m benchmarks.suite --compare [FILE]    # against the baseline (or FILE)
+
+Use --against to check a change in review: it checks the other commit out
+in a temporary git worktree and runs its own suite there, so both sides are
+measured on this machine, one after the other. baseline.json only records
+one machine's numbers; comparing with it elsewhere shows drift, not
+regressions. With --compare/--against the exit status is 1 when a case's
+median p50 is more than --threshold slower and every repetition of it was
+slower than every repetition of the base, so one noisy run of a
+microsecond case does not fail the comparison.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+
+from benchmarks.bench_compression import WORDS
+
+BASELINE = Path(__file__).with_name("baseline.json")
+CASES = {}
+
+
+def case(name):
+    """Register a generator that sets up, yields the callable to time, then
+    cleans up."""
+    def register(setup):
+        CASES[name] = contextmanager(setup)
+        return setup
+    return register
+
+
+@contextmanager
+def _env(**values):
+    saved = {k: os.environ.get(k) for k in values}
+    os.environ.update({k: v for k, v in values.items() if v is not None})
+    for k, v in values.items():
+        if v is None:
+            os.environ.pop(k, None)
+    try:
+        yield
+    finally:
+        for k, v in saved.items():
+            if v is None:
+                os.environ.pop(k, None)
+            else:
+                os.environ[k] = v
+
+
+def _app():
+    from app import create_app
+
+    return create_app()
+
+
+# --- auth -------------------------------------------------------------------
+
+@contextmanager
+def _rs256_request():
+    import jwt
+    from cryptography.hazmat.primitives.asymmetric import rsa
+
+    from app.middleware import auth
+
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    jwk = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(key.public_key()))
+    jwk.update(kid="bench", alg="RS256", use="sig")
+    token = jwt.encode({"userId": "u1", "email": "u1@example.com", "exp": int(time.time()) + 3600},
+                       key, algorithm="RS256", headers={"kid": "bench"})
+    with _env(COGNITO_JWKS_URL="https://jwks.invalid/keys", ALLOW_INSECURE_JWT=None,
+              JWT_AUDIENCE=None, COGNITO_CLIENT_ID=None, JWT_ISSUER=None, COGNITO_ISSUER=None):
+        auth._JWKS_CACHE.update(keys=[jwk], fetched_at=int(time.time()))
+        app = _app()
+        with app.test_request_context(headers={"Authorization": f"Bearer {token}"}):
+            yield auth
+        auth._JWKS_CACHE.update(keys=None, fetched_at=0)
+
+
+@case("auth.verify_rs256")
+def _verify_rs256():
+    with _rs256_request() as auth:
+        def run():
+            claims, error = auth._verify_bearer()
+            assert error is None
+        yield run
+
+
+@case("auth.authenticate_jwt")
+def _authenticate_jwt():
+    with _rs256_request() as auth:
+        yield auth.authenticate_jwt(lambda: None)
+
+
+# --- JSON -------------------------------------------------------------------
+
+def _lessons(n):
+    from bson import ObjectId
+
+    now = datetime.now(timezone.utc)
+    serie = ObjectId()
+    return [{
+        "_id": ObjectId(), "lesson_serie": serie, "lesson_title": " ".join(WORDS[i % 7:i % 7 + 5]),
+        "content": " ".join(WORDS) * 20, "lesson_video": f"https://cdn.local/files/user-1/videos/{i}.mp4",
+        "lesson_documents": [f"https://cdn.local/files/user-1/docs/{i}-{d}.pdf" for d in range(3)],
+        "createdAt": now, "updatedAt": now,
+    } for i in range(n)]
+
+
+def _json_case(n):
+    def setup():
+        app, lessons = _app(), _lessons(n)
+        with app.app_context():
+            yield lambda: app.json.response(lessons).get_data()
+    return setup
+
+
+case("json.lessons_50")(_json_case(50))
+case("json.lessons_500")(_json_case(500))
+
+
+# --- services ---------------------------------------------------------------
+
+@contextmanager
+def _service_db():
+    """Seeded repositories over mongomock, or a scratch database on MONGODB_URI."""
+    from app import repositories
+    from app.services import lesson_service, serie_service, user_service
+
+    uri = os.environ.get("MONGODB_URI")
+    if uri:
+        from pymongo import MongoClient
+
+        client = MongoClient(uri)
+        db = client[f"bench_{uuid.uuid4().hex[:12]}"]
+    else:
+        import mongomock
+
+        client = mongomock.MongoClient()
+        db = client.get_database("bench")
+    from app.utils.mongodb import ensure_indexes
+
+    ensure_indexes(db)
+    previous = repositories.use(repositories.build(db))
+    try:
+        with _env(S3_BUCKET_NAME=None, AWS_REGION=None):
+            user_service.create_user({"cognitoUserId": "u1", "email": "u1@example.com"})
+            serie = serie_service.create_serie({"serie_title": "Bài học Python", "isPublish": "true"}, "u1")
+            lesson_service.create_lessons_bulk(serie["_id"], [{"lesson_title": f"L{i}", "content": "x" * 500}
+                                                              for i in range(50)], "u1")
+            for i in range(200):
+                serie_service.create_serie({"serie_title": " ".join(WORDS[i % 9:i % 9 + 3]), "isPublish": "true"}, "u2")
+            yield serie["_id"], lesson_service.get_all_lessons_by_serie(serie["_id"])[0]["_id"]
+    finally:
+        repositories.use(previous)
+        if uri:
+            client.drop_database(db.name)
+        client.close()
+
+
+def _service_case(name, make):
+    """`make(serie_id, lesson_id)` returns the callable."""
+    def setup():
+        with _service_db() as (serie_id, lesson_id):
+            with _env(S3_BUCKET_NAME=None, AWS_REGION=None):
+                yield make(serie_id, lesson_id)
+    case(f"services.{name}")(setup)
+
+
+def _register_service_cases():
+    from app.services import lesson_service as ls, serie_service as ss, user_service as us
+
+    counter = iter(range(10 ** 9))
+
+    def subscribe_cycle(serie_id):
+        ss.subscribe_serie(serie_id, "u3", "u3@example.com")
+        ss.unsubscribe_serie(serie_id, "u3", "u3@example.com")
+
+    def lesson_cycle(serie_id):
+        lesson = ls.create_lesson({"lesson_title": "tmp", "lesson_serie": serie_id}, "u1")
+        ls.delete_lesson(serie_id, lesson["_id"])
+
+    _service_case("get_user_by_id", lambda s, l: lambda: us.get_user_by_id("u1"))
+    _service_case("update_user", lambda s, l: lambda: us.update_user("u1", {"name": f"U{next(counter)}"}))
+    _service_case("create_serie", lambda s, l: lambda: ss.create_serie({"serie_title": "Bench"}, "u1"))
+    _service_case("get_serie_by_id", lambda s, l: lambda: ss.get_serie_by_id(s))
+    _service_case("get_serie_with_lessons", lambda s, l: lambda: ss.get_serie_with_lessons(s))
+    _service_case("update_serie", lambda s, l: lambda: ss.update_serie(s, {"serie_title": f"T{next(counter)}"}, "u1"))
+    _service_case("search_series_by_title", lambda s, l: lambda: ss.search_series_by_title("bai hoc"))
+    _service_case("autocomplete_series", lambda s, l: lambda: ss.autocomplete_series("bai"))
+    _service_case("subscribe_unsubscribe", lambda s, l: lambda: subscribe_cycle(s))
+    _service_case("get_series_subscribed_by_user", lambda s, l: lambda: ss.get_series_subscribed_by_user("u1"))
+    _service_case("create_delete_lesson", lambda s, l: lambda: lesson_cycle(s))
+    _service_case("get_all_lessons_by_serie", lambda s, l: lambda: ls.get_all_lessons_by_serie(s))
+    _service_case("get_lessons_version", lambda s, l: lambda: ls.get_lessons_version(s))
+    _service_case("get_lesson_by_id", lambda s, l: lambda: ls.get_lesson_by_id(s, l))
+    _service_case("update_lesson", lambda s, l: lambda: ls.update_lesson(s, l, {"lesson_title": f"L{next(counter)}"}))
+
+
+_register_service_cases()
+
+
+# --- uploads ----------------------------------------------------------------
+
+@contextmanager
+def _moto():
+    import boto3
+    import moto
+
+    with _env(AWS_ACCESS_KEY_ID="bench", AWS_SECRET_ACCESS_KEY="bench", AWS_DEFAULT_REGION="us-east-1",
+              AWS_REGION="us-east-1", S3_BUCKET_NAME="paas-bench"):
+        with moto.mock_aws():
+            boto3.setup_default_session()
+            boto3.client("s3").create_bucket(Bucket="paas-bench")
+            yield
+        boto3.DEFAULT_SESSION = None
+
+
+def _upload(name, size):
+    from werkzeug.datastructures import FileStorage
+
+    return FileStorage(io.BytesIO(os.urandom(size)), filename=name, content_type="application/octet-stream")
+
+
+@case("uploads.create_serie_thumbnail")
+def _serie_upload():
+    from app.services import serie_service
+
+    with _service_db(), _moto():
+        yield lambda: serie_service.create_serie({"serie_title": "Up"}, "u1", None, _upload("t.png", 64 * 1024))
+
+
+@case("uploads.create_lesson_files")
+def _lesson_upload():
+    from werkzeug.datastructures import MultiDict
+
+    from app.services import lesson_service, serie_service
+
+    with _service_db(), _moto():
+        # a serie with a real (moto) topic to publish to
+        serie_id = serie_service.create_serie({"serie_title": "Up"}, "u1")["_id"]
+
+        def run():
+            files = MultiDict([("lesson_video", _upload("v.mp4", 1024 * 1024)),
+                               ("lesson_documents", _upload("a.pdf", 128 * 1024)),
+                               ("lesson_documents", _upload("b.pdf", 128 * 1024))])
+            lesson_service.create_lesson({"lesson_title": "Up", "lesson_serie": serie_id}, "u1", None, files)
+        yield run
+
+
+# --- runner -----------------------------------------------------------------
+
+def measure(fn, seconds, min_runs=20, warmup=5):
+    for _ in range(warmup):
+        fn()
+    samples = []
+    deadline = time.perf_counter() + seconds
+    while len(samples) < min_runs or time.perf_counter() < deadline:
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return {
+        "runs": len(samples),
+        "ops": len(samples) / sum(samples),
+        "p50": samples[len(samples) // 2],
+        "p99": samples[min(len(samples) - 1, int(len(samples) * 0.99))],
+    }
+
+
+def _median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def summarize(repeats):
+    """The median of each statistic over `repeats` (measure() results), with
+    every repetition's p50 kept for compare()."""
+    p50s = [r["p50"] for r in repeats]
+    p50 = _median(p50s)
+    return {
+        "runs": sum(r["runs"] for r in repeats),
+        "ops": _median(r["ops"] for r in repeats),
+        "p50": p50,
+        "p99": _median(r["p99"] for r in repeats),
+        "p50s": p50s,
+        "spread": (max(p50s) - min(p50s)) / p50,
+    }
+
+
+def run(names, seconds, repeat):
+    results = {}
+    for name in names:
+        with CASES[name]() as fn:
+            results[name] = summarize([measure(fn, seconds) for _ in range(repeat)])
+        r = results[name]
+        print(f"  {name:<40}{r['ops']:>10.0f}/s  p50 {r['p50'] * 1e6:>9.1f} us ±{r['spread']:>4.0%}"
+              f"  p99 {r['p99'] * 1e6:>9.1f} us", file=sys.stderr)
+    return results
+
+
+def _commit(cwd=None):
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=cwd, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def report(results, seconds, repeat):
+    return {
+        "meta": {"commit": _commit(), "python": platform.python_version(), "machine": platform.machine(),
+                 "platform": platform.platform(), "seconds": seconds, "repeat": repeat,
+                 "store": "mongod" if os.environ.get("MONGODB_URI") else "mongomock"},
+        "results": results,
+    }
+
+
+def _against(ref, args):
+    """Run `ref`'s suite in a temporary worktree; returns its report."""
+    root = subprocess.run(["git", "rev-parse", "--show-toplevel"], capture_output=True, text=True,
+                          check=True).stdout.strip()
+    if subprocess.run(["git", "cat-file", "-e", f"{ref}:benchmarks/suite.py"], cwd=root).returncode:
+        raise SystemExit(f"{ref} has no benchmarks/suite.py to compare against")
+    with tempfile.TemporaryDirectory() as tmp:
+        tree, out = os.path.join(tmp, "tree"), os.path.join(tmp, "results.json")
+        subprocess.run(["git", "worktree", "add", "--detach", tree, ref], cwd=root, check=True,
+                       capture_output=True)
+        try:
+            command = [sys.executable, "-m", "benchmarks.suite", "--seconds", str(args.seconds), "--json", out]
+            if "--repeat" in Path(tree, "benchmarks", "suite.py").read_text(encoding="utf-8"):
+                command += ["--repeat", str(args.repeat)]
+            if args.filter:
+                command += ["--filter", args.filter]
+            print(f"{ref}:", file=sys.stderr)
+            subprocess.run(command, cwd=tree, check=True)
+            with open(out) as fh:
+                return json.load(fh)
+        finally:
+            subprocess.run(["git", "worktree", "remove", "--force", tree], cwd=root, capture_output=True)
+
+
+def compare(base, head, threshold):
+    """Print p50 changes; returns the names whose median p50 got slower than
+    `threshold` with no overlap between the two sides' repetitions."""
+    print(f"\n{'case':<40}{'base p50':>12}{'head p50':>12}{'change':>9}{'spread':>14}")
+    slower = []
+    for name, r in head["results"].items():
+        b = base["results"].get(name)
+        if b is None:
+            print(f"{name:<40}{'-':>12}{r['p50'] * 1e6:>10.1f}us{'new':>9}")
+            continue
+        change = r["p50"] / b["p50"] - 1
+        # results saved before repetitions were recorded have one p50
+        consistent = min(r.get("p50s", [r["p50"]])) > max(b.get("p50s", [b["p50"]]))
+        flag = ""
+        if change > threshold:
+            flag = "  <-- slower" if consistent else "  (noise)"
+        if consistent and change > threshold:
+            slower.append(name)
+        spread = f"{b.get('spread', 0):.0%}/{r.get('spread', 0):.0%}"
+        print(f"{name:<40}{b['p50'] * 1e6:>10.1f}us{r['p50'] * 1e6:>10.1f}us{change:>+8.0%}{spread:>14}{flag}")
+    if base["meta"].get("platform") != head["meta"].get("platform"):
+        print(f"\nnote: baseline measured on {base['meta'].get('platform')}; use --against to compare on one machine")
+    return slower
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--filter", default="", help="only cases whose name starts with this")
+    parser.add_argument("--seconds", type=float, default=0.5, help="time spent per repetition of a case")
+    parser.add_argument("--repeat", type=int, default=5, help="repetitions per case; the median is reported")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--save", action="store_true", help=f"write the results to {BASELINE.name}")
+    parser.add_argument("--compare", nargs="?", const=str(BASELINE),
+                        help="compare with a results file (same machine only)")
+    parser.add_argument("--against", help="compare with the suite run at this git ref (use this in review)")
+    parser.add_argument("--threshold", type=float, default=0.15,
+                        help="median p50 slowdown reported as a regression when every repetition agrees")
+    parser.add_argument("--list", action="store_true")
+    args = parser.parse_args(argv)
+
+    names = [n for n in CASES if n.startswith(args.filter)]
+    if args.list:
+        print("\n".join(names))
+        return 0
+    base = _against(args.against, args) if args.against else None
+    print(f"{_commit() or 'working tree'}:", file=sys.stderr)
+    head = report(run(names, args.seconds, args.repeat), args.seconds, args.repeat)
+    for path in filter(None, (args.json, BASELINE if args.save else None)):
+        with open(path, "w") as fh:
+            json.dump(head, fh, indent=2, sort_keys=True)
+            fh.write("\n")
+    if base is None and args.compare:
+        with open(args.compare) as fh:
+            base = json.load(fh)
+    if base is not None:
+        return 1 if compare(base, head, args.threshold) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,45 @@
+"""Gunicorn settings, read from the working directory by `gunicorn app:app`
+(the Dockerfile passes it explicitly with -c)."""
+import os
+import shutil
+
+
+def on_starting(server):
+    # samples left by a previous run would be aggregated into /metrics
+    path = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if path:
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path, exist_ok=True)
+
+
+def child_exit(server, worker):
+    # imported here, not from app.utils.metrics: importing `app` in the
+    # master would create the application there
+    if not os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        return
+    try:
+        from prometheus_client import multiprocess
+    except ImportError:
+        return
+    multiprocess.mark_process_dead(worker.pid)
+
+
+def _rss_bytes():
+    try:
+        with open("/proc/self/statm") as fh:
+            return int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return 0
+
+
+def post_request(worker, req, environ, resp):
+    # Recycle a worker whose RSS crossed WORKER_MAX_RSS_MB (e.g. heap
+    # fragmentation after large uploads). Clearing `alive` makes the worker
+    # finish its in-flight requests and exit; the master starts a fresh one.
+    limit = int(os.environ.get("WORKER_MAX_RSS_MB", "0")) * 2 ** 20
+    if limit and worker.alive:
+        rss = _rss_bytes()
+        if rss > limit:
+            worker.log.info("worker %s RSS %d MB over %d MB; recycling after in-flight requests",
+                            worker.pid, rss // 2 ** 20, limit // 2 ** 20)
+            worker.alive = False
@@ -0,0 +1,179 @@
+"""End-to-end load test: the app under gunicorn against a local mongod,
+moto's S3/SNS server and a local JWKS endpoint, driven by asyncio virtual
+users replaying a traffic mix. Sweeps worker counts and classes and reports
+throughput, latency percentiles and per-worker RSS for each.
+
+    pip install "moto[server]"
+    MONGODB_URI=mongodb://localhost:27017 python -m loadtest \\
+        [--workers 1,2,4] [--worker-class sync,gthread] [--threads 4] \\
+        [--concurrency 32] [--duration 30] [--mix browse=60,search=25,subscribe=10,upload=5] \\
+        [--series 50] [--lessons 10] [--upload-kb 256] [--json results.json]
+
+Each configuration runs against its own scratch database and bucket, seeded
+with the same catalog, so uploads and subscriptions from one configuration
+do not slow the next; the databases are dropped afterwards. Gunicorn's
+stderr goes to one log per configuration under --log-dir. The driver is a
+single process: when its CPU is saturated the numbers measure it,
+not the app, so keep an eye on `top` at high concurrency.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+
+import boto3
+from pymongo import MongoClient
+
+from loadtest.client import Connection
+from loadtest.jwks import JWKSServer
+from loadtest.scenarios import DEFAULT_MIX, SCENARIOS, Recorder, parse_mix, seed
+from loadtest.stack import Gunicorn, MotoServer, rss_bytes
+
+
+def _percentile(samples, q):
+    return samples[min(len(samples) - 1, int(len(samples) * q))]
+
+
+async def _virtual_user(n, port, token, catalog, mix, deadline, rec, options):
+    rnd = random.Random(n)
+    conn = Connection("127.0.0.1", port)
+    auth = {"Authorization": f"Bearer {token}"}
+    names, weights = list(mix), list(mix.values())
+    try:
+        while time.monotonic() < deadline:
+            scenario = SCENARIOS[rnd.choices(names, weights)[0]]
+            await scenario(rec, conn, auth, catalog, rnd, options)
+    finally:
+        await conn.close()
+
+
+async def _sample_rss(server, deadline, peaks):
+    while time.monotonic() < deadline:
+        for pid in server.worker_pids():
+            rss = rss_bytes(pid)
+            if rss is not None:
+                peaks[pid] = max(peaks.get(pid, 0), rss)
+        await asyncio.sleep(0.5)
+
+
+async def _drive(server, tokens, catalog, mix, options):
+    # warm-up: imports, caches, connection pools; not recorded
+    warm = time.monotonic() + options.warmup
+    await asyncio.gather(*(_virtual_user(n, server.port, tokens[n % len(tokens)], catalog, mix, warm, Recorder(), options)
+                           for n in range(options.concurrency)))
+    rec, peaks = Recorder(), {}
+    start = time.monotonic()
+    deadline = start + options.duration
+    await asyncio.gather(
+        _sample_rss(server, deadline, peaks),
+        *(_virtual_user(n, server.port, tokens[n % len(tokens)], catalog, mix, deadline, rec, options)
+          for n in range(options.concurrency)))
+    return rec, time.monotonic() - start, peaks
+
+
+def _summary(label, rec, elapsed, peaks):
+    everything = sorted(s for samples in rec.samples.values() for s in samples)
+    errors = sum(rec.errors.values())
+    return {
+        "config": label,
+        "requests": len(everything),
+        "rps": len(everything) / elapsed,
+        "p50_ms": _percentile(everything, 0.50) * 1000 if everything else None,
+        "p95_ms": _percentile(everything, 0.95) * 1000 if everything else None,
+        "p99_ms": _percentile(everything, 0.99) * 1000 if everything else None,
+        "errors": errors,
+        "error_kinds": rec.errors,
+        "worker_rss_mb": sorted(round(v / 2 ** 20, 1) for v in peaks.values()),
+        "steps": {
+            name: {"count": len(s), "p50_ms": _percentile(sorted(s), 0.5) * 1000,
+                   "p99_ms": _percentile(sorted(s), 0.99) * 1000}
+            for name, s in sorted(rec.samples.items())
+        },
+    }
+
+
+def _print(result, verbose):
+    rss = ", ".join(f"{v:.0f}" for v in result["worker_rss_mb"]) or "-"
+    print(f"{result['config']:<16}{result['rps']:>9.1f}{result['p50_ms']:>9.1f}{result['p95_ms']:>9.1f}"
+          f"{result['p99_ms']:>9.1f}{result['errors']:>8}   {rss}")
+    if verbose:
+        for name, step in result["steps"].items():
+            print(f"    {name:<28}{step['count']:>8}{step['p50_ms']:>9.1f}{step['p99_ms']:>9.1f}")
+        for kind, count in result["error_kinds"].items():
+            print(f"    ! {kind}: {count}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mongodb-uri", default=os.environ.get("MONGODB_URI", "mongodb://localhost:27017"))
+    parser.add_argument("--workers", default="1,2,4", help="comma-separated worker counts")
+    parser.add_argument("--worker-class", default="sync,gthread", help="comma-separated gunicorn worker classes")
+    parser.add_argument("--threads", type=int, default=4, help="threads per gthread worker")
+    parser.add_argument("--concurrency", type=int, default=32, help="virtual users")
+    parser.add_argument("--duration", type=float, default=30, help="seconds measured per configuration")
+    parser.add_argument("--warmup", type=float, default=5)
+    parser.add_argument("--mix", default=",".join(f"{k}={v}" for k, v in DEFAULT_MIX.items()))
+    parser.add_argument("--series", type=int, default=50)
+    parser.add_argument("--lessons", type=int, default=10)
+    parser.add_argument("--users", type=int, default=100, help="distinct token subjects")
+    parser.add_argument("--upload-kb", type=int, default=256)
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--log-dir", help="gunicorn logs, one per configuration (default: a new temporary directory)")
+    parser.add_argument("-v", "--verbose", action="store_true", help="per-step latencies and errors")
+    options = parser.parse_args(argv)
+    mix = parse_mix(options.mix)
+
+    log_dir = options.log_dir or tempfile.mkdtemp(prefix="paas-loadtest-")
+    os.makedirs(log_dir, exist_ok=True)
+    results = []
+    with MongoClient(options.mongodb_uri, serverSelectionTimeoutMS=3000) as mongo, MotoServer() as moto, \
+            JWKSServer() as jwks:
+        mongo.admin.command("ping")
+        s3 = boto3.client("s3", endpoint_url=moto.url, region_name="us-east-1", aws_access_key_id="loadtest",
+                          aws_secret_access_key="loadtest")
+        aws = {"AWS_ENDPOINT_URL": moto.url, "AWS_ACCESS_KEY_ID": "loadtest", "AWS_SECRET_ACCESS_KEY": "loadtest",
+               "AWS_REGION": "us-east-1", "AWS_DEFAULT_REGION": "us-east-1"}
+        for var in ("COGNITO_USER_POOL_ID", "COGNITO_CLIENT_ID", "JWT_AUDIENCE", "JWT_ISSUER", "COGNITO_ISSUER",
+                    "PROMETHEUS_MULTIPROC_DIR", "LOCAL_STORE"):
+            os.environ.pop(var, None)
+        tokens = [jwks.token(f"load-user-{i}") for i in range(options.users)]
+        print(f"gunicorn logs in {log_dir}", file=sys.stderr)
+        print(f"{'config':<16}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}   worker RSS MB")
+        for worker_class in options.worker_class.split(","):
+            for workers in (int(w) for w in options.workers.split(",")):
+                scratch = f"loadtest_{uuid.uuid4().hex[:8]}"
+                bucket = scratch.replace("_", "-")
+                s3.create_bucket(Bucket=bucket)
+                env = {**aws, "S3_BUCKET_NAME": bucket, "MONGODB_URI": options.mongodb_uri, "MONGODB_NAME": scratch,
+                       "COGNITO_JWKS_URL": jwks.url, "ALLOW_INSECURE_JWT": "false"}
+                log = os.path.join(log_dir, f"gunicorn-{workers}-{worker_class}.log")
+                try:
+                    with Gunicorn(workers, worker_class, options.threads, env, log) as server:
+                        catalog = asyncio.run(_seed(server.port, jwks.token("load-creator"), options))
+                        rec, elapsed, peaks = asyncio.run(_drive(server, tokens, catalog, mix, options))
+                finally:
+                    mongo.drop_database(scratch)
+                result = _summary(server.label, rec, elapsed, peaks)
+                results.append(result)
+                _print(result, options.verbose)
+    if options.json:
+        with open(options.json, "w") as fh:
+            json.dump({"options": vars(options), "results": results}, fh, indent=2)
+    return 0
+
+
+async def _seed(port, token, options):
+    conn = Connection("127.0.0.1", port)
+    try:
+        return await seed(conn, token, options.series, options.lessons, random.Random(1))
+    finally:
+        await conn.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
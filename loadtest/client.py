@@ -0,0 +1,90 @@
+"""A minimal asyncio HTTP/1.1 client with one keep-alive connection per
+virtual user, so the driver needs nothing beyond the standard library."""
+import asyncio
+import json
+import uuid
+from urllib.parse import urlencode
+
+
+class Connection:
+    def __init__(self, host, port):
+        self.host, self.port = host, port
+        self._reader = self._writer = None
+
+    async def _connect(self):
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except OSError:
+                pass
+            self._reader = self._writer = None
+
+    async def request(self, method, path, headers=None, body=b"", query=None):
+        """`(status, body bytes)`; reconnects once if the server closed the
+        kept-alive connection."""
+        if query:
+            path = f"{path}?{urlencode(query)}"
+        for attempt in (0, 1):
+            if self._writer is None:
+                await self._connect()
+            try:
+                return await self._send(method, path, headers or {}, body)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                await self.close()
+                if attempt:
+                    raise
+
+    async def _send(self, method, path, headers, body):
+        lines = [f"{method} {path} HTTP/1.1", f"Host: {self.host}:{self.port}", f"Content-Length: {len(body)}"]
+        lines += [f"{k}: {v}" for k, v in headers.items()]
+        self._writer.write(("\r\n".join(lines) + "\r\n\r\n").encode() + body)
+        await self._writer.drain()
+
+        status_line = await self._reader.readuntil(b"\r\n")
+        status = int(status_line.split()[1])
+        response_headers = {}
+        while True:
+            line = await self._reader.readuntil(b"\r\n")
+            if line == b"\r\n":
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            response_headers[name.strip().lower()] = value.strip()
+
+        if response_headers.get("transfer-encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int((await self._reader.readuntil(b"\r\n")).split(b";")[0], 16)
+                chunk = await self._reader.readexactly(size + 2)
+                if size == 0:
+                    break
+                chunks.append(chunk[:-2])
+            data = b"".join(chunks)
+        elif "content-length" in response_headers:
+            data = await self._reader.readexactly(int(response_headers["content-length"]))
+        else:
+            data = await self._reader.read()
+            await self.close()
+        if response_headers.get("connection", "").lower() == "close":
+            await self.close()
+        return status, data
+
+
+def json_body(payload):
+    return {"Content-Type": "application/json"}, json.dumps(payload).encode()
+
+
+def multipart_body(fields, files):
+    """`fields` {name: str}; `files` [(field, filename, content type, bytes)]."""
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for field, filename, content_type, data in files:
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+                     f"Content-Type: {content_type}\r\n\r\n".encode() + data + b"\r\n")
+    parts.append(f"--{boundary}--\r\n".encode())
+    return {"Content-Type": f"multipart/form-data; boundary={boundary}"}, b"".join(parts)
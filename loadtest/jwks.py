@@ -0,0 +1,49 @@
+"""A local JWKS endpoint and a token issuer signed with its key.
+
+The app verifies RS256 tokens against COGNITO_JWKS_URL exactly as it does in
+production; this serves that URL from a background thread.
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import jwt
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+KID = "loadtest"
+
+
+class JWKSServer:
+    def __init__(self, host="127.0.0.1", port=0):
+        self._key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        jwk = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(self._key.public_key()))
+        jwk.update(kid=KID, alg="RS256", use="sig")
+        body = json.dumps({"keys": [jwk]}).encode()
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self.url = f"http://{host}:{self._server.server_address[1]}/.well-known/jwks.json"
+
+    def __enter__(self):
+        threading.Thread(target=self._server.serve_forever, name="jwks", daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def token(self, user_id, ttl=3600):
+        claims = {"userId": user_id, "sub": user_id, "email": f"{user_id}@loadtest.local",
+                  "exp": int(time.time()) + ttl}
+        return jwt.encode(claims, self._key, algorithm="RS256", headers={"kid": KID})
@@ -0,0 +1,107 @@
+"""The traffic mix: what one virtual user does per iteration.
+
+Every request is recorded as "<scenario>.<step>" so the report can show
+where time goes. Scenarios pick series and lessons from the seeded catalog.
+"""
+import json
+import time
+
+from loadtest.client import json_body, multipart_body
+
+DEFAULT_MIX = {"browse": 60, "search": 25, "subscribe": 10, "upload": 5}
+SEARCH_WORDS = "bai hoc python flask mongodb lap trinh co ban nang cao du lieu api backend".split()
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = {}
+        self.errors = {}
+
+    async def __call__(self, name, conn, method, path, expect=(200,), **kwargs):
+        start = time.perf_counter()
+        try:
+            status, body = await conn.request(method, path, **kwargs)
+        except Exception:
+            status, body = None, b""
+        elapsed = time.perf_counter() - start
+        self.samples.setdefault(name, []).append(elapsed)
+        if status not in expect:
+            key = f"{name} -> {status}"
+            self.errors[key] = self.errors.get(key, 0) + 1
+        return status, body
+
+
+class Catalog:
+    def __init__(self):
+        self.series = []  # (serie_id, [lesson ids])
+
+    def serie(self, rnd):
+        return rnd.choice(self.series)
+
+
+async def browse(rec, conn, auth, catalog, rnd, options):
+    serie_id, lessons = catalog.serie(rnd)
+    await rec("browse.list_series", conn, "GET", "/api/series/")
+    await rec("browse.get_serie", conn, "GET", f"/api/series/{serie_id}", query={"expand": "lessons"})
+    await rec("browse.list_lessons", conn, "GET", f"/api/series/{serie_id}/lessons/", headers=auth)
+    if lessons:
+        await rec("browse.get_lesson", conn, "GET", f"/api/series/{serie_id}/lessons/{rnd.choice(lessons)}",
+                  headers=auth)
+
+
+async def search(rec, conn, auth, catalog, rnd, options):
+    keyword = " ".join(rnd.sample(SEARCH_WORDS, 2))
+    await rec("search.search", conn, "GET", "/api/series/search", query={"keyword": keyword})
+    word = rnd.choice(SEARCH_WORDS)
+    await rec("search.autocomplete", conn, "GET", "/api/series/autocomplete", query={"q": word[:rnd.randint(1, 3)]})
+
+
+async def subscribe(rec, conn, auth, catalog, rnd, options):
+    serie_id, _ = catalog.serie(rnd)
+    await rec("subscribe.subscribe", conn, "POST", f"/api/series/{serie_id}/subscribe", headers=auth)
+    await rec("subscribe.list_subscribed", conn, "GET", "/api/series/subscribed", headers=auth)
+    await rec("subscribe.unsubscribe", conn, "POST", f"/api/series/{serie_id}/unsubscribe", headers=auth)
+
+
+async def upload(rec, conn, auth, catalog, rnd, options):
+    serie_id, _ = catalog.serie(rnd)
+    headers, body = multipart_body(
+        {"lesson_title": f"Upload {rnd.randrange(10 ** 6)}", "content": "x" * 500},
+        [("lesson_video", "video.mp4", "video/mp4", rnd.randbytes(options.upload_kb * 1024)),
+         ("lesson_documents", "notes.pdf", "application/pdf", rnd.randbytes(16 * 1024))])
+    await rec("upload.create_lesson", conn, "POST", f"/api/series/{serie_id}/lessons/",
+              headers={**auth, **headers}, body=body, expect=(201,))
+
+
+SCENARIOS = {"browse": browse, "search": search, "subscribe": subscribe, "upload": upload}
+
+
+def parse_mix(text):
+    """"browse=60,search=25" -> {"browse": 60, "search": 25}"""
+    mix = {}
+    for part in filter(None, text.split(",")):
+        name, _, weight = part.partition("=")
+        if name not in SCENARIOS:
+            raise ValueError(f"unknown scenario {name!r}; choose from {', '.join(SCENARIOS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+async def seed(conn, token, series, lessons, rnd):
+    """Create `series` published series of `lessons` lessons each through
+    the API; returns the Catalog."""
+    catalog = Catalog()
+    auth = {"Authorization": f"Bearer {token}"}
+    for i in range(series):
+        title = " ".join(rnd.choices(SEARCH_WORDS, k=4)).title()
+        headers, body = json_body({"serie_title": f"{title} {i}", "isPublish": "true", "description": "x" * 300})
+        status, data = await conn.request("POST", "/api/series/", headers={**auth, **headers}, body=body)
+        if status != 201:
+            raise RuntimeError(f"seeding failed: POST /api/series/ -> {status} {data[:200]!r}")
+        serie_id = json.loads(data)["_id"]
+        items = [{"lesson_title": f"Lesson {n}", "content": "x" * 2000} for n in range(lessons)]
+        headers, body = json_body(items)
+        await conn.request("POST", f"/api/series/{serie_id}/lessons/bulk", headers={**auth, **headers}, body=body)
+        _, data = await conn.request("GET", f"/api/series/{serie_id}/lessons/", headers=auth)
+        catalog.series.append((serie_id, [lesson["_id"] for lesson in json.loads(data)]))
+    return catalog
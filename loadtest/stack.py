@@ -0,0 +1,117 @@
+"""Local stand-ins the app runs against: moto's S3/SNS server and the app
+itself under gunicorn, as subprocesses."""
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def tail(path, lines=20):
+    """The last `lines` lines of a log file, or "" when there is none."""
+    try:
+        return "\n".join(Path(path).read_text(errors="replace").splitlines()[-lines:])
+    except OSError:
+        return ""
+
+
+def _wait_for(url, process, timeout=30, log=None):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            error = f"{process.args[2]} exited with status {process.returncode}"
+            break
+        try:
+            with urllib.request.urlopen(url, timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    else:
+        error = f"{url} did not come up in {timeout}s"
+    if log is not None:
+        error += f"; last lines of {log}:\n{tail(log)}"
+    raise RuntimeError(error)
+
+
+class MotoServer:
+    """`moto.server` (pip install "moto[server]") on a free port."""
+
+    def __init__(self):
+        self.port = free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self._process = None
+
+    def __enter__(self):
+        self._process = subprocess.Popen([sys.executable, "-m", "moto.server", "-p", str(self.port)],
+                                         stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        _wait_for(f"{self.url}/moto-api/", self._process)
+        return self
+
+    def __exit__(self, *exc):
+        self._process.terminate()
+        self._process.wait(10)
+
+
+class Gunicorn:
+    """`gunicorn app:app` from the repository root (so gunicorn.conf.py
+    applies) with `env` added to this process's environment. Its stderr goes
+    to `log`: a pipe nobody reads would block the workers once it fills."""
+
+    def __init__(self, workers, worker_class, threads, env, log):
+        self.workers, self.worker_class, self.threads = workers, worker_class, threads
+        self.port = free_port()
+        self.env = {**os.environ, **env}
+        self.log = log
+        self._process = None
+        self._log = None
+
+    @property
+    def label(self):
+        threads = f"x{self.threads}" if self.worker_class == "gthread" else ""
+        return f"{self.workers} {self.worker_class}{threads}"
+
+    def __enter__(self):
+        command = [sys.executable, "-m", "gunicorn", "-w", str(self.workers), "-k", self.worker_class,
+                   "--threads", str(self.threads), "-b", f"127.0.0.1:{self.port}", "app:app"]
+        self._log = open(self.log, "ab")
+        self._process = subprocess.Popen(command, cwd=ROOT, env=self.env,
+                                         stdout=subprocess.DEVNULL, stderr=self._log)
+        try:
+            _wait_for(f"http://127.0.0.1:{self.port}/health", self._process, log=self.log)
+        except Exception:
+            self.__exit__()
+            raise
+        return self
+
+    def __exit__(self, *exc):
+        self._process.terminate()
+        self._process.wait(30)
+        self._log.close()
+
+    def worker_pids(self):
+        pid = self._process.pid
+        try:
+            return [int(p) for p in Path(f"/proc/{pid}/task/{pid}/children").read_text().split()]
+        except OSError:
+            return []
+
+
+def rss_bytes(pid):
+    """Resident set size from /proc (Linux), or None."""
+    try:
+        for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
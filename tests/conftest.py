@@ -0,0 +1,168 @@
+import os
+import uuid
+
+import pytest
+
+from app.utils.mongodb import CommandCounter, ensure_indexes
+
+# collection method -> server command it issues, for counting under mongomock
+_COMMANDS = {
+    "insert_one": "insert",
+    "insert_many": "insert",
+    "find": "find",
+    "find_one": "find",
+    "find_one_and_update": "findAndModify",
+    "find_one_and_delete": "findAndModify",
+    "find_one_and_replace": "findAndModify",
+    "update_one": "update",
+    "update_many": "update",
+    "replace_one": "update",
+    "delete_one": "delete",
+    "delete_many": "delete",
+    "aggregate": "aggregate",
+    "count_documents": "aggregate",
+    "distinct": "distinct",
+    "bulk_write": "bulkWrite",
+}
+
+
+class _CountingCollection:
+    def __init__(self, collection, counter):
+        self._collection = collection
+        self._counter = counter
+
+    def __getattr__(self, name):
+        attr = getattr(self._collection, name)
+        command = _COMMANDS.get(name)
+        if command is None:
+            return attr
+
+        def counted(*args, **kwargs):
+            with self._counter._lock:
+                self._counter.commands.append((command, self._collection.name))
+            return attr(*args, **kwargs)
+
+        return counted
+
+
+class _CountingDatabase:
+    def __init__(self, db, counter):
+        self._db = db
+        self._counter = counter
+
+    def get_collection(self, name, **kwargs):
+        return _CountingCollection(self._db.get_collection(name, **kwargs), self._counter)
+
+    def __getitem__(self, name):
+        return self.get_collection(name)
+
+    def __getattr__(self, name):
+        return getattr(self._db, name)
+
+
+@pytest.fixture
+def counted_db():
+    """A fresh database behind the services' repositories, plus a CommandCounter.
+
+    Uses the server at MONGODB_TEST_URI when set (commands are seen by a real
+    pymongo CommandListener); otherwise mongomock, where collection method
+    calls are counted as the commands they would send.
+    """
+    counter = CommandCounter()
+    uri = os.environ.get("MONGODB_TEST_URI")
+    if uri:
+        from pymongo import MongoClient
+
+        client = MongoClient(uri, event_listeners=[counter])
+        db = client[f"test_{uuid.uuid4().hex[:12]}"]
+    else:
+        mongomock = pytest.importorskip("mongomock")
+        client = mongomock.MongoClient()
+        db = _CountingDatabase(client.get_database("test"), counter)
+    ensure_indexes(db)
+
+    from app import repositories
+
+    previous = repositories.use(repositories.build(db))
+    counter.reset()
+    yield db, counter
+    repositories.use(previous)
+    if uri:
+        client.drop_database(db.name)
+    client.close()
+
+
+class QueryBudget:
+    """A test client whose `call` checks the Mongo commands and S3/SNS calls
+    of one request against a budget, failing with the exact list on
+    overspend."""
+
+    def __init__(self, client, counter, aws_calls):
+        self.client = client
+        self.counter = counter
+        self.aws_calls = aws_calls
+
+    def call(self, method, path, mongo, aws=0, **kwargs):
+        self.counter.reset()
+        del self.aws_calls[:]
+        response = self.client.open(path, method=method, **kwargs)
+        commands = [c for c in self.counter.commands if c[0] not in ("commitTransaction", "abortTransaction")]
+        problems = []
+        if len(commands) > mongo:
+            problems.append(f"{len(commands)} Mongo commands (budget {mongo}):\n"
+                            + "\n".join(f"  {name} {collection}" for name, collection in commands))
+        if len(self.aws_calls) > aws:
+            problems.append(f"{len(self.aws_calls)} AWS calls (budget {aws}):\n"
+                            + "\n".join(f"  {call}" for call in self.aws_calls))
+        if problems:
+            pytest.fail(f"{method} {path} -> {response.status_code} over budget\n" + "\n".join(problems), pytrace=False)
+        return response
+
+
+@pytest.fixture
+def aws_calls(monkeypatch):
+    """S3 and SNS under moto, with every API call recorded as "service.Operation".
+
+    Without moto the utils fall back to their local placeholders and the
+    list stays empty.
+    """
+    try:
+        import boto3
+        import moto
+    except ImportError:
+        for var in ("S3_BUCKET_NAME", "AWS_REGION"):
+            monkeypatch.delenv(var, raising=False)
+        yield []
+        return
+    for var, value in (("AWS_ACCESS_KEY_ID", "testing"), ("AWS_SECRET_ACCESS_KEY", "testing"),
+                       ("AWS_DEFAULT_REGION", "us-east-1"), ("AWS_REGION", "us-east-1"),
+                       ("S3_BUCKET_NAME", "paas-test")):
+        monkeypatch.setenv(var, value)
+    calls = []
+    with moto.mock_aws():
+        boto3.setup_default_session()
+        boto3.client("s3").create_bucket(Bucket="paas-test")
+
+        def record(model, **kwargs):
+            calls.append(f"{model.service_model.endpoint_prefix}.{model.name}")
+
+        boto3.DEFAULT_SESSION.events.register("before-call.*.*", record)
+        yield calls
+    boto3.DEFAULT_SESSION = None
+
+
+@pytest.fixture
+def query_budget(counted_db, aws_calls, monkeypatch):
+    """`query_budget.call(method, path, mongo=N, aws=M, **client_kwargs)`:
+    one test-client request over `counted_db` (and moto), failing when it
+    sends more than N Mongo commands or M S3/SNS calls."""
+    db, counter = counted_db
+    from app import create_app, repositories
+
+    monkeypatch.setenv("ALLOW_INSECURE_JWT", "true")
+    for var in ("COGNITO_JWKS_URL", "JWKS_URL", "COGNITO_USER_POOL_ID", "COGNITO_POOL_ID"):
+        monkeypatch.delenv(var, raising=False)
+    app = create_app()
+    app.testing = True
+    app.extensions["repositories"] = repositories.build(db)
+    return QueryBudget(app.test_client(), counter, aws_calls)
@@ -14,3 +14,205 @@ def test_health(client):
     rv = client.get('/health')
     assert rv.status_code == 200
     assert rv.get_json() == {"status": "ok"}
+
+
+@pytest.fixture
+def auth_headers(monkeypatch):
+    import jwt
+    for var in ("COGNITO_JWKS_URL", "JWKS_URL", "COGNITO_USER_POOL_ID", "COGNITO_POOL_ID"):
+        monkeypatch.delenv(var, raising=False)
+    monkeypatch.setenv("ALLOW_INSECURE_JWT", "true")
+    token = jwt.encode({"userId": "user-1", "email": "u1@example.com"}, "test-secret-" + "x" * 32, algorithm="HS256")
+    return {"Authorization": f"Bearer {token}"}
+
+
+def test_serie_etag_roundtrip(client, auth_headers):
+    created = client.post('/api/series/', json={"serie_title": "Bài học"}, headers=auth_headers).get_json()
+    rv = client.get(f"/api/series/{created['_id']}")
+    assert rv.status_code == 200 and rv.headers.get("ETag")
+    etag = rv.headers["ETag"]
+
+    rv = client.get(f"/api/series/{created['_id']}", headers={"If-None-Match": etag})
+    assert rv.status_code == 304
+    assert rv.data == b""
+
+    client.patch(f"/api/series/{created['_id']}", json={"serie_title": "Khác"}, headers=auth_headers)
+    rv = client.get(f"/api/series/{created['_id']}", headers={"If-None-Match": etag})
+    assert rv.status_code == 200
+    assert rv.headers["ETag"] != etag
+
+
+def test_serie_etag_changes_within_one_millisecond(client, auth_headers, monkeypatch):
+    from datetime import datetime, timezone
+    from app.services import serie_service
+
+    frozen = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    monkeypatch.setattr(serie_service, "_now", lambda: frozen)
+    created = client.post('/api/series/', json={"serie_title": "A"}, headers=auth_headers).get_json()
+    etag = client.get(f"/api/series/{created['_id']}").headers["ETag"]
+
+    client.patch(f"/api/series/{created['_id']}", json={"serie_title": "B"}, headers=auth_headers)
+    rv = client.get(f"/api/series/{created['_id']}", headers={"If-None-Match": etag})
+    assert rv.status_code == 200
+    assert rv.get_json()["serie_title"] == "B"
+
+
+def test_lessons_etag_changes_with_list(client, auth_headers):
+    serie = client.post('/api/series/', json={"serie_title": "S"}, headers=auth_headers).get_json()
+    url = f"/api/series/{serie['_id']}/lessons/"
+    etag = client.get(url, headers=auth_headers).headers["ETag"]
+    assert client.get(url, headers={**auth_headers, "If-None-Match": etag}).status_code == 304
+
+    client.post(url, json={"lesson_title": "L1"}, headers=auth_headers)
+    rv = client.get(url, headers={**auth_headers, "If-None-Match": etag})
+    assert rv.status_code == 200
+    assert len(rv.get_json()) == 1
+
+
+def test_lessons_etag_changes_within_one_millisecond(client, auth_headers, monkeypatch):
+    from datetime import datetime, timezone
+    from app.services import lesson_service
+
+    frozen = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    monkeypatch.setattr(lesson_service, "_now", lambda: frozen)
+    serie = client.post('/api/series/', json={"serie_title": "S"}, headers=auth_headers).get_json()
+    url = f"/api/series/{serie['_id']}/lessons/"
+    lesson = client.post(url, json={"lesson_title": "L1"}, headers=auth_headers).get_json()
+    etag = client.get(url, headers=auth_headers).headers["ETag"]
+
+    client.patch(f"{url}{lesson['_id']}", json={"lesson_title": "L2"}, headers=auth_headers)
+    rv = client.get(url, headers={**auth_headers, "If-None-Match": etag})
+    assert rv.status_code == 200
+    assert rv.get_json()[0]["lesson_title"] == "L2"
+
+
+def test_gzip_compression_and_encoded_etag(client, auth_headers):
+    import gzip
+    serie = client.post('/api/series/', json={"serie_title": "S", "description": "x" * 2000}, headers=auth_headers).get_json()
+    url = f"/api/series/{serie['_id']}"
+
+    rv = client.get(url, headers={"Accept-Encoding": "gzip"})
+    assert rv.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in rv.headers["Vary"]
+    assert gzip.decompress(rv.data) == client.get(url).data
+    assert rv.headers["ETag"].endswith('-gzip"')
+
+    rv = client.get(url, headers={"Accept-Encoding": "gzip", "If-None-Match": rv.headers["ETag"]})
+    assert rv.status_code == 304
+
+    # small bodies are left alone
+    rv = client.get('/health', headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in rv.headers
+
+
+def test_search_is_accent_insensitive_and_ranked(client, auth_headers):
+    for title in ("Bài học Python", "Học máy", "Bài tập"):
+        client.post('/api/series/', json={"serie_title": title, "isPublish": "true"}, headers=auth_headers)
+    client.post('/api/series/', json={"serie_title": "Bài học nháp"}, headers=auth_headers)
+    rv = client.get('/api/series/search', query_string={"keyword": "bai hoc"})
+    titles = [s["serie_title"] for s in rv.get_json()]
+    assert titles[0] == "Bài học Python"
+    assert set(titles) >= {"Học máy", "Bài tập"}
+    assert "Bài học nháp" not in titles
+    rv = client.get('/api/series/search', query_string={"keyword": "bai hoc", "limit": 1})
+    assert len(rv.get_json()) == 1
+
+
+def test_autocomplete_published_titles(client, auth_headers):
+    created = client.post('/api/series/', json={"serie_title": "Bài học Python", "isPublish": "true"}, headers=auth_headers).get_json()
+    client.post('/api/series/', json={"serie_title": "Bài học nháp", "isPublish": "false"}, headers=auth_headers)
+    rv = client.get('/api/series/autocomplete', query_string={"q": "bai h"})
+    assert {"_id": created["_id"], "serie_title": "Bài học Python"} in rv.get_json()
+    assert all(s["serie_title"] != "Bài học nháp" for s in rv.get_json())
+
+    client.patch(f"/api/series/{created['_id']}", json={"serie_title": "Lập trình"}, headers=auth_headers)
+    assert client.get('/api/series/autocomplete', query_string={"q": "lap"}).get_json()[0]["_id"] == created["_id"]
+    assert all(s["_id"] != created["_id"] for s in client.get('/api/series/autocomplete', query_string={"q": "bai"}).get_json())
+
+
+def test_subscribe_unsubscribe_in_memory(client, auth_headers):
+    serie = client.post('/api/series/', json={"serie_title": "Sub"}, headers=auth_headers).get_json()
+    url = f"/api/series/{serie['_id']}"
+    assert client.post(f"{url}/subscribe", headers=auth_headers).status_code == 200
+    assert client.post(f"{url}/subscribe", headers=auth_headers).get_json()["alreadySubscribed"] is True
+    subscribed = client.get('/api/series/subscribed', headers=auth_headers).get_json()
+    assert serie["_id"] in [s["_id"] for s in subscribed]
+    client.post(f"{url}/unsubscribe", headers=auth_headers)
+    subscribed = client.get('/api/series/subscribed', headers=auth_headers).get_json()
+    assert serie["_id"] not in [s["_id"] for s in subscribed]
+
+
+def test_subscribed_is_paginated_newest_first(client, auth_headers):
+    ids = []
+    for title in ("P1", "P2", "P3"):
+        serie = client.post('/api/series/', json={"serie_title": title}, headers=auth_headers).get_json()
+        client.post(f"/api/series/{serie['_id']}/subscribe", headers=auth_headers)
+        ids.append(serie["_id"])
+    first = client.get('/api/series/subscribed', query_string={"limit": 2}, headers=auth_headers).get_json()
+    second = client.get('/api/series/subscribed', query_string={"limit": 2, "page": 2}, headers=auth_headers).get_json()
+    assert [s["_id"] for s in first] == [ids[2], ids[1]]
+    assert ids[0] in [s["_id"] for s in second]
+
+
+def test_bulk_lessons_ndjson(client, auth_headers):
+    serie = client.post('/api/series/', json={"serie_title": "Bulk"}, headers=auth_headers).get_json()
+    url = f"/api/series/{serie['_id']}/lessons/"
+    body = '{"lesson_title": "B1"}\n\nnot json\n{"lesson_title": "B2"}\n'
+    rv = client.post(url + "bulk", data=body, content_type="application/x-ndjson", headers=auth_headers)
+    assert rv.status_code == 207
+    assert [r["status"] for r in rv.get_json()["results"]] == ["created", "invalid", "created"]
+    titles = sorted(l["lesson_title"] for l in client.get(url, headers=auth_headers).get_json())
+    assert titles == ["B1", "B2"]
+    rv = client.post(url + "bulk", json=[{"lesson_title": "B3"}], headers=auth_headers)
+    assert rv.status_code == 201 and rv.get_json()["created"] == 1
+
+
+def test_series_batch(client, auth_headers):
+    ids = [client.post('/api/series/', json={"serie_title": t}, headers=auth_headers).get_json()["_id"] for t in ("X1", "X2")]
+    rv = client.get('/api/series/batch', query_string={"ids": f"{ids[1]},missing,{ids[0]}", "fields": "serie_title"})
+    body = rv.get_json()
+    assert [s["serie_title"] for s in body["data"]] == ["X2", "X1"]
+    assert body["missing"] == ["missing"] and set(body["data"][0]) == {"_id", "serie_title"}
+    assert client.get('/api/series/batch').status_code == 400
+
+
+def test_batch_dispatches_sub_requests(client, auth_headers):
+    serie = client.post('/api/series/', json={"serie_title": "Batched", "isPublish": "true"}, headers=auth_headers).get_json()
+    etag = client.get(f"/api/series/{serie['_id']}").headers["ETag"]
+    rv = client.post('/api/batch/', headers=auth_headers, json={"requests": [
+        {"id": "serie", "path": f"/api/series/{serie['_id']}"},
+        {"id": "cached", "path": f"/api/series/{serie['_id']}", "headers": {"If-None-Match": etag}},
+        {"id": "lessons", "path": f"/api/series/{serie['_id']}/lessons/"},
+        {"id": "search", "path": "/api/series/search?keyword=batched"},
+        {"id": "nested", "path": "/api/batch/"},
+    ]})
+    assert rv.status_code == 200
+    by_id = {r["id"]: r for r in rv.get_json()["responses"]}
+    assert by_id["serie"]["status"] == 200 and by_id["serie"]["body"]["serie_title"] == "Batched"
+    assert by_id["cached"]["status"] == 304 and "body" not in by_id["cached"]
+    assert by_id["lessons"]["status"] == 200 and by_id["lessons"]["body"] == []
+    assert by_id["search"]["body"][0]["_id"] == serie["_id"]
+    assert by_id["nested"]["status"] == 400
+    assert client.post('/api/batch/', json={"requests": [{"path": "/api/series/"}]}).status_code == 401
+
+
+def test_serie_expand_lessons(client, auth_headers):
+    serie = client.post('/api/series/', json={"serie_title": "Expand"}, headers=auth_headers).get_json()
+    for title in ("L1", "L2"):
+        client.post(f"/api/series/{serie['_id']}/lessons/", json={"lesson_title": title}, headers=auth_headers)
+    rv = client.get(f"/api/series/{serie['_id']}", query_string={"expand": "lessons"})
+    body = rv.get_json()
+    assert [l["lesson_title"] for l in body["lessons"]] == ["L1", "L2"]
+    assert client.get(f"/api/series/{serie['_id']}", query_string={"expand": "lessons"},
+                      headers={"If-None-Match": rv.headers["ETag"]}).status_code == 304
+
+
+def test_metrics_endpoint(client, auth_headers):
+    pytest.importorskip("prometheus_client")
+    client.post('/api/series/', json={"serie_title": "Measured"}, headers=auth_headers)
+    client.get('/api/series/does-not-exist')
+    body = client.get('/metrics').get_data(as_text=True)
+    assert 'http_requests_total{endpoint="series.post_serie",method="POST",status="201"}' in body
+    assert 'http_request_duration_seconds_bucket{endpoint="series.get_serie"' in body
+    assert 'auth_verification_duration_seconds_count{outcome="ok"}' in body
+    assert 'repository_call_duration_seconds_count{aggregate="series",method="insert",outcome="ok"}' in body
@@ -0,0 +1,41 @@
+import threading
+
+from app.utils.autocomplete import PrefixIndex, RefreshingPrefixIndex
+
+
+def test_prefix_index_folds_and_orders():
+    index = PrefixIndex([("1", "Bài học"), ("2", "Bánh mì"), ("3", "Học máy")])
+    assert [r["_id"] for r in index.complete("ba")] == ["1", "2"]
+    index.remove("1")
+    assert [r["_id"] for r in index.complete("ba")] == ["2"]
+
+
+def test_start_builds_before_the_first_request():
+    loads = []
+    titles = RefreshingPrefixIndex(lambda: loads.append(1) or [("1", "Bài học")])
+    titles.start()
+    assert loads == [1]
+    assert titles.complete("bai") == [{"_id": "1", "serie_title": "Bài học"}]
+    assert loads == [1]
+
+
+def test_writes_during_a_rebuild_are_replayed():
+    loading, release = threading.Event(), threading.Event()
+
+    def load():
+        loading.set()
+        release.wait(5)
+        return [("1", "Bài học")]
+
+    titles = RefreshingPrefixIndex(lambda: [("1", "Bài học")], ttl=300)
+    titles.refresh()
+    titles._load = load
+    rebuild = threading.Thread(target=titles.refresh)
+    rebuild.start()
+    loading.wait(5)
+    # written after the store was read: the new index would miss it
+    titles.sync("2", {"serie_title": "Bánh mì", "isPublish": True})
+    titles.sync("1", None)
+    release.set()
+    rebuild.join(5)
+    assert titles.complete("ba") == [{"_id": "2", "serie_title": "Bánh mì"}]
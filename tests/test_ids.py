@@ -0,0 +1,56 @@
+import bson
+import pytest
+
+from app import create_app, repositories
+from app.migrations import normalize_ids
+from app.services import lesson_service, serie_service
+from app.utils import ids
+
+
+def test_codec():
+    oid = bson.ObjectId()
+    assert ids.parse(str(oid)) == oid and ids.parse(oid) is oid
+    assert ids.parse("abcdefghijkl") is None and ids.parse(None) is None
+    assert ids.parse_many([str(oid), "nope"]) == [oid]
+    assert ids.to_str(oid) == str(oid) and ids.to_str("u1") == "u1"
+    with pytest.raises(ValueError, match="Serie not found"):
+        ids.require("nope", "Serie not found")
+
+
+def test_lesson_references_are_object_ids(counted_db):
+    db, _ = counted_db
+    serie = serie_service.create_serie({"serie_title": "A"}, "u1")
+    lesson = lesson_service.create_lesson({"lesson_title": "L", "lesson_serie": serie["_id"]}, "u1")
+    stored = db.get_collection("lessons").find_one()
+    assert stored["lesson_serie"] == bson.ObjectId(serie["_id"])
+    assert lesson_service.get_lesson_by_id(serie["_id"], lesson["_id"])["lesson_title"] == "L"
+    assert lesson_service.get_lessons_version(serie["_id"])[0] == 1
+
+
+def test_mongo_documents_serialize(counted_db):
+    db, _ = counted_db
+    app = create_app()
+    app.extensions["repositories"] = repositories.get_repositories()
+    serie = serie_service.create_serie({"serie_title": "A"}, "u1")
+    lesson_service.create_lesson({"lesson_title": "L", "lesson_serie": serie["_id"]}, "u1")
+    body = app.test_client().get(f"/api/series/{serie['_id']}").get_json()
+    assert body["_id"] == serie["_id"] and isinstance(body["serie_lessons"][0], str)
+
+
+def test_normalize_ids_migration(counted_db):
+    db, _ = counted_db
+    serie, lesson = bson.ObjectId(), bson.ObjectId()
+    db.get_collection("series").insert_one({"_id": serie, "serie_lessons": [str(lesson), "legacy"]})
+    db.get_collection("lessons").insert_one({"_id": lesson, "lesson_serie": str(serie)})
+    subs = db.get_collection("subscriptions")
+    subs.insert_one({"user_id": "u1", "serie_id": str(serie)})
+    subs.insert_one({"user_id": "u2", "serie_id": str(serie)})
+    subs.insert_one({"user_id": "u2", "serie_id": serie})
+
+    result = normalize_ids.run(db)
+    assert result == {"lessons": (1, 0), "series": (1, 1), "subscriptions": (2, 0)}
+    assert db.get_collection("lessons").find_one()["lesson_serie"] == serie
+    assert db.get_collection("series").find_one()["serie_lessons"] == [lesson, "legacy"]
+    assert sorted(s["user_id"] for s in subs.find({"serie_id": serie})) == ["u1", "u2"]
+    assert subs.count_documents({}) == 2
+    assert normalize_ids.run(db) == {"lessons": (0, 0), "series": (0, 1), "subscriptions": (0, 0)}
@@ -0,0 +1,35 @@
+import runpy
+from pathlib import Path
+from types import SimpleNamespace
+
+import jwt
+
+from app import create_app
+
+
+def test_route_memory_on_admin_endpoint(monkeypatch):
+    for var in ("COGNITO_JWKS_URL", "JWKS_URL", "COGNITO_USER_POOL_ID", "COGNITO_POOL_ID"):
+        monkeypatch.delenv(var, raising=False)
+    monkeypatch.setenv("ALLOW_INSECURE_JWT", "true")
+    token = jwt.encode({"userId": "a1", "cognito:groups": ["admin"]}, "test-secret-" + "x" * 32, algorithm="HS256")
+    client = create_app().test_client()
+    client.get('/health')
+    body = client.get('/api/admin/memory', headers={"Authorization": f"Bearer {token}"}).get_json()
+    assert body["rss"] > 0 and body["peak_rss"] >= body["rss"] // 2
+    health = next(r for r in body["routes"] if r["endpoint"] == "main.health_check")
+    assert health["requests"] == 1 and health["max_rss"] > 0
+    assert body["top_allocations"] is None
+
+
+def test_gunicorn_recycles_worker_over_rss(monkeypatch):
+    hooks = runpy.run_path(str(Path(__file__).resolve().parent.parent / "gunicorn.conf.py"))
+    logged = []
+    worker = SimpleNamespace(alive=True, pid=1, log=SimpleNamespace(info=lambda *a: logged.append(a)))
+
+    monkeypatch.setenv("WORKER_MAX_RSS_MB", "100000")
+    hooks["post_request"](worker, None, {}, None)
+    assert worker.alive and not logged
+
+    monkeypatch.setenv("WORKER_MAX_RSS_MB", "1")
+    hooks["post_request"](worker, None, {}, None)
+    assert not worker.alive and logged
@@ -0,0 +1,67 @@
+import threading
+
+import pytest
+
+from app.utils.memstore import DocumentStore, DuplicateIdError
+
+
+def test_indexed_lookups_follow_updates():
+    store = DocumentStore(indexes=("owner", "tags"))
+    store.insert({"_id": 1, "owner": "a", "tags": ["x", "y"]})
+    store.insert({"_id": 2, "owner": "b", "tags": ["y"]})
+    store.insert({"_id": 3, "owner": "a", "tags": []})
+    assert [d["_id"] for d in store.find({"owner": "a"})] == [1, 3]
+    assert [d["_id"] for d in store.find({"tags": "y"}, reverse=True)] == [2, 1]
+    assert [d["_id"] for d in store.find({"owner": "a", "tags": "x"})] == [1]
+
+    store.update(1, {"owner": "b"})
+    assert [d["_id"] for d in store.find({"owner": "a"})] == [3]
+    assert store.count({"owner": "b"}) == 2
+    assert store.delete_many({"tags": "y"}) == 2
+    assert len(store) == 1 and store.find({"tags": "y"}) == []
+
+
+def test_reads_are_copies_and_ids_unique():
+    store = DocumentStore()
+    store.insert({"_id": "a", "n": 1})
+    store.get("a")["n"] = 99
+    assert store.get("a")["n"] == 1
+    with pytest.raises(DuplicateIdError):
+        store.insert({"_id": "a"})
+    assert store.update("a", inc={"n": 2})["n"] == 3
+    assert store.upsert("b", {"n": 1}, on_insert={"createdAt": 0}) == {"_id": "b", "n": 1, "createdAt": 0}
+    assert store.update("missing", {"n": 1}) is None
+
+
+def test_concurrent_writers():
+    store = DocumentStore(indexes=("owner",))
+
+    def write(owner):
+        for i in range(500):
+            store.insert({"_id": f"{owner}-{i}", "owner": owner, "n": 0})
+            store.update(f"{owner}-{i}", inc={"n": 1})
+
+    threads = [threading.Thread(target=write, args=(f"t{i}",)) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(store) == 4000
+    assert all(store.count({"owner": f"t{i}"}) == 500 for i in range(8))
+
+
+def test_records_past_the_shared_field_map(monkeypatch):
+    from app.utils import memstore
+
+    monkeypatch.setattr(memstore, "SHARED_FIELDS", 3)
+    store = DocumentStore(indexes=("owner",))
+    store.insert({"_id": 1, "owner": "a", "n": 1})
+    store.insert({"_id": 2, "owner": "b", "custom": [1], "other": None})
+    assert store.get(1) == {"_id": 1, "owner": "a", "n": 1}
+    assert store.get(2) == {"_id": 2, "owner": "b", "custom": [1], "other": None}
+    assert [d["_id"] for d in store.find({"custom": 1})] == [2]
+    assert [d["_id"] for d in store.find({"n": None})] == [2]
+    assert store.update(2, {"owner": "a"}, inc={"n": 2})["n"] == 2
+    assert [d["_id"] for d in store.find({"owner": "a"})] == [1, 2]
+    assert store.delete(2)["custom"] == [1]
+    assert store.count({"owner": "a"}) == 1
@@ -0,0 +1,48 @@
+import bson
+
+from app.migrations import subscriptions_from_arrays
+from app.repositories import VERSION
+from app.services import serie_service
+
+
+def test_subscriptions_from_arrays(counted_db):
+    db, _ = counted_db
+    a, b, emptied = bson.ObjectId(), bson.ObjectId(), bson.ObjectId()
+    series = db.get_collection("series")
+    series.insert_many([{"_id": a, "serie_subcribe_num": 0, VERSION: 1},
+                        {"_id": b, "serie_subcribe_num": 0, "serie_sns": "arn:local:sns:b", VERSION: 1},
+                        {"_id": emptied, "serie_subcribe_num": 4, VERSION: 1}])
+    # legacy users: subscription order in the array, updatedAt never set
+    users = db.get_collection("users")
+    users.insert_many([
+        {"_id": f"u{i}", "serie_subcribe": [str(a), str(b)] if i % 2 else [str(a)], "updatedAt": None, VERSION: 1}
+        for i in range(5)
+    ])
+    # left without createdAt by an earlier run
+    db.get_collection("subscriptions").insert_one({"user_id": "u9", "serie_id": a, "createdAt": None})
+
+    assert subscriptions_from_arrays.run(db) == 7
+    subs = db.get_collection("subscriptions")
+    assert subs.count_documents({"createdAt": None}) == 0
+    stamps = [s["createdAt"] for s in subs.find()]
+    assert len(set(stamps)) == len(stamps) == 8
+    assert users.count_documents({"serie_subcribe": {"$exists": True}}) == 0
+    assert {s["_id"]: s["serie_subcribe_num"] for s in series.find()} == {a: 6, b: 2, emptied: 0}
+    # changed bodies get new ETags
+    assert {s[VERSION] for s in series.find()} == {u[VERSION] for u in users.find()} == {2}
+
+    # every migrated subscriber is reachable by paging
+    seen, before = [], None
+    for _ in range(10):
+        page = serie_service.get_serie_subscribers(str(a), limit=2, before=before)
+        if not page:
+            break
+        seen += [s["user_id"] for s in page]
+        before = page[-1]["createdAt"]
+    assert sorted(seen) == ["u0", "u1", "u2", "u3", "u4", "u9"]
+
+    # a new subscription lists before the migrated ones, and a re-run is a no-op
+    serie_service.subscribe_serie(str(b), "new", "new@example.com")
+    assert serie_service.get_serie_subscribers(str(b), limit=1)[0]["user_id"] == "new"
+    assert subscriptions_from_arrays.run(db) == 0
+    assert series.find_one({"_id": a})[VERSION] == 2
@@ -0,0 +1,48 @@
+import time
+
+import jwt
+
+from app import create_app
+from app.middleware.profiling import PROFILE_ID_HEADER, profile_header, signature, verify
+
+
+def _client(monkeypatch, tmp_path, profiler):
+    monkeypatch.setenv("PROFILE_SECRET", "s3cret")
+    monkeypatch.setenv("PROFILE_DIR", str(tmp_path))
+    monkeypatch.setenv("PROFILER", profiler)
+    return create_app().test_client()
+
+
+def test_signed_header_profiles_that_request_only(monkeypatch, tmp_path):
+    client = _client(monkeypatch, tmp_path, "sampling")
+    header = profile_header("s3cret", "GET", "/api/series/search")
+    assert PROFILE_ID_HEADER not in client.get('/api/series/search?keyword=x').headers
+    assert PROFILE_ID_HEADER not in client.get('/health', headers={"X-Profile": header}).headers
+    assert PROFILE_ID_HEADER not in client.get('/api/series/search', headers={"X-Profile": "1:forged"}).headers
+
+    rv = client.get('/api/series/search', query_string={"keyword": "x"}, headers={"X-Profile": header})
+    assert rv.status_code == 200
+    assert (tmp_path / f"{rv.headers[PROFILE_ID_HEADER]}.collapsed").exists()
+
+
+def test_cprofile_and_admin_download(monkeypatch, tmp_path):
+    client = _client(monkeypatch, tmp_path, "cprofile")
+    rv = client.get('/health', headers={"X-Profile": profile_header("s3cret", "GET", "/health")})
+    profile_id = rv.headers[PROFILE_ID_HEADER]
+    assert (tmp_path / f"{profile_id}.pstats").stat().st_size > 0
+
+    for var in ("COGNITO_JWKS_URL", "JWKS_URL", "COGNITO_USER_POOL_ID", "COGNITO_POOL_ID"):
+        monkeypatch.delenv(var, raising=False)
+    monkeypatch.setenv("ALLOW_INSECURE_JWT", "true")
+    token = jwt.encode({"userId": "a1", "cognito:groups": ["admin"]}, "test-secret-" + "x" * 32, algorithm="HS256")
+    admin = {"Authorization": f"Bearer {token}"}
+    assert client.get(f'/api/admin/profiles/{profile_id}', headers=admin).status_code == 200
+    assert client.get('/api/admin/profiles/..%2Fetc', headers=admin).status_code == 404
+
+
+def test_verify_rejects_expired_and_far_future():
+    expires = int(time.time()) - 1
+    assert not verify("k", f"{expires}:{signature('k', expires, 'GET', '/')}", "GET", "/", 3600)
+    far = int(time.time()) + 10 * 3600
+    assert not verify("k", f"{far}:{signature('k', far, 'GET', '/')}", "GET", "/", 3600)
+    assert verify("k", profile_header("k", "get", "/"), "GET", "/", 3600)
@@ -0,0 +1,138 @@
+"""Mongo commands and S3/SNS calls per request, for every API endpoint.
+
+BUDGETS is the declared cost of one request to each endpoint, keyed by its
+`app.url_map` endpoint name, as (Mongo commands, AWS calls), on the happy
+path with a cold cache (autocomplete's one command builds its index). A
+change that adds a command fails here with the exact list; lowering a budget
+is always welcome. Every /api/ endpoint is either budgeted or listed in
+EXEMPT with a reason, so a new route cannot go unmeasured.
+"""
+import io
+
+import jwt
+import pytest
+
+BUDGETS = {
+    "auth.auth_status": (0, 0),
+    "auth.auth_config": (0, 0),
+    "batch.post_batch": (2, 0),
+    "main.example": (0, 0),
+    "users.create_profile": (2, 0),
+    "users.get_current_profile": (1, 0),
+    "users.get_users_batch": (1, 0),
+    "users.get_user": (1, 0),
+    "users.put_user": (1, 0),
+    "series.post_serie": (1, 2),
+    "series.get_series": (1, 0),
+    # also covers ?expand=lessons
+    "series.get_serie": (1, 0),
+    "series.patch_serie": (1, 0),
+    # one per query term ("bai hoc")
+    "series.search": (2, 0),
+    "series.autocomplete": (1, 0),
+    "series.get_series_batch": (1, 0),
+    "series.series_lessons_proxy": (0, 0),
+    "series.subscribe": (2, 1),
+    "series.get_subscribed": (1, 0),
+    "series.get_created": (1, 0),
+    "series.unsubscribe": (2, 0),
+    "series.delete": (2, 1),
+    "lessons.post_lesson": (2, 3),
+    "lessons.post_lessons_bulk": (2, 1),
+    "lessons.get_lessons": (2, 0),
+    "lessons.get_lesson": (1, 0),
+    "lessons.patch_lesson": (1, 0),
+    "lessons.del_doc": (1, 1),
+    "lessons.del_lesson": (2, 1),
+}
+
+# /api/ endpoints deliberately left unbudgeted, with the reason
+EXEMPT = {
+    "auth.verify_token": "checks a token in-process; answers 401 even for valid tokens",
+    "admin.slow_queries": "operator diagnostics over in-process state, admin group only",
+    "admin.reset_slow_queries": "operator diagnostics over in-process state, admin group only",
+    "admin.get_profile": "reads a profile file from PROFILE_DIR, admin group only",
+    "admin.memory_usage": "operator diagnostics over in-process state, admin group only",
+}
+
+
+@pytest.fixture
+def headers():
+    token = jwt.encode({"userId": "u1", "email": "u1@example.com"}, "test-secret-" + "x" * 32, algorithm="HS256")
+    return {"Authorization": f"Bearer {token}"}
+
+
+def _file(name):
+    return io.BytesIO(b"data"), name
+
+
+def test_every_api_endpoint_is_budgeted(query_budget):
+    endpoints = {rule.endpoint for rule in query_budget.client.application.url_map.iter_rules()
+                 if rule.rule.startswith("/api/")}
+    assert not set(BUDGETS) & set(EXEMPT)
+    assert endpoints - set(EXEMPT) == set(BUDGETS)
+
+
+def test_endpoint_budgets(query_budget, headers):
+    spent = set()
+
+    def call(endpoint, method, path, **kwargs):
+        spent.add(endpoint)
+        mongo, aws = BUDGETS[endpoint]
+        response = query_budget.call(method, path, mongo=mongo, aws=aws, **kwargs)
+        assert response.status_code < 300, (endpoint, response.status_code, response.get_data(as_text=True))
+        return response.get_json()
+
+    call("main.example", "GET", "/api/example?q=1")
+    call("auth.auth_config", "GET", "/api/auth/config")
+    call("auth.auth_status", "GET", "/api/auth/status", headers=headers)
+    call("users.create_profile", "POST", "/api/users/profile",
+         json={"userId": "u1", "cognitoUserId": "u1", "email": "u1@example.com"})
+    call("users.get_current_profile", "GET", "/api/users/profile", headers=headers)
+    call("users.get_user", "GET", "/api/users/u1", headers=headers)
+    call("users.get_users_batch", "GET", "/api/users/batch?ids=u1,u2", headers=headers)
+    call("users.put_user", "PUT", "/api/users/u1", json={"name": "U"}, headers=headers)
+
+    serie = call("series.post_serie", "POST", "/api/series/", headers=headers, content_type="multipart/form-data",
+                 data={"serie_title": "Bài học", "isPublish": "true", "serie_thumbnail": _file("t.png")})
+    url = f"/api/series/{serie['_id']}"
+    call("series.get_serie", "GET", url)
+    call("series.patch_serie", "PATCH", url, json={"serie_title": "Bài học Python"}, headers=headers)
+    call("series.get_series", "GET", "/api/series/")
+    call("series.search", "GET", "/api/series/search?keyword=bai+hoc")
+    call("series.autocomplete", "GET", "/api/series/autocomplete?q=bai")
+    call("series.get_series_batch", "GET", f"/api/series/batch?ids={serie['_id']}")
+    call("series.series_lessons_proxy", "GET", f"{url}/lessons")
+    call("batch.post_batch", "POST", "/api/batch/", headers=headers,
+         json={"requests": [{"path": url}, {"path": "/api/series/search?keyword=python"}]})
+    call("series.subscribe", "POST", f"{url}/subscribe", headers=headers)
+    call("series.get_subscribed", "GET", "/api/series/subscribed", headers=headers)
+    call("series.get_created", "GET", "/api/series/created", headers=headers)
+
+    lesson = call("lessons.post_lesson", "POST", f"{url}/lessons/", headers=headers,
+                  content_type="multipart/form-data",
+                  data={"lesson_title": "L1", "lesson_video": _file("v.mp4"), "lesson_documents": [_file("a.pdf")]})
+    call("lessons.post_lessons_bulk", "POST", f"{url}/lessons/bulk", headers=headers,
+         json=[{"lesson_title": "L2"}, {"lesson_title": "L3"}])
+    lesson_url = f"{url}/lessons/{lesson['_id']}"
+    call("lessons.get_lessons", "GET", f"{url}/lessons/", headers=headers)
+    call("lessons.get_lesson", "GET", lesson_url, headers=headers)
+    call("series.get_serie", "GET", f"{url}?expand=lessons")
+    call("lessons.patch_lesson", "PATCH", lesson_url, json={"lesson_title": "L1b"}, headers=headers)
+    call("lessons.del_doc", "DELETE", f"{lesson_url}/documents", headers=headers,
+         json={"docUrl": lesson["lesson_documents"][0]})
+    call("lessons.del_lesson", "DELETE", lesson_url, headers=headers)
+
+    call("series.unsubscribe", "POST", f"{url}/unsubscribe", headers=headers)
+
+    empty = query_budget.client.post("/api/series/", json={"serie_title": "Empty"}, headers=headers).get_json()
+    call("series.delete", "DELETE", f"/api/series/{empty['_id']}", headers=headers)
+    assert spent == set(BUDGETS)
+
+
+def test_overspend_reports_commands(query_budget, headers):
+    with pytest.raises(pytest.fail.Exception) as failure:
+        query_budget.call("POST", "/api/series/", mongo=0, aws=0, headers=headers, json={"serie_title": "S"})
+    message = str(failure.value)
+    assert "1 Mongo commands (budget 0)" in message and "insert series" in message
+    assert "sns.CreateTopic" in message
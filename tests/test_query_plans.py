@@ -0,0 +1,214 @@
+"""Query plans of every service query shape, on a seeded server.
+
+Needs MONGODB_TEST_URI (mongomock cannot explain). The database is seeded
+with realistic volumes, every service read and write path runs once while
+a listener records the commands, and each distinct shape (see
+app.utils.slow_queries.command_shape) is explained with executionStats.
+A shape fails when its plan scans a collection, or when it examines more
+than EXAMINED_RATIO documents per document it returns or writes (plus
+EXAMINED_SLACK). Either usually means an index is missing from
+app.utils.mongodb.INDEXES.
+"""
+import io
+import json
+import os
+import random
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from pymongo import monitoring
+from werkzeug.datastructures import FileStorage, MultiDict
+
+from app import repositories
+from app.services import lesson_service, serie_service, user_service
+from app.utils import ids
+from app.utils.mongodb import ensure_indexes
+from app.utils.search import tokenize
+from app.utils.slow_queries import command_shape, plan_stages
+
+pytestmark = pytest.mark.skipif(not os.environ.get("MONGODB_TEST_URI"), reason="needs MONGODB_TEST_URI")
+
+USERS, SERIES, LESSONS_PER_SERIE, SUBSCRIPTIONS = 500, 3000, 8, 30000
+EXAMINED_RATIO, EXAMINED_SLACK = 2, 5
+EXPLAINED = {"find", "aggregate", "findAndModify", "count", "distinct", "update", "delete"}
+# fields explain refuses (sessions, transactions) or that only matter for writes
+_DROPPED = ("lsid", "txnNumber", "autocommit", "startTransaction", "$clusterTime", "$db",
+            "$readPreference", "readConcern", "writeConcern")
+# (command, collection, shape) allowed to scan, with the reason
+ALLOWED_SCANS = {
+    ("find", "series", '{"filter": {}}'): "GET /api/series/ lists every serie",
+}
+WORDS = "bài học python flask mongodb lập trình cơ bản nâng cao dữ liệu api backend".split()
+
+
+class _Recorder(monitoring.CommandListener):
+    def __init__(self):
+        self.commands = []
+        self.enabled = False
+
+    def started(self, event):
+        if self.enabled and event.command_name in EXPLAINED:
+            self.commands.append((event.database_name, event.command_name, dict(event.command)))
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+def _seed(db):
+    rnd = random.Random(11)
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    users = [f"user-{i}" for i in range(USERS)]
+    db.users.insert_many([{"_id": u, "email": f"{u}@example.com", "createdAt": start} for u in users])
+    series, lessons = [], []
+    for i in range(SERIES):
+        serie_id = ids.new_id()
+        lesson_ids = [ids.new_id() for _ in range(LESSONS_PER_SERIE)]
+        title = " ".join(rnd.choices(WORDS, k=4))
+        created = start + timedelta(minutes=i)
+        series.append({
+            "_id": serie_id, "serie_title": title, "serie_title_tokens": tokenize(title),
+            "serie_user": rnd.choice(users), "isPublish": rnd.random() < 0.4, "serie_lessons": lesson_ids,
+            "serie_subcribe_num": 0, "serie_sns": f"arn:local:sns:serie_{serie_id}", "createdAt": created,
+            "updatedAt": created,
+        })
+        lessons.extend({"_id": lid, "lesson_serie": serie_id, "lesson_title": f"{title} {n}",
+                        "content": "x" * 200, "createdAt": created, "updatedAt": created}
+                       for n, lid in enumerate(lesson_ids))
+    db.series.insert_many(series)
+    db.lessons.insert_many(lessons)
+    pairs = {(rnd.choice(users), rnd.choice(series)["_id"]) for _ in range(SUBSCRIPTIONS)}
+    db.subscriptions.insert_many([
+        {"user_id": u, "serie_id": s, "createdAt": start + timedelta(seconds=n)} for n, (u, s) in enumerate(pairs)])
+    return users
+
+
+def _exercise(users):
+    """Every service function, once, with realistic arguments."""
+    user = users[0]
+    user_service.create_user({"cognitoUserId": "new-user", "email": "new@example.com"})
+    user_service.get_user_by_id(user)
+    user_service.get_users_by_ids(users[:20])
+    user_service.get_user_by_cognito_id(user)
+    user_service.update_user(user, {"name": "U"})
+    user_service.update_user_by_cognito_id(user, {"name": "U2"})
+
+    serie = serie_service.create_serie({"serie_title": "Bài học mới", "isPublish": "true"}, user)
+    serie_id = serie["_id"]
+    serie_service.get_serie_by_id(serie_id)
+    serie_service.get_series_by_ids([serie_id, str(ids.new_id())])
+    serie_service.get_all_series_by_user(user)
+    serie_service.search_series_by_title("bai hoc")
+    serie_service.autocomplete_series("bai")
+    serie_service.update_serie(serie_id, {"serie_title": "Bài học Python"}, user)
+    serie_service.subscribe_serie(serie_id, user, f"{user}@example.com")
+    serie_service.get_series_subscribed_by_user(user, page=2, limit=5)
+    serie_service.get_serie_subscribers(serie_id)
+
+    files = MultiDict([("lesson_documents", FileStorage(io.BytesIO(b"1"), filename="a.pdf"))])
+    lesson = lesson_service.create_lesson({"lesson_title": "L", "lesson_serie": serie_id}, user, None, files)
+    lesson_service.create_lessons_bulk(serie_id, [{"lesson_title": "B1"}, {"lesson_title": "B2"}], user)
+    lesson_service.get_all_lessons_by_serie(serie_id)
+    lesson_service.get_lessons_version(serie_id)
+    lesson_service.get_lesson_by_id(serie_id, lesson["_id"])
+    serie_service.get_serie_with_lessons(serie_id)
+    lesson_service.update_lesson(serie_id, lesson["_id"], {"lesson_title": "L2"})
+    lesson_service.delete_document_by_url(serie_id, lesson["_id"], lesson["lesson_documents"][0])
+    for row in lesson_service.get_all_lessons_by_serie(serie_id):
+        lesson_service.delete_lesson(serie_id, row["_id"])
+    serie_service.unsubscribe_serie(serie_id, user, f"{user}@example.com")
+    serie_service.delete_serie(serie_id)
+    serie_service.get_all_series({})
+
+
+def _find(node, key):
+    """Every value stored under `key` anywhere in `node`."""
+    if isinstance(node, dict):
+        for k, v in node.items():
+            if k == key:
+                yield v
+            yield from _find(v, key)
+    elif isinstance(node, list):
+        for child in node:
+            yield from _find(child, key)
+
+
+def _plan_problem(explain):
+    stages = plan_stages(explain)
+    if "COLLSCAN" in stages or any(n > 0 for n in _find(explain, "collectionScans")):
+        return f"collection scan ({' > '.join(stages)})"
+    stats = next(_find(explain, "executionStats"), None)
+    if stats is None:
+        return None
+    examined = stats.get("totalDocsExamined", 0)
+    produced = max([stats.get("nReturned", 0), *_find(stats, "nWouldModify"), *_find(stats, "nWouldDelete"), 1])
+    if examined > EXAMINED_RATIO * produced + EXAMINED_SLACK:
+        return f"examined {examined} documents for {produced} ({' > '.join(stages)})"
+    return None
+
+
+@pytest.fixture(scope="module")
+def seeded():
+    from pymongo import MongoClient
+
+    recorder = _Recorder()
+    client = MongoClient(os.environ["MONGODB_TEST_URI"], event_listeners=[recorder])
+    db = client[f"test_plans_{uuid.uuid4().hex[:12]}"]
+    ensure_indexes(db)
+    users = _seed(db)
+    # no id cache: every lookup has to reach the server to be explained
+    previous = repositories.use(repositories.mongo_repositories(db))
+    yield db, recorder, users
+    repositories.use(previous)
+    client.drop_database(db.name)
+    client.close()
+
+
+def test_search_examines_a_bounded_candidate_set(seeded, monkeypatch):
+    """The ratio check above can't see an unbounded search: its `$cursor`
+    returns every document it examines. Common terms must not be ranked
+    over every title that contains them."""
+    from app.repositories import mongo
+
+    db, recorder, _ = seeded
+    monkeypatch.setattr(mongo, "SEARCH_CANDIDATES", 50)
+    recorder.commands.clear()
+    recorder.enabled = True
+    serie_service.search_series_by_title("bai hoc python")
+    recorder.enabled = False
+    assert recorder.commands
+    for database, name, command in recorder.commands:
+        explainable = {k: v for k, v in command.items() if k not in _DROPPED}
+        explain = db.client[database].command("explain", explainable, verbosity="executionStats")
+        # one extra key per term, where each index interval's scan stops
+        keys = sum(_find(explain, "totalKeysExamined"))
+        assert keys <= mongo.SEARCH_CANDIDATES + 3, f"{name}: examined {keys} keys"
+
+
+def test_every_query_shape_is_indexed(seeded):
+    db, recorder, users = seeded
+    recorder.enabled = True
+    _exercise(users)
+    recorder.enabled = False
+
+    shapes = {}
+    for database, name, command in recorder.commands:
+        target = command.get(name)
+        key = (name, target if isinstance(target, str) else "",
+               json.dumps(command_shape(name, command), sort_keys=True, default=str))
+        shapes.setdefault(key, (database, command))
+    assert len(shapes) >= 15, sorted(shapes)
+
+    problems = []
+    for key, (database, command) in sorted(shapes.items()):
+        if key in ALLOWED_SCANS:
+            continue
+        explainable = {k: v for k, v in command.items() if k not in _DROPPED}
+        explain = db.client[database].command("explain", explainable, verbosity="executionStats")
+        problem = _plan_problem(explain)
+        if problem:
+            problems.append(f"{key[0]} {key[1]} {key[2]}: {problem}")
+    assert not problems, "unindexed query shapes:\n" + "\n".join(problems)
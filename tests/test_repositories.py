@@ -0,0 +1,262 @@
+"""The same scenarios against every repository backend: Mongo (mongomock),
+the in-memory store and the SQLite store."""
+import multiprocessing
+import sys
+import threading
+
+import pytest
+
+from app import repositories
+from app.repositories import DuplicateError
+from app.repositories.base import UserRepository
+from app.utils.memstore import DocumentStore
+from app.utils.mongodb import ensure_indexes
+from app.utils.sqlitestore import SQLiteStore
+
+
+@pytest.fixture(params=["mongo", "memory", "sqlite"])
+def repos(request, tmp_path):
+    if request.param == "mongo":
+        mongomock = pytest.importorskip("mongomock")
+        db = mongomock.MongoClient().get_database("test")
+        ensure_indexes(db)
+        return repositories.mongo_repositories(db)
+    if request.param == "memory":
+        return repositories.local_repositories(lambda name, **kw: DocumentStore(**kw))
+    path = str(tmp_path / "repos.sqlite3")
+    return repositories.local_repositories(lambda name, **kw: SQLiteStore(path, name, **kw))
+
+
+def _serie(repos, title, publish=True, **extra):
+    serie_id = repos.series.new_id()
+    repos.series.insert({"_id": serie_id, "serie_title": title, "isPublish": publish, "serie_user": "u1",
+                         "serie_lessons": [], "serie_subcribe_num": 0, "serie_sns": f"arn:{serie_id}", **extra})
+    return str(serie_id)
+
+
+def _lesson(repos, serie_id, title, **extra):
+    lesson = {"_id": repos.lessons.new_id(), "lesson_serie": serie_id, "lesson_title": title, "lesson_documents": [], **extra}
+    repos.lessons.insert(lesson)
+    repos.series.add_lessons(serie_id, [lesson["_id"]])
+    return lesson["_id"]
+
+
+def test_series_reads_and_updates(repos):
+    a = _serie(repos, "Bài học Python")
+    b = _serie(repos, "Bài tập", publish=False)
+    assert repos.series.get(a)["serie_title"] == "Bài học Python"
+    assert repos.series.get("missing") is None
+    assert "serie_title_tokens" not in repos.series.get(a)
+    assert set(repos.series.get_many([a, b, "missing"])) == {a, b}
+    assert [str(s["_id"]) for s in repos.series.find({"isPublish": False})] == [b]
+
+    before = repos.series.update(a, {"serie_title": "Lập trình"}, return_before=True)
+    assert before["serie_title"] == "Bài học Python"
+    assert repos.series.update(a, {"isPublish": True})["serie_title"] == "Lập trình"
+    assert repos.series.update("missing", {"serie_title": "x"}) is None
+
+
+def test_search_and_autocomplete_see_published_titles_only(repos):
+    a = _serie(repos, "Bài học Python")
+    _serie(repos, "Bài học nháp", publish=False)
+    c = _serie(repos, "Học máy")
+    assert [str(s["_id"]) for s in repos.series.search("bai hoc", 10)] == [a, c]
+    assert repos.series.search("bai hoc", 1)[0]["serie_title"] == "Bài học Python"
+    assert repos.series.autocomplete("bai", 10) == [{"_id": a, "serie_title": "Bài học Python"}]
+
+    repos.series.update(a, {"serie_title": "Lập trình"})
+    assert repos.series.autocomplete("bai", 10) == []
+    assert repos.series.autocomplete("lap", 10)[0]["_id"] == a
+
+
+def test_serie_lessons(repos):
+    serie = _serie(repos, "S")
+    ids = [_lesson(repos, serie, f"L{i}", content="long") for i in range(3)]
+    assert repos.series.add_lessons("f" * 24, []) is None
+    expanded = repos.series.get_with_lessons(serie, ("lesson_title",))
+    assert [l["lesson_title"] for l in expanded["lessons"]] == ["L0", "L1", "L2"]
+    assert "content" not in expanded["lessons"][0]
+
+    assert repos.series.delete_if_empty(serie) is None and repos.series.exists(serie)
+    repos.series.remove_lessons(serie, ids)
+    assert repos.series.get(serie)["serie_lessons"] == []
+    assert str(repos.series.delete_if_empty(serie)["_id"]) == serie
+    assert not repos.series.exists(serie)
+
+
+def test_subscriptions(repos):
+    ids = [_serie(repos, f"S{i}") for i in range(4)]
+    for serie_id in ids:
+        repos.subscriptions.add("u2", serie_id)
+        assert repos.series.add_subscribers(serie_id, 1, require_topic=True)["serie_sns"]
+    with pytest.raises(DuplicateError):
+        repos.subscriptions.add("u2", ids[0])
+    assert repos.series.get(ids[0])["serie_subcribe_num"] == 1
+
+    page = repos.subscriptions.series_for_user("u2", 1, 2)
+    assert [str(s["_id"]) for s in page] == [ids[2], ids[1]]
+    assert [s["user_id"] for s in repos.subscriptions.subscribers(ids[0], 10)] == ["u2"]
+
+    sub = repos.subscriptions.remove("u2", ids[3])
+    assert repos.subscriptions.remove("u2", ids[3]) is None
+    repos.subscriptions.restore(sub)
+    repos.subscriptions.remove_for_serie(ids[3])
+    repos.series.delete_if_empty(ids[2])
+    assert [str(s["_id"]) for s in repos.subscriptions.series_for_user("u2", 0, 10)] == [ids[1], ids[0]]
+
+
+def test_lessons(repos):
+    serie = _serie(repos, "S")
+    lesson_id = _lesson(repos, serie, "L", lesson_documents=["a", "b"], updatedAt=None)
+    other = _serie(repos, "T")
+    assert repos.lessons.get(other, lesson_id) is None
+    assert repos.lessons.get(serie, "missing") is None
+    assert repos.lessons.update(other, lesson_id, {"lesson_title": "x"}) is None
+    assert repos.lessons.update(serie, lesson_id, {"lesson_title": "L2"}, return_before=True)["lesson_title"] == "L"
+    assert [l["lesson_title"] for l in repos.lessons.list_by_serie(serie)] == ["L2"]
+
+    assert repos.lessons.pull_document(serie, lesson_id, "a")
+    assert not repos.lessons.pull_document(serie, lesson_id, "a")
+    assert repos.lessons.get(serie, lesson_id)["lesson_documents"] == ["b"]
+    count, updated_at, versions = repos.lessons.version(serie)
+    assert count == 1 and updated_at is not None and versions == 3
+    assert repos.lessons.version(other) == (0, None, 0)
+
+    fresh = {"_id": repos.lessons.new_id(), "lesson_serie": serie, "lesson_title": "M"}
+    assert set(repos.lessons.insert_many([fresh, {"_id": lesson_id, "lesson_serie": serie}])) == {1}
+    assert repos.lessons.delete(other, lesson_id) is None
+    assert repos.lessons.delete(serie, lesson_id)["lesson_title"] == "L2"
+    assert [l["lesson_title"] for l in repos.lessons.list_by_serie(serie)] == ["M"]
+
+
+def test_users(repos):
+    created = repos.users.upsert("u1", {"name": "A"}, on_insert={"createdAt": 1})
+    assert created["name"] == "A" and created["createdAt"] == 1
+    updated = repos.users.upsert("u1", {"name": "B"}, on_insert={"createdAt": 2})
+    assert updated["name"] == "B" and updated["createdAt"] == 1
+    assert repos.users.update("u1", {"name": "C"})["name"] == "C"
+    assert repos.users.update("nobody", {"name": "C"}) is None
+    assert list(repos.users.get_many(["nobody", "u1"])) == ["u1"]
+    assert repos.users.get("nobody") is None
+
+
+def test_mongo_search_scores_a_bounded_candidate_set(monkeypatch):
+    mongomock = pytest.importorskip("mongomock")
+    from app.repositories import mongo
+
+    db = mongomock.MongoClient().get_database("test")
+    repos = repositories.mongo_repositories(db)
+    full = _serie(repos, "Bài học Python", serie_subcribe_num=0)
+    popular = [_serie(repos, f"Bài học số {i}", serie_subcribe_num=10 + i) for i in range(8)]
+    _serie(repos, "Bài tập", serie_subcribe_num=0)
+    assert [str(s["_id"]) for s in repos.series.search("bai hoc python", 3)] == [full, popular[7], popular[6]]
+
+    # more popular partial matches than candidates: the rare term's window
+    # still scores the full match
+    monkeypatch.setattr(mongo, "SEARCH_CANDIDATES", 5)
+    found = repos.series.search("bai hoc python", 3)
+    assert [str(s["_id"]) for s in found] == [full, popular[7], popular[6]]
+    assert "serie_title_tokens" not in found[0]
+
+
+def test_every_write_bumps_the_version(repos):
+    from app.repositories import VERSION
+
+    serie = _serie(repos, "S")
+    assert repos.series.get(serie)[VERSION] == 1
+    repos.series.update(serie, {"serie_title": "T"})
+    repos.series.add_subscribers(serie, 1)
+    lesson_id = _lesson(repos, serie, "L", lesson_documents=["a"])
+    repos.series.remove_lessons(serie, [lesson_id])
+    assert repos.series.get(serie)[VERSION] == 5
+
+    repos.lessons.update(serie, lesson_id, {"lesson_title": "M"})
+    repos.lessons.pull_document(serie, lesson_id, "a")
+    assert repos.lessons.get(serie, lesson_id)[VERSION] == 3
+
+    assert repos.users.upsert("u1", {"name": "A"})[VERSION] == 1
+    assert repos.users.upsert("u1", {"name": "A"})[VERSION] == 2
+    assert repos.users.update("u1", {"name": "B"})[VERSION] == 3
+
+
+def test_transaction_runs_callback(repos):
+    assert repos.transaction(lambda session: "done") == "done"
+
+
+def test_metrics_and_query_budget():
+    from flask import Flask, g
+
+    from app.repositories.decorators import BudgetedRepository, MeteredRepository, QueryBudgetExceeded, RepositoryMetrics
+
+    metrics = RepositoryMetrics()
+    repos = repositories.local_repositories(lambda name, **kw: DocumentStore(**kw))
+    repos = repos.decorate(lambda name, repo: MeteredRepository(name, repo, metrics))
+    repos = repos.decorate(lambda name, repo: BudgetedRepository(name, repo, 2, strict=True))
+
+    repos.users.upsert("u1", {"name": "A"})
+    assert repos.users.get("u1")["name"] == "A"
+    assert metrics.snapshot()["users.get"]["calls"] == 1
+
+    with Flask(__name__).test_request_context("/"):
+        repos.users.get("u1")
+        repos.users.get("u2")
+        with pytest.raises(QueryBudgetExceeded):
+            repos.users.get("u3")
+        assert g.repository_calls == ["users.get", "users.get", "users.get"]
+    # the call over budget never reached the store
+    assert metrics.snapshot()["users.get"]["calls"] == 3
+
+
+def test_incomplete_backend_fails_at_construction():
+    class Partial(UserRepository):
+        def get(self, user_id):
+            return None
+
+    with pytest.raises(TypeError):
+        Partial()
+
+
+def _local(kind, path):
+    if kind == "memory":
+        return repositories.local_repositories(lambda name, **kw: DocumentStore(**kw))
+    return repositories.local_repositories(lambda name, **kw: SQLiteStore(path, name, **kw))
+
+
+def _add_lessons(path, serie_id, worker):
+    repos = _local("sqlite", path)
+    for i in range(25):
+        repos.series.add_lessons(serie_id, [f"{worker}-{i}"])
+
+
+@pytest.mark.parametrize("kind", ["memory", "sqlite"])
+def test_concurrent_lesson_appends_are_not_lost(kind, tmp_path):
+    repos = _local(kind, str(tmp_path / "repos.sqlite3"))
+    serie_id = _serie(repos, "Bài học")
+    threads = [threading.Thread(target=lambda w=w: [repos.series.add_lessons(serie_id, [f"{w}-{i}"])
+                                                   for i in range(25)]) for w in range(8)]
+    # switch threads often enough for a read-then-write to interleave
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    finally:
+        sys.setswitchinterval(interval)
+    assert len(set(repos.series.get(serie_id)["serie_lessons"])) == 200
+    repos.series.remove_lessons(serie_id, [f"0-{i}" for i in range(25)])
+    assert len(repos.series.get(serie_id)["serie_lessons"]) == 175
+
+
+def test_worker_processes_do_not_lose_lesson_appends(tmp_path):
+    path = str(tmp_path / "repos.sqlite3")
+    serie_id = _serie(_local("sqlite", path), "Bài học")
+    ctx = multiprocessing.get_context("spawn")
+    workers = [ctx.Process(target=_add_lessons, args=(path, serie_id, w)) for w in range(4)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join(60)
+        assert w.exitcode == 0
+    assert len(set(_local("sqlite", path).series.get(serie_id)["serie_lessons"])) == 100
@@ -0,0 +1,133 @@
+"""Mongo round trips per service write path (happy path).
+
+Transaction control commands (commitTransaction) are not counted: they only
+appear on replica sets and are covered by tests/test_transactions.py.
+"""
+import io
+
+from werkzeug.datastructures import FileStorage, MultiDict
+
+from app.services import lesson_service, serie_service, user_service
+
+
+def _rounds(counter, fn, *args, **kwargs):
+    counter.reset()
+    result = fn(*args, **kwargs)
+    return result, sum(1 for name, _ in counter.commands if name not in ("commitTransaction", "abortTransaction"))
+
+
+def _thumbnail():
+    return FileStorage(io.BytesIO(b"png"), filename="t.png", content_type="image/png")
+
+
+def test_serie_write_round_trips(counted_db):
+    db, counter = counted_db
+    user_service.create_user({"cognitoUserId": "u1"})
+
+    serie, n = _rounds(counter, serie_service.create_serie, {"serie_title": "A"}, "u1")
+    assert n == 1
+
+    updated, n = _rounds(counter, serie_service.update_serie, serie["_id"], {"serie_title": "B"}, "u1")
+    assert n == 1 and updated["serie_title"] == "B"
+
+    updated, n = _rounds(counter, serie_service.update_serie, serie["_id"], {}, "u1", None, _thumbnail())
+    assert n == 1 and updated["serie_thumbnail"].endswith("t.png")
+
+    _, n = _rounds(counter, serie_service.subscribe_serie, serie["_id"], "u1", "u1@example.com")
+    assert n == 2
+    result, n = _rounds(counter, serie_service.subscribe_serie, serie["_id"], "u1", "u1@example.com")
+    assert n == 1 and result["alreadySubscribed"]
+
+    _, n = _rounds(counter, serie_service.unsubscribe_serie, serie["_id"], "u1", "u1@example.com")
+    assert n == 2
+    assert db.get_collection("series").find_one()["serie_subcribe_num"] == 0
+
+    deleted, n = _rounds(counter, serie_service.delete_serie, serie["_id"])
+    assert n == 2 and deleted is True
+
+
+def test_lesson_write_round_trips(counted_db):
+    db, counter = counted_db
+    serie = serie_service.create_serie({"serie_title": "A"}, "u1")
+    files = MultiDict([("lesson_documents", FileStorage(io.BytesIO(b"1"), filename="a.pdf")),
+                       ("lesson_documents", FileStorage(io.BytesIO(b"2"), filename="b.pdf"))])
+
+    lesson, n = _rounds(counter, lesson_service.create_lesson, {"lesson_title": "L", "lesson_serie": serie["_id"]}, "u1", None, files)
+    assert n == 2 and len(lesson["lesson_documents"]) == 2
+    assert db.get_collection("series").find_one()["serie_lessons"] == [db.get_collection("lessons").find_one()["_id"]]
+
+    updated, n = _rounds(counter, lesson_service.update_lesson, serie["_id"], lesson["_id"], {"lesson_title": "L2"})
+    assert n == 1 and updated["lesson_title"] == "L2"
+
+    _, n = _rounds(counter, lesson_service.delete_document_by_url, serie["_id"], lesson["_id"], lesson["lesson_documents"][0])
+    assert n == 1
+
+    _, n = _rounds(counter, lesson_service.delete_lesson, serie["_id"], lesson["_id"])
+    assert n == 2
+    assert db.get_collection("series").find_one()["serie_lessons"] == []
+
+
+def test_bulk_lessons_round_trips(counted_db):
+    db, counter = counted_db
+    serie = serie_service.create_serie({"serie_title": "A"}, "u1")
+    items = [{"lesson_title": f"L{i}"} for i in range(50)] + [{"content": "untitled"}]
+    results, n = _rounds(counter, lesson_service.create_lessons_bulk, serie["_id"], items, "u1")
+    assert n == 2
+    assert [r["status"] for r in results] == ["created"] * 50 + ["invalid"]
+    stored = db.get_collection("series").find_one()["serie_lessons"]
+    assert [str(i) for i in stored] == [r["_id"] for r in results[:50]]
+
+
+def test_user_write_round_trips(counted_db):
+    _, counter = counted_db
+    user, n = _rounds(counter, user_service.create_user, {"cognitoUserId": "u1", "name": "A"})
+    assert n == 1 and user["name"] == "A"
+    user, n = _rounds(counter, user_service.create_user, {"cognitoUserId": "u1", "name": "B"})
+    assert n == 1 and user["name"] == "B"
+    user, n = _rounds(counter, user_service.update_user, "u1", {"name": "C"})
+    assert n == 1 and user["name"] == "C"
+
+
+def test_serie_with_lessons_is_one_round_trip(counted_db):
+    _, counter = counted_db
+    serie = serie_service.create_serie({"serie_title": "A"}, "u1")
+    for title in ("L1", "L2", "L3"):
+        lesson_service.create_lesson({"lesson_title": title, "lesson_serie": serie["_id"], "content": "long"}, "u1")
+    expanded, n = _rounds(counter, serie_service.get_serie_with_lessons, serie["_id"])
+    assert n == 1
+    assert [l["lesson_title"] for l in expanded["lessons"]] == ["L1", "L2", "L3"]
+    assert "content" not in expanded["lessons"][0]
+
+
+def test_subscribed_series_page_is_one_round_trip(counted_db):
+    _, counter = counted_db
+    ids = [serie_service.create_serie({"serie_title": f"S{i}"}, "u1")["_id"] for i in range(5)]
+    for serie_id in ids:
+        serie_service.subscribe_serie(serie_id, "u2", "u2@example.com")
+    page, n = _rounds(counter, serie_service.get_series_subscribed_by_user, "u2", 2, 2)
+    assert n == 1
+    assert [str(s["_id"]) for s in page] == [ids[2], ids[1]]
+    assert "serie_title_tokens" not in page[0]
+
+
+def test_batch_lookups_use_the_cache(counted_db):
+    _, counter = counted_db
+    ids = [serie_service.create_serie({"serie_title": f"S{i}"}, "u1")["_id"] for i in range(3)]
+    wanted = [ids[2], "0" * 24, ids[0]]
+    (series, missing), n = _rounds(counter, serie_service.get_series_by_ids, wanted, ["serie_title"])
+    assert n == 1
+    assert [s["serie_title"] for s in series] == ["S2", "S0"] and missing == ["0" * 24]
+    assert set(series[0]) == {"_id", "serie_title"}
+    _, n = _rounds(counter, serie_service.get_series_by_ids, [ids[2], ids[0]])
+    assert n == 0
+    serie_service.update_serie(ids[0], {"serie_title": "New"}, "u1")
+    (series, _), n = _rounds(counter, serie_service.get_series_by_ids, [ids[2], ids[0]])
+    assert n == 1 and series[1]["serie_title"] == "New"
+
+    for uid in ("u1", "u2"):
+        user_service.create_user({"cognitoUserId": uid, "name": uid})
+    (users, missing), n = _rounds(counter, user_service.get_users_by_ids, ["u2", "nobody", "u1"])
+    assert n == 1 and [u["_id"] for u in users] == ["u2", "u1"] and missing == ["nobody"]
+    user_service.update_user("u2", {"name": "Two"})
+    (users, _), n = _rounds(counter, user_service.get_users_by_ids, ["u2", "u1"])
+    assert n == 1 and users[0]["name"] == "Two"
@@ -0,0 +1,65 @@
+from types import SimpleNamespace
+
+import jwt
+
+from app import create_app
+from app.utils.slow_queries import SLOW_QUERIES, SlowQueryLog, command_shape
+
+
+def _events(name, command, millis, request_id=1):
+    started = SimpleNamespace(command_name=name, command=command, database_name="paas",
+                              connection_id=("db", 1), request_id=request_id)
+    done = SimpleNamespace(command_name=name, connection_id=("db", 1), request_id=request_id,
+                           duration_micros=int(millis * 1000))
+    return started, done
+
+
+class _Client:
+    def __init__(self):
+        self.explained = []
+
+    def __getitem__(self, database):
+        def command(name, cmd, verbosity):
+            self.explained.append(cmd)
+            return {"queryPlanner": {"winningPlan": {"stage": "SORT", "inputStage": {"stage": "COLLSCAN"}}}}
+        return SimpleNamespace(command=command)
+
+
+def test_shape_redacts_values():
+    cmd = {"find": "series", "filter": {"isPublish": True, "serie_title_tokens": {"$in": ["bai", "hoc"]}},
+           "sort": {"_id": 1}, "limit": 20, "lsid": {"id": "x"}}
+    assert command_shape("find", cmd) == {
+        "filter": {"isPublish": "?", "serie_title_tokens": {"$in": ["?"]}}, "sort": {"_id": "?"}}
+    update = {"update": "series", "updates": [{"q": {"_id": "abc"}, "u": {"$set": {"secret": 1}}, "multi": True}]}
+    assert command_shape("update", update) == {"updates": [{"q": {"_id": "?"}, "multi": "?"}]}
+
+
+def test_slow_commands_are_grouped_and_explained():
+    log, client = SlowQueryLog(threshold_ms=50, explain=True), _Client()
+    log.attach(client)
+    for request_id, (email, millis) in enumerate((("a@x", 80), ("b@x", 120), ("c@x", 10))):
+        started, done = _events("find", {"find": "users", "filter": {"email": email}, "lsid": {}}, millis, request_id)
+        log.started(started)
+        log.succeeded(done)
+    log._executor.shutdown(wait=True)
+
+    (stats,) = log.snapshot()
+    assert stats["count"] == 2 and stats["max_ms"] == 120 and stats["avg_ms"] == 100
+    assert stats["shape"] == {"filter": {"email": "?"}}
+    assert stats["collscan"] is True and stats["plan"] == ["SORT", "COLLSCAN"]
+    assert client.explained == [{"find": "users", "filter": {"email": "a@x"}}]
+
+
+def test_admin_endpoint_requires_group(monkeypatch):
+    for var in ("COGNITO_JWKS_URL", "JWKS_URL", "COGNITO_USER_POOL_ID", "COGNITO_POOL_ID"):
+        monkeypatch.delenv(var, raising=False)
+    monkeypatch.setenv("ALLOW_INSECURE_JWT", "true")
+
+    def headers(claims):
+        return {"Authorization": "Bearer " + jwt.encode(claims, "test-secret-" + "x" * 32, algorithm="HS256")}
+
+    client = create_app().test_client()
+    assert client.get('/api/admin/slow-queries').status_code == 401
+    assert client.get('/api/admin/slow-queries', headers=headers({"userId": "u1"})).status_code == 403
+    rv = client.get('/api/admin/slow-queries', headers=headers({"userId": "u1", "cognito:groups": ["admin"]}))
+    assert rv.status_code == 200 and rv.get_json()["threshold_ms"] == SLOW_QUERIES.threshold_ms
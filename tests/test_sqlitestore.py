@@ -0,0 +1,52 @@
+import multiprocessing
+from datetime import datetime, timezone
+
+import pytest
+
+from app.utils.memstore import DuplicateIdError
+from app.utils.sqlitestore import SQLiteStore
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "store.sqlite3")
+
+
+def test_documents_round_trip_and_persist(path):
+    store = SQLiteStore(path, "series", indexes=("serie_user", "tags"), text=("serie_title",))
+    now = datetime.now(timezone.utc)
+    store.insert({"_id": "a", "serie_user": "u1", "tags": ["x", "y"], "serie_title": "Bài học Python", "createdAt": now})
+    store.insert({"_id": "b", "serie_user": "u1", "tags": ["y"], "serie_title": "Học máy"})
+    with pytest.raises(DuplicateIdError):
+        store.insert({"_id": "a"})
+    store.update("b", {"serie_user": "u2"}, inc={"n": 2})
+    store.close()
+
+    reopened = SQLiteStore(path, "series", indexes=("serie_user", "tags"), text=("serie_title",))
+    assert reopened.get("a")["createdAt"] == now
+    assert [d["_id"] for d in reopened.find({"serie_user": "u1"})] == ["a"]
+    assert [d["_id"] for d in reopened.find({"tags": "y"}, reverse=True)] == ["b", "a"]
+    assert reopened.get("b")["n"] == 2 and reopened.count({"tags": "y"}) == 2
+    assert [d["_id"] for d in reopened.search("serie_title", "bai hoc")] == ["a", "b"]
+    assert reopened.delete_many({"tags": "y"}) == 2 and len(reopened) == 0
+
+
+def _subscribe_many(path, worker):
+    store = SQLiteStore(path, "subscriptions", indexes=("serie_id",))
+    for i in range(100):
+        store.insert({"_id": f"{worker}-{i}", "serie_id": "s1"})
+        store.upsert("counter", {}, on_insert={"n": 0})
+        store.update("counter", inc={"n": 1})
+
+
+def test_workers_share_one_database(path):
+    ctx = multiprocessing.get_context("spawn")
+    workers = [ctx.Process(target=_subscribe_many, args=(path, w)) for w in range(4)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join(60)
+        assert w.exitcode == 0
+    store = SQLiteStore(path, "subscriptions", indexes=("serie_id",))
+    assert store.count({"serie_id": "s1"}) == 400
+    assert store.get("counter")["n"] == 400
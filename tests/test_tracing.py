@@ -0,0 +1,68 @@
+import json
+from types import SimpleNamespace
+
+import jwt
+import pytest
+from flask import g
+
+from app import create_app
+from app.utils import tracing
+
+
+@pytest.fixture
+def auth_headers(monkeypatch):
+    for var in ("COGNITO_JWKS_URL", "JWKS_URL", "COGNITO_USER_POOL_ID", "COGNITO_POOL_ID"):
+        monkeypatch.delenv(var, raising=False)
+    monkeypatch.setenv("ALLOW_INSECURE_JWT", "true")
+    token = jwt.encode({"userId": "user-1"}, "test-secret-" + "x" * 32, algorithm="HS256")
+    return {"Authorization": f"Bearer {token}"}
+
+
+def test_server_timing_header(monkeypatch, auth_headers):
+    monkeypatch.setenv("SERVER_TIMING", "true")
+    client = create_app().test_client()
+    rv = client.post('/api/series/', json={"serie_title": "Timed"}, headers=auth_headers)
+    timings = {part.split(";")[0] for part in rv.headers["Server-Timing"].split(", ")}
+    assert {"total", "auth", "svc"} <= timings
+    assert "trace" not in timings
+
+    monkeypatch.delenv("SERVER_TIMING")
+    assert "Server-Timing" not in create_app().test_client().get('/health').headers
+
+
+def test_sampled_traces_are_exported(monkeypatch, tmp_path, auth_headers):
+    path = tmp_path / "traces.jsonl"
+    monkeypatch.setenv("TRACE_EXPORT_FILE", str(path))
+    monkeypatch.setenv("TRACE_SAMPLE_RATE", "0")
+    app = create_app()
+    client = app.test_client()
+    client.get('/health')
+    parent = "00-" + "a" * 32 + "-" + "b" * 16 + "-01"
+    client.post('/api/series/', json={"serie_title": "Sampled"}, headers={**auth_headers, "traceparent": parent})
+    app.extensions["tracing"]["exporter"].flush()
+
+    lines = path.read_text().splitlines()
+    assert len(lines) == 1
+    spans = json.loads(lines[0])["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    by_name = {s["name"]: s for s in spans}
+    root = by_name["series.post_serie"]
+    assert root["traceId"] == "a" * 32 and root["parentSpanId"] == "b" * 16 and root["kind"] == tracing.SERVER
+    assert by_name["serie_service.create_serie"]["parentSpanId"] == root["spanId"]
+    assert by_name["auth.verify_bearer"]["parentSpanId"] == root["spanId"]
+
+
+def test_mongo_command_spans():
+    listener = tracing.MongoCommandSpans()
+    started = SimpleNamespace(command_name="find", command={"find": "series"}, connection_id=("db", 1), request_id=7)
+    done = SimpleNamespace(command_name="find", connection_id=("db", 1), request_id=7, duration_micros=1500)
+    listener.started(started)  # no trace outside a request: ignored
+    app = create_app()
+    with app.test_request_context():
+        trace = g.trace = tracing.Trace()
+        with tracing.span("serie_service.get_serie_by_id", "svc") as outer:
+            listener.started(started)
+            listener.succeeded(done)
+        (_, mongo) = trace.spans
+        assert mongo.name == "mongo.find series" and mongo.parent_id == outer.span_id
+        assert mongo.duration == pytest.approx(0.0015)
+        assert tracing.server_timing(trace).startswith("svc;dur=")
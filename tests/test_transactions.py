@@ -0,0 +1,91 @@
+"""Multi-document consistency of subscribe / lesson create / delete.
+
+The transactional tests need a replica set; start a local single-node one with
+
+    mongod --replSet rs0 --dbpath /tmp/rs0 --port 27018 &
+    mongosh --port 27018 --eval 'rs.initiate()'
+    MONGODB_REPLSET_URI=mongodb://localhost:27018/?replicaSet=rs0 pytest tests/test_transactions.py
+"""
+import os
+import uuid
+
+import bson
+import pytest
+
+from app import repositories
+from app.services import lesson_service, serie_service
+from app.utils.mongodb import ensure_indexes, run_in_transaction, supports_transactions
+
+
+@pytest.fixture
+def replset_db():
+    uri = os.environ.get("MONGODB_REPLSET_URI")
+    if not uri:
+        pytest.skip("MONGODB_REPLSET_URI not set")
+    from pymongo import MongoClient
+
+    client = MongoClient(uri)
+    db = client[f"test_tx_{uuid.uuid4().hex[:12]}"]
+    # creates the collections too, which older servers refuse inside a transaction
+    ensure_indexes(db)
+    previous = repositories.use(repositories.build(db))
+    yield db
+    repositories.use(previous)
+    client.drop_database(db.name)
+    client.close()
+
+
+def test_fallback_without_replica_set(counted_db):
+    db, _ = counted_db
+    assert supports_transactions(db) is False
+    assert run_in_transaction(db, lambda session: session) is None
+
+
+def test_subscribe_missing_serie_leaves_no_subscription(counted_db):
+    db, _ = counted_db
+    with pytest.raises(ValueError):
+        serie_service.subscribe_serie(str(bson.ObjectId()), "u1", "u1@example.com")
+    assert db.get_collection("subscriptions").count_documents({}) == 0
+
+
+def test_unsubscribe_sns_failure_keeps_subscription(counted_db, monkeypatch):
+    serie = serie_service.create_serie({"serie_title": "A"}, "u1")
+    serie_service.subscribe_serie(serie["_id"], "u2", "u2@example.com")
+
+    def fail(topic, email):
+        raise RuntimeError("SNS unavailable")
+
+    monkeypatch.setattr(serie_service, "unsubscribe_from_topic", fail)
+    with pytest.raises(RuntimeError):
+        serie_service.unsubscribe_serie(serie["_id"], "u2", "u2@example.com")
+    # still on the topic, so still subscribed: a retry can unsubscribe
+    assert [s["user_id"] for s in serie_service.get_serie_subscribers(serie["_id"])] == ["u2"]
+    assert serie_service.get_serie_by_id(serie["_id"])["serie_subcribe_num"] == 1
+
+
+def test_lesson_insert_failure_rolls_back_serie_push(replset_db, monkeypatch):
+    assert supports_transactions(replset_db)
+    serie = serie_service.create_serie({"serie_title": "A"}, "u1")
+    taken = bson.ObjectId()
+    replset_db.lessons.insert_one({"_id": taken, "lesson_serie": serie["_id"]})
+
+    real = bson.ObjectId
+
+    class _FixedId(real):
+        def __new__(cls, oid=None):
+            return real(taken) if oid is None else real(oid)
+
+    monkeypatch.setattr(bson, "ObjectId", _FixedId)
+    with pytest.raises(Exception):
+        lesson_service.create_lesson({"lesson_title": "L", "lesson_serie": serie["_id"]}, "u1")
+    assert replset_db.series.find_one({"_id": real(serie["_id"])})["serie_lessons"] == []
+
+
+def test_subscribe_counter_matches_subscriptions(replset_db):
+    serie = serie_service.create_serie({"serie_title": "A"}, "u1")
+    for i in range(5):
+        serie_service.subscribe_serie(serie["_id"], f"u{i}", f"u{i}@example.com")
+    serie_service.subscribe_serie(serie["_id"], "u0", "u0@example.com")
+    serie_service.unsubscribe_serie(serie["_id"], "u1", "u1@example.com")
+    doc = replset_db.series.find_one({"_id": bson.ObjectId(serie["_id"])})
+    assert doc["serie_subcribe_num"] == replset_db.subscriptions.count_documents({"serie_id": doc["_id"]}) == 4